@@ -0,0 +1,122 @@
+"""
+Response compression — GZip/Brotli middleware with a size threshold.
+
+Complete (non-streaming) responses at least RESPONSE_COMPRESSION_MIN_BYTES
+long are compressed with the client's preferred encoding from
+RESPONSE_COMPRESSION (default "br,gzip"; Brotli only if the `brotli`
+package is installed). Streaming responses such as the plan-edit SSE stream
+pass through untouched so tokens are flushed as they arrive.
+"""
+
+import gzip
+import os
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "br,gzip")
+RESPONSE_COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Bodies larger than this are compressed off the event loop
+THREAD_MIN_BYTES = 128 * 1024
+
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "audio/", "video/", "application/zip", "application/gzip")
+
+
+def available_encodings(configured: str = RESPONSE_COMPRESSION):
+    """Return the configured encodings this process can actually produce, in preference order."""
+    encodings = []
+    for name in (e.strip().lower() for e in configured.split(",")):
+        if name == "gzip" or (name == "br" and brotli is not None):
+            encodings.append(name)
+    return encodings
+
+
+def choose_encoding(accept_encoding: str, encodings):
+    """Pick the first of `encodings` the client accepts (q > 0), or None."""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip()] = q
+
+    for name in encodings:
+        if accepted.get(name, accepted.get("*", 0)) > 0:
+            return name
+    return None
+
+
+def compress(body: bytes, encoding: str):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing complete responses above a size threshold."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = RESPONSE_COMPRESSION_MIN_BYTES,
+                 encodings: str = RESPONSE_COMPRESSION):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings(encodings)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+
+        async def send_compressed(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Hold the headers until the body shows whether to compress
+                start = message
+                return
+            if start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            content_type = headers.get("content-type", "")
+            if (message.get("more_body", False)
+                    or "content-encoding" in headers
+                    or len(body) < self.minimum_size
+                    or any(content_type.startswith(t) for t in EXCLUDED_CONTENT_TYPES)):
+                await send(start)
+                start = None
+                await send(message)
+                return
+
+            if len(body) >= THREAD_MIN_BYTES:
+                compressed = await anyio.to_thread.run_sync(compress, body, encoding)
+            else:
+                compressed = compress(body, encoding)
+
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(compressed))
+            headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            start = None
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,18 +1,152 @@
 """
 Database configuration — SQLAlchemy engine, session, and base model.
+
+The engine URL comes from DATABASE_URL (default: a local SQLite file), so the
+same code can point at a server database. SQLite connections are tuned for
+concurrent sync writes and API reads: WAL journaling, synchronous=NORMAL,
+a larger page cache, memory-mapped I/O and a busy timeout instead of
+immediate "database is locked" errors. Pool sizing is configurable.
+
+Async handlers use `get_async_db`, an AsyncSession on the same database via
+its asyncio driver (aiosqlite, or asyncpg for PostgreSQL), so waiting on the
+database doesn't hold a threadpool thread. Existing sync query helpers run
+inside it with `AsyncSession.run_sync`.
+
+Side-effect-free GET endpoints use `get_read_db`, bound to DATABASE_READ_URL
+(a read replica) when set, otherwise to a read-only connection pool on the
+primary database.
 """
 
-from sqlalchemy import create_engine
+import os
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL") or SQLALCHEMY_DATABASE_URL
+
+# Sync URL scheme -> SQLAlchemy asyncio driver
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))  # 64 MB
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+def _is_sqlite(url: str):
+    return url.startswith("sqlite")
+
+
+def _is_sqlite_memory(url: str):
+    return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def _apply_sqlite_pragmas(sqlite_engine, url: str, read_only: bool = False):
+    """Tune every new SQLite connection of a (sync) engine."""
+    @event.listens_for(sqlite_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        if not _is_sqlite_memory(url):
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL, read_only: bool = False):
+    """
+    Create an engine for `url` using the production profile for its backend.
+    With read_only, every connection refuses writes.
+    """
+    if not _is_sqlite(url):
+        connect_args = {}
+        if read_only and url.startswith("postgresql"):
+            connect_args["options"] = "-c default_transaction_read_only=on"
+        return create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+
+    # The sqlite3 driver's own lock timeout, in seconds, mirrors busy_timeout
+    connect_args = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if _is_sqlite_memory(url):
+        sqlite_engine = create_engine(url, connect_args=connect_args)
+    else:
+        sqlite_engine = create_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+    _apply_sqlite_pragmas(sqlite_engine, url, read_only)
+    return sqlite_engine
+
+
+def async_url(url: str):
+    """Map a sync database URL to the same database on its asyncio driver."""
+    scheme, sep, rest = url.partition("://")
+    return ASYNC_DRIVERS.get(scheme.split("+")[0], scheme) + sep + rest
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+
+def build_async_engine(url: str):
+    """Create an AsyncEngine for `url` with the same production profile as build_engine."""
+    if not _is_sqlite(url):
+        return create_async_engine(
+            url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_pre_ping=True,
+        )
+
+    connect_args = {"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000}
+    if _is_sqlite_memory(url):
+        sqlite_engine = create_async_engine(url, connect_args=connect_args)
+    else:
+        sqlite_engine = create_async_engine(
+            url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+    _apply_sqlite_pragmas(sqlite_engine.sync_engine, url)
+    return sqlite_engine
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or async_url(SQLALCHEMY_DATABASE_URL)
+
+engine = build_engine()
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if _is_sqlite_memory(DATABASE_READ_URL):
+    # A second in-memory engine would be a different, empty database
+    read_engine = engine
+else:
+    read_engine = build_engine(DATABASE_READ_URL, read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine = build_async_engine(ASYNC_DATABASE_URL)
+# Objects stay usable after commit without an implicit (sync) refresh
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -23,3 +157,18 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_read_db():
+    """Yield a read-only database session for side-effect-free endpoints."""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def get_async_db():
+    """Yield an AsyncSession, ensuring it is closed after use."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,17 +1,39 @@
 """
 FastAPI application entry point.
 
-Configures CORS, registers routers, and creates database tables on startup.
+Configures CORS and response compression, renders JSON with orjson by
+default, registers routers, and runs the background sync scheduler and schedule
+materialization for the lifetime of the app. Shared HTTP clients and the async database engine are
+closed on shutdown.
+The database schema is managed separately by `python -m app.migrations`.
 """
 
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth, data, coach, schedule
-from .database import engine, Base
+from .compression import CompressionMiddleware
+from .database import async_engine
+from .responses import FastJSONResponse
+from .routers import analytics, auth, data, coach, schedule
+from .services import http_client, sync_scheduler
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Personal AI Trainer")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the background sync scheduler and schedule materialization on startup and stop them on shutdown."""
+    if os.getenv("SYNC_SCHEDULER_ENABLED", "1") == "1":
+        sync_scheduler.start()
+    sync_scheduler.start_materializer()
+    yield
+    await sync_scheduler.stop()
+    await http_client.aclose()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="Personal AI Trainer", lifespan=lifespan, default_response_class=FastJSONResponse)
+
+app.add_middleware(CompressionMiddleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +49,7 @@ app.add_middleware(
 
 app.include_router(auth.router, prefix="/auth", tags=["Auth"])
 app.include_router(data.router, prefix="/data", tags=["Data"])
+app.include_router(analytics.router, prefix="/data/analytics", tags=["Analytics"])
 app.include_router(coach.router, prefix="/coach", tags=["Coach"])
 app.include_router(schedule.router, prefix="/schedule", tags=["Schedule"])
 
@@ -0,0 +1,235 @@
+"""
+Schema migrations — ordered, versioned upgrade steps for the database.
+
+`Base.metadata.create_all` only creates missing tables, so new columns and
+indexes never reach an existing database. Each step here is recorded in the
+`schema_migrations` table once applied, and steps are written to be safe to
+re-run. Indexes are built online where the backend supports it
+(`CREATE INDEX CONCURRENTLY` on PostgreSQL; SQLite in WAL mode keeps serving
+readers during the build).
+
+Steps never call service code, which tracks the current models and would
+break on databases a few versions behind. Derived tables are rebuilt once
+all pending steps have run, when the schema matches the code (see
+REBUILDS_ROLLUPS).
+
+Run once per deploy, not from every API worker:
+
+    python -m app.migrations           # apply pending migrations
+    python -m app.migrations --status  # list applied and pending versions
+"""
+
+import json
+import sys
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .database import Base, engine as default_engine
+from .models import StravaActivity, WhoopRecovery, WhoopWorkout, WorkoutBlock, User, ResourceVersion, UserSession, DailyRollup
+from .services import rollups
+
+VERSION_TABLE = "schema_migrations"
+
+
+# --- Helpers ---
+
+def add_column_if_missing(engine: Engine, model, column_name: str):
+    """Add a model's column to an existing table if the database doesn't have it yet."""
+    table = model.__table__
+    existing = {col["name"] for col in inspect(engine).get_columns(table.name)}
+    if column_name in existing:
+        return
+
+    column = table.columns[column_name]
+    col_type = column.type.compile(dialect=engine.dialect)
+    with engine.begin() as conn:
+        conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column_name}" {col_type}'))
+
+
+def create_index_online(engine: Engine, index):
+    """Create an index if it is missing, without blocking writes where the backend allows it."""
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as conn:
+            index.create(conn, checkfirst=True)
+        return
+
+    columns = ", ".join(f'"{col.name}"' for col in index.columns)
+    unique = "UNIQUE " if index.unique else ""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text(
+            f"CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS {index.name} "
+            f"ON {index.table.name} ({columns})"
+        ))
+
+
+# --- Steps ---
+
+def create_tables(engine: Engine):
+    """Create any missing tables from the current models."""
+    Base.metadata.create_all(bind=engine)
+
+
+def add_sync_watermark_columns(engine: Engine):
+    """Add the background-sync and incremental-pull watermarks to users."""
+    for name in ("last_synced_at", "last_sync_status", "strava_synced_until", "whoop_synced_until"):
+        add_column_if_missing(engine, User, name)
+
+
+def upgrade_time_window_indexes(engine: Engine):
+    """
+    Add the composite (user_id, <time>) indexes used by the dashboard's
+    per-user time-window queries, enforce one workout block per user per day,
+    and convert YYYY-MM-DD string columns to native DATE on server databases.
+    """
+    with engine.begin() as conn:
+        # Keep the most recently created block for any duplicated day
+        conn.execute(text(
+            "DELETE FROM workout_blocks WHERE id NOT IN "
+            "(SELECT MAX(id) FROM workout_blocks GROUP BY user_id, date)"
+        ))
+
+        if conn.dialect.name == "postgresql":
+            # SQLite already stores SQLAlchemy Date values as YYYY-MM-DD text
+            for table in ("workout_blocks", "whoop_recoveries"):
+                conn.execute(text(
+                    f"ALTER TABLE {table} ALTER COLUMN date TYPE DATE USING date::date"
+                ))
+
+    for model in (StravaActivity, WhoopRecovery, WhoopWorkout, WorkoutBlock):
+        for index in model.__table__.indexes:
+            create_index_online(engine, index)
+
+
+def create_resource_versions(engine: Engine):
+    """Add the per-user resource version table behind conditional GETs."""
+    ResourceVersion.__table__.create(engine, checkfirst=True)
+
+
+def create_user_sessions(engine: Engine):
+    """Add login sessions and the provider account ids that identify users at OAuth login."""
+    for name in ("strava_athlete_id", "whoop_user_id"):
+        add_column_if_missing(engine, User, name)
+    for index in User.__table__.indexes:
+        if {col.name for col in index.columns} & {"strava_athlete_id", "whoop_user_id"}:
+            create_index_online(engine, index)
+    UserSession.__table__.create(engine, checkfirst=True)
+
+
+def create_daily_rollups(engine: Engine):
+    """Add the per-user daily rollup table (backfilled from synced history, see REBUILDS_ROLLUPS)."""
+    DailyRollup.__table__.create(engine, checkfirst=True)
+
+
+# WHOOP v2 zone_durations keys as of migration 7, zone 0 through zone 5
+_WHOOP_ZONE_KEYS = (
+    "zone_zero_milli", "zone_one_milli", "zone_two_milli",
+    "zone_three_milli", "zone_four_milli", "zone_five_milli",
+)
+
+
+def add_workout_zone_columns(engine: Engine):
+    """Add per-zone duration columns to WHOOP workouts and backfill them from the stored JSON."""
+    columns = [f"zone{zone}_milli" for zone in range(len(_WHOOP_ZONE_KEYS))]
+    for name in columns:
+        add_column_if_missing(engine, WhoopWorkout, name)
+
+    with engine.begin() as conn:
+        pending = conn.execute(text(
+            "SELECT id, zone_durations FROM whoop_workouts "
+            "WHERE zone_durations IS NOT NULL AND zone0_milli IS NULL"
+        )).all()
+        rows = []
+        for workout_id, durations in pending:
+            durations = json.loads(durations) if isinstance(durations, str) else durations
+            if durations:
+                rows.append({"id": workout_id, **{
+                    name: int(durations.get(key) or 0) for name, key in zip(columns, _WHOOP_ZONE_KEYS)
+                }})
+        if rows:
+            assignments = ", ".join(f"{name} = :{name}" for name in columns)
+            conn.execute(text(f"UPDATE whoop_workouts SET {assignments} WHERE id = :id"), rows)
+
+
+# Ordered list of (version, name, step). Append new steps; never renumber.
+MIGRATIONS = [
+    (1, "create_tables", create_tables),
+    (2, "add_sync_watermark_columns", add_sync_watermark_columns),
+    (3, "time_window_indexes", upgrade_time_window_indexes),
+    (4, "resource_versions", create_resource_versions),
+    (5, "user_sessions", create_user_sessions),
+    (6, "daily_rollups", create_daily_rollups),
+    (7, "workout_zone_columns", add_workout_zone_columns),
+]
+
+# Versions that change what daily_rollups is computed from. If any of them is
+# applied, rollups are rebuilt once after the last pending step.
+REBUILDS_ROLLUPS = {6, 7}
+
+
+# --- Runner ---
+
+def _ensure_version_table(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} ("
+            "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def applied_versions(engine: Engine = default_engine):
+    """Return the set of migration versions already applied."""
+    _ensure_version_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(f"SELECT version FROM {VERSION_TABLE}"))}
+
+
+def pending_migrations(engine: Engine = default_engine):
+    """Return the (version, name, step) tuples not yet applied, in order."""
+    applied = applied_versions(engine)
+    return [m for m in MIGRATIONS if m[0] not in applied]
+
+
+def _rebuild_rollups(engine: Engine):
+    print("Rebuilding daily rollups...")
+    with Session(engine) as db:
+        rollups.rebuild_all(db)
+        db.commit()
+
+
+def run_migrations(engine: Engine = default_engine):
+    """
+    Apply every pending migration in version order, then rebuild derived
+    tables if a step requires it. Returns the versions applied.
+    """
+    applied = []
+    for version, name, step in pending_migrations(engine):
+        print(f"Applying migration {version:04d} {name}...")
+        step(engine)
+        with engine.begin() as conn:
+            conn.execute(
+                text(f"INSERT INTO {VERSION_TABLE} (version, name, applied_at) VALUES (:v, :n, :t)"),
+                {"v": version, "n": name, "t": datetime.utcnow()}
+            )
+        applied.append(version)
+
+    if REBUILDS_ROLLUPS & set(applied):
+        _rebuild_rollups(engine)
+    return applied
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if "--status" in argv:
+        done = applied_versions()
+        for version, name, _ in MIGRATIONS:
+            state = "applied" if version in done else "pending"
+            print(f"{version:04d} {name}: {state}")
+        return
+
+    applied = run_migrations()
+    print(f"Applied {len(applied)} migration(s)." if applied else "Database is up to date.")
+
+
+if __name__ == "__main__":
+    main()
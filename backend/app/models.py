@@ -2,10 +2,11 @@
 Database models for the Personal Trainer application.
 
 All models use SQLAlchemy ORM with SQLite backend. Heights are stored in cm,
-weights in kg, and dates as YYYY-MM-DD strings or DateTime objects.
+weights in kg, calendar days as Date and timestamps as DateTime. Tables read
+by per-user time windows carry a composite (user_id, <time>) index.
 """
 
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, Text, JSON
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, Date, DateTime, Text, JSON, Index
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -17,6 +18,9 @@ class User(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True)
+    # Provider account ids identify a returning user at OAuth login
+    strava_athlete_id = Column(Integer, unique=True, index=True, nullable=True)
+    whoop_user_id = Column(Integer, unique=True, index=True, nullable=True)
 
     # Profile
     name = Column(String, nullable=True)
@@ -31,15 +35,21 @@ class User(Base):
     strava_access_token = Column(String, nullable=True)
     strava_refresh_token = Column(String, nullable=True)
     strava_expires_at = Column(Integer, nullable=True)
+    strava_synced_until = Column(Integer, nullable=True)  # epoch of latest synced activity start
     whoop_access_token = Column(String, nullable=True)
     whoop_refresh_token = Column(String, nullable=True)
     whoop_expires_at = Column(Integer, nullable=True)
+    whoop_synced_until = Column(DateTime, nullable=True)  # start of the last successful WHOOP pull
 
     # Cached daily plan (rolling 2-day window)
     plan_today = Column(JSON, nullable=True)
     plan_tomorrow = Column(JSON, nullable=True)
     last_plan_date = Column(String, nullable=True)
 
+    # Background sync watermark
+    last_synced_at = Column(DateTime, nullable=True)
+    last_sync_status = Column(JSON, nullable=True)
+
     # Relationships
     activities = relationship("StravaActivity", back_populates="user")
     recoveries = relationship("WhoopRecovery", back_populates="user")
@@ -47,6 +57,7 @@ class User(Base):
     goals = relationship("Goal", back_populates="user")
     workout_blocks = relationship("WorkoutBlock", back_populates="user")
     whoop_workouts = relationship("WhoopWorkout", back_populates="user")
+    sessions = relationship("UserSession", back_populates="user")
 
 
 class Goal(Base):
@@ -83,6 +94,10 @@ class StravaActivity(Base):
 
     user = relationship("User", back_populates="activities")
 
+    __table_args__ = (
+        Index("ix_strava_activities_user_start", "user_id", "start_date"),
+    )
+
 
 class WhoopRecovery(Base):
     """Synced recovery score from the WHOOP API."""
@@ -91,7 +106,7 @@ class WhoopRecovery(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     whoop_id = Column(String, unique=True, index=True)
-    date = Column(String)  # YYYY-MM-DD
+    date = Column(Date)
     recovery_score = Column(Integer)
     resting_heart_rate = Column(Integer)
     hrv = Column(Integer)
@@ -99,6 +114,10 @@ class WhoopRecovery(Base):
 
     user = relationship("User", back_populates="recoveries")
 
+    __table_args__ = (
+        Index("ix_whoop_recoveries_user_date", "user_id", "date"),
+    )
+
 
 class TrainingPlan(Base):
     """AI-generated training plan for a date range."""
@@ -120,7 +139,7 @@ class WorkoutBlock(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
-    date = Column(String)  # YYYY-MM-DD
+    date = Column(Date)
     type = Column(String)  # Gym, Running, Ultimate, Recovery, Rest, etc.
     planned_duration_minutes = Column(Integer)
     notes = Column(Text, nullable=True)
@@ -128,6 +147,11 @@ class WorkoutBlock(Base):
 
     user = relationship("User", back_populates="workout_blocks")
 
+    __table_args__ = (
+        # One block per user per day; also serves (user_id, date) range scans
+        Index("uq_workout_blocks_user_date", "user_id", "date", unique=True),
+    )
+
 
 class WhoopWorkout(Base):
     """Synced workout data from the WHOOP API."""
@@ -144,6 +168,92 @@ class WhoopWorkout(Base):
     average_heart_rate = Column(Integer)
     max_heart_rate = Column(Integer)
     kilojoules = Column(Float)
+    # Raw WHOOP zone_durations payload; no longer written, superseded by the zone columns
     zone_durations = Column(JSON, nullable=True)
+    # Milliseconds per heart rate zone (% of max HR): 0 below 50%, 1 50-60%,
+    # 2 60-70%, 3 70-80%, 4 80-90%, 5 90-100%; null until WHOOP scores the workout
+    zone0_milli = Column(Integer, nullable=True)
+    zone1_milli = Column(Integer, nullable=True)
+    zone2_milli = Column(Integer, nullable=True)
+    zone3_milli = Column(Integer, nullable=True)
+    zone4_milli = Column(Integer, nullable=True)
+    zone5_milli = Column(Integer, nullable=True)
 
     user = relationship("User", back_populates="whoop_workouts")
+
+    __table_args__ = (
+        Index("ix_whoop_workouts_user_start", "user_id", "start"),
+    )
+
+
+class LLMCacheEntry(Base):
+    """Cached chat completion, keyed by a hash of the model and normalized prompt."""
+    __tablename__ = "llm_cache"
+
+    key = Column(String, primary_key=True)  # sha256 hex digest
+    model = Column(String)
+    response = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    last_used_at = Column(DateTime, default=datetime.utcnow, index=True)
+    hits = Column(Integer, default=0)
+
+
+class ResourceVersion(Base):
+    """Per-user change counter for a cacheable API resource (profile, goals, schedule)."""
+    __tablename__ = "resource_versions"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    resource = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class DailyRollup(Base):
+    """
+    Per-user daily totals of synced activities, workouts and recovery,
+    maintained at ingestion (see services/rollups). Days are the athlete's
+    local calendar days.
+    """
+    __tablename__ = "daily_rollups"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+
+    # Strava activities
+    activity_count = Column(Integer, default=0)
+    distance = Column(Float, default=0)  # meters
+    moving_time = Column(Integer, default=0)  # seconds
+    elevation_gain = Column(Float, default=0)  # meters
+    suffer_score = Column(Integer, nullable=True)  # summed Relative Effort
+
+    # WHOOP workouts
+    workout_count = Column(Integer, default=0)
+    strain = Column(Float, nullable=True)  # highest workout strain (strain is not additive)
+    kilojoules = Column(Float, nullable=True)
+    zone0_minutes = Column(Float, default=0)
+    zone1_minutes = Column(Float, default=0)
+    zone2_minutes = Column(Float, default=0)
+    zone3_minutes = Column(Float, default=0)
+    zone4_minutes = Column(Float, default=0)
+    zone5_minutes = Column(Float, default=0)
+
+    # Combined daily training load (see services/training_load)
+    training_load = Column(Float, default=0)
+
+    # WHOOP recovery
+    recovery_score = Column(Integer, nullable=True)
+    hrv = Column(Integer, nullable=True)
+    resting_heart_rate = Column(Integer, nullable=True)
+    sleep_performance = Column(Integer, nullable=True)
+
+
+class UserSession(Base):
+    """Login session. The client holds the token; only its SHA-256 digest is stored."""
+    __tablename__ = "user_sessions"
+
+    token_hash = Column(String, primary_key=True)  # sha256 hex digest
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+
+    user = relationship("User", back_populates="sessions")
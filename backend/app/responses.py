@@ -0,0 +1,34 @@
+"""
+Response classes — the app's default JSON response.
+
+Routes with a response_model are already serialized to bytes by Pydantic.
+Everything else (plan payloads, sync summaries, conditional GET bodies)
+goes through FastJSONResponse, which renders with orjson when it is
+installed and falls back to compact stdlib json otherwise.
+"""
+
+import json
+from typing import Any
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+# Non-str dict keys (e.g. weekday ints) and numpy arrays serialize like stdlib json would
+ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def dumps(content: Any):
+    """Serialize JSON-compatible content to compact UTF-8 bytes."""
+    if orjson is not None:
+        return orjson.dumps(content, option=ORJSON_OPTIONS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when available."""
+
+    def render(self, content: Any):
+        return dumps(content)
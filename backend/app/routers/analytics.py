@@ -0,0 +1,128 @@
+"""
+Analytics Router — long-range training and recovery trends.
+
+Weekly volume, HRV/resting HR trends, recovery distributions, sport mix and
+heart rate intensity distribution (80/20 polarization) over any date range
+(default: the last year). Queries run on the user's columnar history
+snapshot (see services.analytics) and support conditional requests keyed by
+the user's history version.
+"""
+
+from datetime import date, datetime, timedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..database import get_async_db
+from ..models import User
+from ..services import analytics, http_cache, resource_versions
+from .auth import get_current_user_async
+
+router = APIRouter()
+
+DEFAULT_RANGE_DAYS = 365
+MAX_RANGE_DAYS = 20 * 366
+
+
+def _resolve_range(start_date: date, end_date: date):
+    end = end_date or datetime.now().date()
+    start = start_date or end - timedelta(days=DEFAULT_RANGE_DAYS - 1)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start_date must be on or before end_date")
+    if (end - start).days >= MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_RANGE_DAYS} days")
+    return start, end
+
+
+async def _respond(request: Request, db: AsyncSession, user: User, query, start: date, end: date, variant: str = ""):
+    """Run `query(snapshot, start, end)` on the user's snapshot, answering 304 when unchanged."""
+    def respond(session: Session):
+        return http_cache.conditional_json(
+            request, session, user.id, resource_versions.HISTORY,
+            lambda: {
+                "start_date": start.isoformat(),
+                "end_date": end.isoformat(),
+                **query(analytics.get_snapshot(session, user.id), start, end),
+            },
+            variant=f"{start}:{end}:{variant}"
+        )
+
+    return await db.run_sync(respond)
+
+
+@router.get("/weekly-volume")
+async def get_weekly_volume(
+    request: Request,
+    start_date: date = None,
+    end_date: date = None,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Weekly (Monday-start) activity count, distance, time, elevation and training load."""
+    start, end = _resolve_range(start_date, end_date)
+    return await _respond(
+        request, db, user,
+        lambda snapshot, s, e: {"weeks": analytics.weekly_volume(snapshot, s, e)},
+        start, end
+    )
+
+
+@router.get("/hrv-trend")
+async def get_hrv_trend(
+    request: Request,
+    start_date: date = None,
+    end_date: date = None,
+    window: int = Query(7, ge=1, le=90),
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Daily HRV and resting heart rate with trailing `window`-day averages."""
+    start, end = _resolve_range(start_date, end_date)
+    return await _respond(
+        request, db, user,
+        lambda snapshot, s, e: analytics.hrv_trend(snapshot, s, e, window),
+        start, end, variant=str(window)
+    )
+
+
+@router.get("/recovery-distribution")
+async def get_recovery_distribution(
+    request: Request,
+    start_date: date = None,
+    end_date: date = None,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Recovery score zones, histogram and percentiles, plus sleep performance percentiles."""
+    start, end = _resolve_range(start_date, end_date)
+    return await _respond(request, db, user, analytics.recovery_distribution, start, end)
+
+
+@router.get("/sport-mix")
+async def get_sport_mix(
+    request: Request,
+    start_date: date = None,
+    end_date: date = None,
+    source: str = Query("strava", pattern="^(strava|whoop)$"),
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Sessions, time and time share per sport from Strava activities or WHOOP workouts."""
+    start, end = _resolve_range(start_date, end_date)
+    return await _respond(
+        request, db, user,
+        lambda snapshot, s, e: analytics.sport_mix(snapshot, s, e, source),
+        start, end, variant=source
+    )
+
+
+@router.get("/intensity-distribution")
+async def get_intensity_distribution(
+    request: Request,
+    start_date: date = None,
+    end_date: date = None,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Weekly time in WHOOP heart rate zones, low/moderate/high split, 80/20 ratio and polarization."""
+    start, end = _resolve_range(start_date, end_date)
+    return await _respond(request, db, user, analytics.intensity_distribution, start, end)
@@ -2,17 +2,21 @@
 Auth Router — User authentication and OAuth integrations.
 
 Provides user profile management, Strava OAuth, and WHOOP OAuth flows.
-Uses a simplified single-user auth model (first user in DB).
+Each request is authenticated by its session token (see user_sessions);
+connecting Strava or WHOOP signs the browser in, matching returning users by
+their provider account id.
 """
 
 import os
-import requests
-from fastapi import APIRouter, Depends, HTTPException, Request
+import time
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import RedirectResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ..database import get_db
+from ..database import get_async_db, get_db
 from ..models import User
 from ..schemas import User as UserSchema, UserUpdate
+from ..services import context_cache, http_cache, http_client, resource_versions, schedule_builder, user_sessions, whoop_client
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -23,20 +27,94 @@ WHOOP_CLIENT_ID = os.getenv("WHOOP_CLIENT_ID")
 WHOOP_CLIENT_SECRET = os.getenv("WHOOP_CLIENT_SECRET")
 STRAVA_CLIENT_ID = os.getenv("STRAVA_CLIENT_ID")
 STRAVA_CLIENT_SECRET = os.getenv("STRAVA_CLIENT_SECRET")
+# Comma-separated user ids allowed to run process-wide maintenance (e.g. clearing the LLM cache)
+ADMIN_USER_IDS = {int(i) for i in os.getenv("ADMIN_USER_IDS", "").split(",") if i.strip()}
 
 
-def get_current_user(db: Session = Depends(get_db)):
-    """Return the current user. Uses simplified single-user model."""
-    user = db.query(User).first()
+def get_current_user(request: Request, db: Session = Depends(get_db)):
+    """Return the user owning the request's session token, attached to the request's session."""
+    user = user_sessions.resolve_user(db, user_sessions.token_from_request(request))
     if not user:
-        raise HTTPException(status_code=401, detail="No authenticated user found")
+        raise HTTPException(status_code=401, detail="Not authenticated")
     return user
 
 
+async def get_current_user_async(request: Request, db: AsyncSession = Depends(get_async_db)):
+    """Async counterpart of get_current_user, bound to the request's AsyncSession."""
+    user = await user_sessions.aresolve_user(db, user_sessions.token_from_request(request))
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+
+def get_admin_user(user: User = Depends(get_current_user)):
+    """Return the current user if listed in ADMIN_USER_IDS, else raise 403."""
+    if user.id not in ADMIN_USER_IDS:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
+
+
+def _legacy_user(db: Session):
+    """
+    Return the account from before session sign-in (the first user, with no
+    provider account linked yet), or None. Its first OAuth login adopts it
+    instead of creating an empty user beside its history.
+    """
+    user = db.query(User).order_by(User.id).first()
+    if user is not None and user.strava_athlete_id is None and user.whoop_user_id is None:
+        return user
+    return None
+
+
+def _login_user(request: Request, db: Session, provider_column, provider_id):
+    """
+    Resolve the user an OAuth callback belongs to: the user already linked to
+    this provider account, else the signed-in user, else the unlinked legacy
+    user, else a new user. Missing workout blocks through the materialization
+    horizon are filled, so a new user's first plans follow their schedule.
+    Returns (user, token), where token is a new session token to set as the
+    cookie, or None if the browser is already signed in as that user.
+    Raises 502 if the provider didn't identify the account, rather than
+    creating an orphaned user.
+    """
+    if provider_id is None:
+        raise HTTPException(status_code=502, detail="Provider did not return an account id")
+
+    current = user_sessions.resolve_user(db, user_sessions.token_from_request(request))
+    user = db.query(User).filter(provider_column == provider_id).first()
+    if user is None:
+        user = current
+    if user is None:
+        user = _legacy_user(db)
+    if user is None:
+        user = User()
+        db.add(user)
+        db.flush()
+    schedule_builder.ensure_horizon(db, user)
+
+    if current is not None and current.id == user.id:
+        return user, None
+    return user, user_sessions.create(db, user.id)
+
+
+def _signed_in_redirect(url: str, token: str = None):
+    response = RedirectResponse(url)
+    if token:
+        user_sessions.set_cookie(response, token)
+    return response
+
+
 @router.get("/user", response_model=UserSchema)
-def get_user_profile(current_user: User = Depends(get_current_user)):
-    """Return the current user's profile."""
-    return current_user
+def get_user_profile(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Return the current user's profile. Supports conditional requests."""
+    return http_cache.conditional_json(
+        request, db, current_user.id, resource_versions.PROFILE,
+        lambda: UserSchema.model_validate(current_user)
+    )
 
 
 @router.put("/user/settings", response_model=UserSchema)
@@ -52,13 +130,28 @@ def update_user_settings(
     if settings.height is not None: current_user.height = settings.height
     if settings.weight is not None: current_user.weight = settings.weight
     if settings.openai_model is not None: current_user.openai_model = settings.openai_model
-    if settings.settings is not None: current_user.settings = settings.settings
+    if settings.settings is not None:
+        current_user.settings = settings.settings
+        schedule_builder.ensure_horizon(db, current_user)
+    resource_versions.bump(db, current_user.id, resource_versions.PROFILE)
 
     db.commit()
+    context_cache.invalidate(current_user.id)
     db.refresh(current_user)
     return current_user
 
 
+@router.post("/logout")
+def logout(request: Request, response: Response, db: Session = Depends(get_db)):
+    """End the current session and clear the session cookie."""
+    token = user_sessions.token_from_request(request)
+    if token:
+        user_sessions.revoke(db, token)
+        db.commit()
+    user_sessions.clear_cookie(response)
+    return {"message": "Logged out"}
+
+
 # --- Strava OAuth ---
 
 @router.get("/strava/login")
@@ -78,7 +171,7 @@ def strava_login():
 
 
 @router.get("/strava/callback")
-def strava_callback(code: str, db: Session = Depends(get_db)):
+def strava_callback(request: Request, code: str, db: Session = Depends(get_db)):
     """Handle Strava OAuth callback — exchange code for access token."""
     token_url = "https://www.strava.com/oauth/token"
     payload = {
@@ -88,26 +181,23 @@ def strava_callback(code: str, db: Session = Depends(get_db)):
         "grant_type": "authorization_code",
     }
 
-    response = requests.post(token_url, data=payload)
+    response = http_client.post(token_url, data=payload)
     if response.status_code != 200:
         raise HTTPException(status_code=400, detail="Failed to retrieve Strava token")
 
     data = response.json()
+    athlete_id = (data.get("athlete") or {}).get("id")
+    user, token = _login_user(request, db, User.strava_athlete_id, athlete_id)
 
-    user = db.query(User).first()
-    if not user:
-        user = User(email="user@example.com")
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-
+    user.strava_athlete_id = athlete_id
     user.strava_access_token = data["access_token"]
     user.strava_refresh_token = data["refresh_token"]
     user.strava_expires_at = data["expires_at"]
+    resource_versions.bump(db, user.id, resource_versions.PROFILE)
 
     db.commit()
 
-    return RedirectResponse("http://localhost:5173/settings?status=success&service=strava")
+    return _signed_in_redirect("http://localhost:5173/settings?status=success&service=strava", token)
 
 
 # --- WHOOP OAuth ---
@@ -132,7 +222,7 @@ def whoop_login():
 
 
 @router.get("/whoop/callback")
-def whoop_callback(code: str = None, error: str = None, state: str = None, db: Session = Depends(get_db)):
+def whoop_callback(request: Request, code: str = None, error: str = None, state: str = None, db: Session = Depends(get_db)):
     """Handle WHOOP OAuth callback — exchange code for access token."""
     if error:
         return RedirectResponse(f"http://localhost:5173/settings?status=error&service=whoop&msg={error}")
@@ -150,32 +240,30 @@ def whoop_callback(code: str = None, error: str = None, state: str = None, db: S
             "redirect_uri": "http://localhost:8000/auth/whoop/callback",
         }
 
-        response = requests.post(token_url, data=payload)
+        response = http_client.post(token_url, data=payload)
 
         if response.status_code != 200:
             return RedirectResponse(f"http://localhost:5173/settings?status=error&service=whoop&msg=token_failed")
 
         data = response.json()
+        whoop_user_id = whoop_client.fetch_profile(data.get("access_token")).get("user_id")
+        user, token = _login_user(request, db, User.whoop_user_id, whoop_user_id)
 
-        user = db.query(User).first()
-        if not user:
-            user = User(email="user@example.com")
-            db.add(user)
-            db.commit()
-            db.refresh(user)
-
+        user.whoop_user_id = whoop_user_id
         user.whoop_access_token = data.get("access_token")
         user.whoop_refresh_token = data.get("refresh_token")
 
         expires_in = data.get("expires_in")
         if expires_in:
-            import time
             user.whoop_expires_at = int(time.time()) + int(expires_in)
+        resource_versions.bump(db, user.id, resource_versions.PROFILE)
 
         db.commit()
 
-        return RedirectResponse("http://localhost:5173/settings?status=success&service=whoop")
+        return _signed_in_redirect("http://localhost:5173/settings?status=success&service=whoop", token)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in WHOOP callback: {e}")
         return RedirectResponse(f"http://localhost:5173/settings?status=error&service=whoop&msg=exception")
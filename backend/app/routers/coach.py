@@ -2,18 +2,21 @@
 Coach Router — AI-powered training plan generation and editing.
 
 Provides endpoints for generating multi-day rolling workout plans
-and conversationally editing individual day plans via OpenAI.
+and conversationally editing individual day plans via OpenAI. Plan and edit
+handlers are async so in-flight completions don't occupy threadpool threads.
 """
 
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
 from ..schemas import TrainingPlanCreate
-from ..database import get_db
-from ..services import ai_coach
+from ..database import get_async_db, get_db
+from ..services import ai_coach, llm_cache, prompt_compiler
 from ..models import User
-from .auth import get_current_user
+from .auth import get_admin_user, get_current_user, get_current_user_async
 
 router = APIRouter()
 
@@ -25,35 +28,80 @@ class EditPlanRequest(BaseModel):
 
 
 @router.post("/generate")
-def generate_plan(plan_request: TrainingPlanCreate, db: Session = Depends(get_db)):
+def generate_plan(
+    plan_request: TrainingPlanCreate,
+    user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
     """Generate a training plan from a specific date range request."""
-    user = db.query(User).first()
-    if not user:
-        raise HTTPException(status_code=401, detail="User not found")
-
     plan = ai_coach.generate_training_plan(user, plan_request, db)
     return plan
 
 
 @router.post("/plan-3-day")
-def generate_rolling_plan(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+async def generate_rolling_plan(
+    cache: bool = True,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Generate or retrieve a rolling 2-day plan (today + tomorrow)."""
-    plan = ai_coach.get_or_generate_rolling_plan(current_user, db)
+    """Generate or retrieve a rolling 2-day plan (today + tomorrow). Pass cache=false to bypass the LLM cache."""
+    plan = await ai_coach.get_or_generate_rolling_plan(current_user, db, use_cache=cache)
     return plan
 
 
 @router.post("/edit-plan")
-def edit_plan(
+async def edit_plan(
     request: EditPlanRequest,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    cache: bool = True,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Edit a day's plan via conversational chat with the AI coach."""
     if request.day not in ("today", "tomorrow"):
         raise HTTPException(status_code=400, detail="day must be 'today' or 'tomorrow'")
-    result = ai_coach.edit_day_plan(current_user, db, request.day, request.messages)
+    result = await ai_coach.edit_day_plan(current_user, db, request.day, request.messages, use_cache=cache)
     return result
 
+
+@router.post("/edit-plan/stream")
+async def edit_plan_stream(
+    request: EditPlanRequest,
+    cache: bool = True,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Streaming variant of /edit-plan. Emits server-sent events: "token" events
+    with reply text as it is generated, then "done" with the persisted plan.
+    """
+    if request.day not in ("today", "tomorrow"):
+        raise HTTPException(status_code=400, detail="day must be 'today' or 'tomorrow'")
+    events = await ai_coach.stream_edit_day_plan(current_user, db, request.day, request.messages, use_cache=cache)
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# --- LLM response cache ---
+
+@router.get("/cache")
+def get_cache_stats(user: User = Depends(get_current_user)):
+    """Return LLM cache hit/miss counters and entry count."""
+    return llm_cache.get_stats()
+
+
+@router.delete("/cache")
+def clear_cache(user: User = Depends(get_admin_user)):
+    """Remove every cached LLM response. Shared by all users, so admins only (ADMIN_USER_IDS)."""
+    removed = llm_cache.clear()
+    return {"message": f"Cleared {removed} cached responses", "count": removed}
+
+
+# --- Prompt sizes ---
+
+@router.get("/prompts")
+def get_prompt_stats(user: User = Depends(get_current_user)):
+    """Return token counts per prompt type (mean, max, over-budget and cut sections) for this process."""
+    return prompt_compiler.get_stats()
@@ -2,34 +2,53 @@
 Data Router — Goals CRUD and user schedule management.
 
 Also provides sync endpoints for Strava activities and WHOOP recoveries.
+Handlers are async on an AsyncSession, so cheap reads like /goals are never
+queued behind threadpool work; shared sync helpers run via `run_sync`.
 """
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from ..database import get_db
+from ..database import get_async_db
 from ..models import User, Goal
-from ..services import strava_client, whoop_client
+from ..services import context_cache, http_cache, resource_versions, schedule_builder, strava_client, sync_scheduler, whoop_client
 from ..schemas import GoalCreate, GoalUpdate, Goal as GoalSchema
+from .auth import get_current_user_async
 
 router = APIRouter()
 
 
+async def _owned_goal(db: AsyncSession, goal_id: int, user: User):
+    """Return the user's goal by id, or raise 404 (also for other users' goals)."""
+    goal = await db.get(Goal, goal_id)
+    if not goal or goal.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Goal not found")
+    return goal
+
+
 @router.get("/goals", response_model=list[GoalSchema])
-def get_goals(db: Session = Depends(get_db)):
-    """Return all goals for the current user."""
-    user = db.query(User).first()
-    if not user:
-        return []
-    return db.query(Goal).filter(Goal.user_id == user.id).all()
+async def get_goals(
+    request: Request,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Return all goals for the current user. Supports conditional requests."""
+    def respond(session: Session):
+        return http_cache.conditional_json(
+            request, session, user.id, resource_versions.GOALS,
+            lambda: [GoalSchema.model_validate(g) for g in session.query(Goal).filter(Goal.user_id == user.id).all()]
+        )
+
+    return await db.run_sync(respond)
 
 
 @router.post("/goals", response_model=GoalSchema)
-def create_goal(goal: GoalCreate, db: Session = Depends(get_db)):
+async def create_goal(
+    goal: GoalCreate,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Create a new goal."""
-    user = db.query(User).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
     db_goal = Goal(
         user_id=user.id,
         description=goal.description,
@@ -39,17 +58,22 @@ def create_goal(goal: GoalCreate, db: Session = Depends(get_db)):
         is_completed=goal.is_completed
     )
     db.add(db_goal)
-    db.commit()
-    db.refresh(db_goal)
+    await db.run_sync(lambda session: resource_versions.bump(session, user.id, resource_versions.GOALS))
+    await db.commit()
+    context_cache.invalidate(user.id)
+    await db.refresh(db_goal)
     return db_goal
 
 
 @router.put("/goals/{goal_id}", response_model=GoalSchema)
-def update_goal(goal_id: int, goal_update: GoalUpdate, db: Session = Depends(get_db)):
+async def update_goal(
+    goal_id: int,
+    goal_update: GoalUpdate,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Update an existing goal's fields."""
-    db_goal = db.query(Goal).filter(Goal.id == goal_id).first()
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Goal not found")
+    db_goal = await _owned_goal(db, goal_id, user)
 
     if goal_update.description is not None: db_goal.description = goal_update.description
     if goal_update.type is not None: db_goal.type = goal_update.type
@@ -59,74 +83,112 @@ def update_goal(goal_id: int, goal_update: GoalUpdate, db: Session = Depends(get
         db_goal.is_completed = goal_update.is_completed
         db_goal.status = "completed" if goal_update.is_completed else "active"
 
-    db.commit()
-    db.refresh(db_goal)
+    await db.run_sync(lambda session: resource_versions.bump(session, user.id, resource_versions.GOALS))
+    await db.commit()
+    context_cache.invalidate(user.id)
+    await db.refresh(db_goal)
     return db_goal
 
 
 @router.delete("/goals/{goal_id}")
-def delete_goal(goal_id: int, db: Session = Depends(get_db)):
+async def delete_goal(
+    goal_id: int,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Delete a goal by ID."""
-    db_goal = db.query(Goal).filter(Goal.id == goal_id).first()
-    if not db_goal:
-        raise HTTPException(status_code=404, detail="Goal not found")
+    db_goal = await _owned_goal(db, goal_id, user)
 
-    db.delete(db_goal)
-    db.commit()
+    await db.delete(db_goal)
+    await db.run_sync(lambda session: resource_versions.bump(session, user.id, resource_versions.GOALS))
+    await db.commit()
+    context_cache.invalidate(user.id)
     return {"message": "Goal deleted"}
 
 
 # --- User Schedule (stored in user.settings["schedule"]) ---
 
 @router.get("/schedule")
-def get_schedule(db: Session = Depends(get_db)):
-    """Return the user's saved weekly schedule template."""
-    user = db.query(User).first()
-    if not user:
-        return {"schedule": {}}
-    settings = user.settings or {}
-    return {"schedule": settings.get("schedule", {})}
+async def get_schedule(
+    request: Request,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Return the user's saved weekly schedule template. Supports conditional requests."""
+    return await db.run_sync(lambda session: http_cache.conditional_json(
+        request, session, user.id, resource_versions.PROFILE,
+        lambda: {"schedule": (user.settings or {}).get("schedule", {})}
+    ))
 
 
 @router.put("/schedule")
-def update_schedule(body: dict, db: Session = Depends(get_db)):
-    """Save the user's weekly schedule template (Mon-Sun activity types and durations)."""
-    user = db.query(User).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def update_schedule(
+    body: dict,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Save the user's weekly schedule template (Mon-Sun activity types and
+    durations) and materialize any missing upcoming blocks from it.
+    """
     schedule_data = body.get("schedule", {})
     settings = dict(user.settings or {})
     settings["schedule"] = schedule_data
     user.settings = settings
 
-    db.commit()
-    db.refresh(user)
+    def materialize(session: Session):
+        schedule_builder.ensure_horizon(session, user)
+        resource_versions.bump(session, user.id, resource_versions.PROFILE)
+
+    await db.run_sync(materialize)
+    await db.commit()
+    context_cache.invalidate(user.id)
     return {"schedule": settings["schedule"]}
 
 
 # --- External Service Sync ---
 
 @router.post("/sync/strava")
-def sync_strava(db: Session = Depends(get_db)):
-    """Sync recent activities from Strava."""
-    user = db.query(User).first()
-    if not user or not user.strava_access_token:
+async def sync_strava(
+    response: Response,
+    backfill: bool = False,
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Sync new activities from Strava. Pass backfill=true to import the full
+    activity history; that runs in the background and answers 202 right away.
+    """
+    if not user.strava_access_token:
         raise HTTPException(status_code=401, detail="User not authenticated with Strava")
 
-    activities = strava_client.fetch_activities(user, db)
-    return {"message": f"Synced {len(activities)} new activities", "count": len(activities)}
+    if backfill:
+        response.status_code = 202
+        if sync_scheduler.request_backfill(user.id) is None:
+            return {"message": "A sync is already running for this user", "queued": False}
+        return {"message": "Strava history import started", "queued": True}
+
+    try:
+        activities = await strava_client.afetch_activities(user, db)
+        return {"message": f"Synced {len(activities)} new activities", "count": len(activities)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/sync/whoop")
-def sync_whoop(db: Session = Depends(get_db)):
-    """Sync recent recoveries from WHOOP."""
-    user = db.query(User).first()
-    if not user or not user.whoop_access_token:
+async def sync_whoop(
+    user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Sync new recoveries, sleeps and workouts from WHOOP."""
+    if not user.whoop_access_token:
         raise HTTPException(status_code=401, detail="User not authenticated with WHOOP")
 
     try:
-        recoveries = whoop_client.fetch_recoveries(user, db)
-        return {"message": f"Synced {len(recoveries)} new recoveries", "count": len(recoveries)}
+        recoveries, workouts = await whoop_client.sync_whoop_async(user, db)
+        return {
+            "message": f"Synced {len(recoveries)} new recoveries and {len(workouts)} new workouts",
+            "count": len(recoveries) + len(workouts)
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -4,13 +4,13 @@ Pydantic schemas for API request/response validation.
 
 from pydantic import BaseModel
 from typing import Optional, Any
-from datetime import datetime
+from datetime import date, datetime
 
 
 # --- User ---
 
 class UserBase(BaseModel):
-    email: str
+    email: Optional[str] = None
     name: Optional[str] = None
     age: Optional[int] = None
     gender: Optional[str] = None
@@ -66,7 +66,7 @@ class StravaActivity(StravaActivityBase):
 
 class WhoopRecoveryBase(BaseModel):
     whoop_id: str
-    date: str
+    date: date
     recovery_score: int
     resting_heart_rate: int
     hrv: int
@@ -130,7 +130,7 @@ class Goal(GoalBase):
 # --- Workout Block ---
 
 class WorkoutBlockBase(BaseModel):
-    date: str
+    date: date
     type: str
     planned_duration_minutes: int
     notes: Optional[str] = None
@@ -158,7 +158,12 @@ class WhoopWorkoutBase(BaseModel):
     average_heart_rate: int
     max_heart_rate: int
     kilojoules: float
-    zone_durations: Optional[Any] = None
+    zone0_milli: Optional[int] = None
+    zone1_milli: Optional[int] = None
+    zone2_milli: Optional[int] = None
+    zone3_milli: Optional[int] = None
+    zone4_milli: Optional[int] = None
+    zone5_milli: Optional[int] = None
 
 class WhoopWorkoutCreate(WhoopWorkoutBase):
     pass
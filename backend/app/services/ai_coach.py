@@ -4,117 +4,49 @@ AI Coach service — context gathering and plan generation via OpenAI.
 Builds a comprehensive context from user profile, Strava activities,
 WHOOP recovery/workouts, and goals, then generates rolling 2-day
 workout plans via OpenAI.
+
+The plan and edit paths are async: OpenAI calls go through AsyncOpenAI and
+database access through the request's AsyncSession, so a slow completion
+waits on the event loop instead of holding a threadpool thread. Query
+helpers stay sync and run inside the AsyncSession via `run_sync`.
 """
 
+import asyncio
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-from ..models import User, StravaActivity, WhoopRecovery, TrainingPlan, Goal, WorkoutBlock, WhoopWorkout
+from ..models import User, StravaActivity, TrainingPlan, Goal, WorkoutBlock, WhoopWorkout, DailyRollup
 from ..schemas import TrainingPlanCreate
-from . import strava_client, whoop_client
+from ..database import AsyncSessionLocal
+from . import sync_scheduler, llm_cache, context_cache, analytics, prompt_compiler, training_load
 import os
 import json
+import re
 import traceback
-from openai import OpenAI
+from openai import AsyncOpenAI
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+PLAN_LLM_TIMEOUT_SECONDS = float(os.getenv("PLAN_LLM_TIMEOUT_SECONDS", "90"))
+# Maximum concurrent plan completions across the process
+PLAN_WORKERS = int(os.getenv("PLAN_WORKERS", "8"))
 
-def get_context(user: User, db: Session):
-    """
-    Build a comprehensive context dict from the user's recent data:
-    - Profile (age, gender, height, weight, units)
-    - Strava activities (last 28 days)
-    - WHOOP recoveries (last 7 days)
-    - WHOOP workouts (last 14 days)
-    - Active goals (events + preferences)
-    """
-    try:
-        cutoff_date = datetime.now() - timedelta(days=28)
-        activities = db.query(StravaActivity).filter(
-            StravaActivity.user_id == user.id,
-            StravaActivity.start_date >= cutoff_date
-        ).all()
-
-        units = user.settings.get('units', 'imperial')
-        activity_summary = []
-        for act in activities:
-            if units == 'imperial':
-                distance = f"{round(act.distance / 1609.34, 2)} mi"
-            else:
-                distance = f"{round(act.distance / 1000, 2)} km"
+_plan_slots = asyncio.Semaphore(PLAN_WORKERS)
 
-            activity_summary.append({
-                "date": act.start_date.strftime("%Y-%m-%d"),
-                "type": act.type,
-                "distance": distance,
-                "suffer_score": act.suffer_score
-            })
 
-        recovery_cutoff = datetime.now() - timedelta(days=7)
-        recoveries = db.query(WhoopRecovery).filter(
-            WhoopRecovery.user_id == user.id,
-            WhoopRecovery.date >= recovery_cutoff.strftime("%Y-%m-%d")
-        ).all()
-
-        recovery_summary = [{
-            "date": rec.date,
-            "recovery_score": rec.recovery_score,
-            "hrv": rec.hrv,
-            "resting_hr": rec.resting_heart_rate,
-            "sleep_performance": rec.sleep_performance
-        } for rec in recoveries]
-
-        workout_cutoff = datetime.now() - timedelta(days=14)
-        whoop_workouts = db.query(WhoopWorkout).filter(
-            WhoopWorkout.user_id == user.id,
-            WhoopWorkout.start >= workout_cutoff
-        ).all()
-
-        whoop_workout_summary = [{
-            "date": ww.start.strftime("%Y-%m-%d"),
-            "sport": ww.sport_name,
-            "strain": ww.strain,
-            "avg_hr": ww.average_heart_rate,
-            "max_hr": ww.max_heart_rate,
-            "kilojoules": ww.kilojoules
-        } for ww in whoop_workouts]
-
-        goals = db.query(Goal).filter(
-            Goal.user_id == user.id,
-            Goal.status == "active"
-        ).all()
-
-        dated_goals = []
-        undated_goals = []
-        for g in goals:
-            if g.target_date:
-                try:
-                    d_str = g.target_date.strftime("%Y-%m-%d") if isinstance(g.target_date, datetime) else str(g.target_date)[0:10]
-                except Exception:
-                    d_str = str(g.target_date)
-                dated_goals.append({"description": g.description, "date": d_str, "type": g.type})
-            else:
-                undated_goals.append({"description": g.description, "type": g.type})
-
-        dated_goals.sort(key=lambda x: x['date'])
+async def get_context(user: User, db: AsyncSession):
+    """
+    Return the user's coaching context, served from the per-user snapshot
+    cache when nothing has changed since it was built (see context_cache).
+    """
+    today = datetime.now().date()
+    cached = context_cache.get(user.id, today)
+    if cached is not None:
+        return cached
 
-        return {
-            "profile": {
-                "age": user.age,
-                "gender": user.gender,
-                "height": user.height,
-                "weight": user.weight,
-                "units": units,
-                "preferences": user.settings
-            },
-            "activities": activity_summary,
-            "recoveries": recovery_summary,
-            "whoop_workouts": whoop_workout_summary,
-            "goals": {
-                "events": dated_goals,
-                "preferences": undated_goals
-            }
-        }
+    built_generation = context_cache.generation(user.id)
+    try:
+        context = await db.run_sync(lambda session: build_context(user, session))
     except Exception as e:
         print(f"Error in get_context: {e}")
         return {
@@ -122,52 +54,201 @@ def get_context(user: User, db: Session):
             "activities": [],
             "recoveries": [],
             "whoop_workouts": [],
+            "training_load": None,
+            "intensity": None,
             "goals": {"events": [], "preferences": []}
         }
 
+    context_cache.put(user.id, today, context, built_generation)
+    return context
+
 
-def sync_external_data(user: User, db: Session):
+def build_context(user: User, db: Session):
     """
-    Sync Strava activities and WHOOP recovery/workout data.
-    Each service is synced independently so one failure doesn't block the other.
-    Returns a summary dict with counts and any error messages.
+    Build a comprehensive context dict from the user's recent data:
+    - Profile (age, gender, height, weight, units)
+    - Strava activities (last 28 days)
+    - WHOOP recoveries (last 7 days, from the daily rollups)
+    - WHOOP workouts (last 14 days)
+    - Active goals (events + preferences)
+    - Training load trends (ATL/CTL/TSB, ACWR, monotony) over the full
+      history, summarized so the prompt doesn't need weeks of raw rows
+    - Heart rate intensity split (low/moderate/high, 80/20) over the last
+      28 days, from the analytics snapshot
+    Queries project only the columns used, returning plain rows instead of
+    tracked ORM entities, in chronological order.
     """
-    sync_result = {
-        "strava": {"synced": 0, "error": None},
-        "whoop": {"synced": 0, "error": None}
+    cutoff_date = datetime.now() - timedelta(days=28)
+    activities = db.query(
+        StravaActivity.start_date,
+        StravaActivity.type,
+        StravaActivity.distance,
+        StravaActivity.suffer_score
+    ).filter(
+        StravaActivity.user_id == user.id,
+        StravaActivity.start_date >= cutoff_date
+    ).order_by(StravaActivity.start_date).all()
+
+    units = user.settings.get('units', 'imperial')
+    activity_summary = []
+    for act in activities:
+        if units == 'imperial':
+            distance = f"{round(act.distance / 1609.34, 2)} mi"
+        else:
+            distance = f"{round(act.distance / 1000, 2)} km"
+
+        activity_summary.append({
+            "date": act.start_date.strftime("%Y-%m-%d"),
+            "type": act.type,
+            "distance": distance,
+            "suffer_score": act.suffer_score
+        })
+
+    recovery_cutoff = datetime.now() - timedelta(days=7)
+    recoveries = db.query(
+        DailyRollup.date,
+        DailyRollup.recovery_score,
+        DailyRollup.hrv,
+        DailyRollup.resting_heart_rate,
+        DailyRollup.sleep_performance
+    ).filter(
+        DailyRollup.user_id == user.id,
+        DailyRollup.date >= recovery_cutoff.date(),
+        DailyRollup.recovery_score.isnot(None)
+    ).order_by(DailyRollup.date).all()
+
+    recovery_summary = [{
+        "date": rec.date.isoformat() if rec.date else None,
+        "recovery_score": rec.recovery_score,
+        "hrv": rec.hrv,
+        "resting_hr": rec.resting_heart_rate,
+        "sleep_performance": rec.sleep_performance
+    } for rec in recoveries]
+
+    workout_cutoff = datetime.now() - timedelta(days=14)
+    whoop_workouts = db.query(
+        WhoopWorkout.start,
+        WhoopWorkout.sport_name,
+        WhoopWorkout.strain,
+        WhoopWorkout.average_heart_rate,
+        WhoopWorkout.max_heart_rate,
+        WhoopWorkout.kilojoules
+    ).filter(
+        WhoopWorkout.user_id == user.id,
+        WhoopWorkout.start >= workout_cutoff
+    ).order_by(WhoopWorkout.start).all()
+
+    whoop_workout_summary = [{
+        "date": ww.start.strftime("%Y-%m-%d"),
+        "sport": ww.sport_name,
+        "strain": ww.strain,
+        "avg_hr": ww.average_heart_rate,
+        "max_hr": ww.max_heart_rate,
+        "kilojoules": ww.kilojoules
+    } for ww in whoop_workouts]
+
+    goals = db.query(Goal.description, Goal.type, Goal.target_date).filter(
+        Goal.user_id == user.id,
+        Goal.status == "active"
+    ).all()
+
+    dated_goals = []
+    undated_goals = []
+    for g in goals:
+        if g.target_date:
+            try:
+                d_str = g.target_date.strftime("%Y-%m-%d") if isinstance(g.target_date, datetime) else str(g.target_date)[0:10]
+            except Exception:
+                d_str = str(g.target_date)
+            dated_goals.append({"description": g.description, "date": d_str, "type": g.type})
+        else:
+            undated_goals.append({"description": g.description, "type": g.type})
+
+    dated_goals.sort(key=lambda x: x['date'])
+
+    return {
+        "profile": {
+            "age": user.age,
+            "gender": user.gender,
+            "height": user.height,
+            "weight": user.weight,
+            "units": units,
+            # The weekly schedule reaches prompts as the day's block, not the whole template
+            "preferences": {k: v for k, v in (user.settings or {}).items() if k != "schedule"}
+        },
+        "activities": activity_summary,
+        "recoveries": recovery_summary,
+        "whoop_workouts": whoop_workout_summary,
+        "training_load": training_load.summary(db, user.id),
+        "intensity": analytics.intensity_summary(analytics.get_snapshot(db, user.id), datetime.now().date()),
+        "goals": {
+            "events": dated_goals,
+            "preferences": undated_goals
+        }
     }
 
-    if user.strava_access_token:
-        try:
-            activities = strava_client.fetch_activities(user, db)
-            sync_result["strava"]["synced"] = len(activities)
-        except Exception as e:
-            sync_result["strava"]["error"] = str(e)
-    else:
-        sync_result["strava"]["error"] = "Not connected"
 
-    if user.whoop_access_token:
-        try:
-            recoveries = whoop_client.fetch_recoveries(user, db)
-            workouts = whoop_client.fetch_workouts(user, db)
-            sync_result["whoop"]["synced"] = len(recoveries) + len(workouts)
-        except Exception as e:
-            sync_result["whoop"]["error"] = str(e)
-    else:
-        sync_result["whoop"]["error"] = "Not connected"
+async def run_day_tasks(tasks: dict):
+    """
+    Run independent per-day LLM tasks concurrently, at most PLAN_WORKERS at a
+    time across the process. All tasks share one PLAN_LLM_TIMEOUT_SECONDS
+    deadline; a task that misses it is cancelled.
 
-    return sync_result
+    Args:
+        tasks: {"today"|"tomorrow": coroutine returning a plan dict}
 
+    Returns:
+        (results, errors) — dicts keyed by day; a day appears in exactly one.
+    """
+    async def bounded(coro):
+        async with _plan_slots:
+            return await coro
+
+    days = list(tasks)
+    outcomes = await asyncio.gather(
+        *(asyncio.wait_for(bounded(tasks[day]), PLAN_LLM_TIMEOUT_SECONDS) for day in days),
+        return_exceptions=True
+    )
 
-def get_or_generate_rolling_plan(user: User, db: Session):
+    results, errors = {}, {}
+    for day, outcome in zip(days, outcomes):
+        if isinstance(outcome, asyncio.TimeoutError):
+            errors[day] = f"Timed out after {PLAN_LLM_TIMEOUT_SECONDS:g}s"
+        elif isinstance(outcome, Exception):
+            print(f"Plan generation failed for {day}: {outcome}")
+            errors[day] = str(outcome)
+        else:
+            results[day] = outcome
+    return results, errors
+
+
+async def get_or_generate_rolling_plan(user: User, db: AsyncSession, use_cache: bool = True):
     """
-    Sync external data, then return a rolling 2-day plan (today + tomorrow).
+    Return a rolling 2-day plan (today + tomorrow) from already-synced data.
+    External data is refreshed by the background sync scheduler; if the user's
+    data is stale, a sync is queued without blocking this request.
     Uses caching:
     1. If a valid plan exists for today, return it (re-validating against schedule).
     2. If yesterday's plan exists, roll forward (yesterday's tomorrow → today).
     3. Otherwise, generate a fresh 2-day plan from scratch.
+    Independent LLM calls for today and tomorrow run concurrently; a failed
+    day is reported under "errors" and left as its previous plan (or None).
+    Completions for unchanged inputs are served from the LLM cache unless
+    use_cache is False.
     """
-    sync_result = sync_external_data(user, db)
+    if sync_scheduler.is_stale(user):
+        sync_scheduler.request_sync(user.id)
+
+    sync_result = user.last_sync_status
+    synced_at = user.last_synced_at.isoformat() + "Z" if user.last_synced_at else None
+
+    def respond(plan_today, plan_tomorrow, errors=None):
+        return {
+            "plan": [plan_today, plan_tomorrow],
+            "sync": sync_result,
+            "synced_at": synced_at,
+            "errors": errors or {}
+        }
 
     try:
         today = datetime.now().date()
@@ -175,185 +256,223 @@ def get_or_generate_rolling_plan(user: User, db: Session):
         tomorrow_date = today + timedelta(days=1)
         tomorrow_str = tomorrow_date.strftime("%Y-%m-%d")
 
-        context = get_context(user, db)
+        context = await get_context(user, db)
+        model = user.openai_model or "gpt-5-mini"
 
-        def get_block_type(target_date):
-            block = db.query(WorkoutBlock).filter(
-                WorkoutBlock.user_id == user.id,
-                WorkoutBlock.date == target_date.strftime("%Y-%m-%d")
-            ).first()
-            return block.type if block else "Rest"
+        today_block = await db.run_sync(lambda session: get_block_info(user, session, today))
+        tomorrow_block = await db.run_sync(lambda session: get_block_info(user, session, tomorrow_date))
 
-        today_block_type = get_block_type(today)
-        tomorrow_block_type = get_block_type(tomorrow_date)
+        def generate(block_info):
+            return generate_plan_for_block(model, context, block_info, use_cache=use_cache)
+
+        def dated(plan, date_str):
+            if plan is not None:
+                plan['date'] = date_str
+            return plan
 
         # 1. Check existing plan validity
         if user.last_plan_date == today_str and user.plan_today and user.plan_tomorrow:
             today_valid = (
                 user.plan_today.get('date') == today_str and
-                user.plan_today.get('block_type', 'Rest') == today_block_type
+                user.plan_today.get('block_type', 'Rest') == today_block['type']
             )
             tomorrow_valid = (
-                user.plan_tomorrow.get('block_type', 'Rest') == tomorrow_block_type
+                user.plan_tomorrow.get('block_type', 'Rest') == tomorrow_block['type']
             )
 
             if today_valid and tomorrow_valid:
-                return {"plan": [user.plan_today, user.plan_tomorrow], "sync": sync_result}
+                return respond(user.plan_today, user.plan_tomorrow)
 
+            tasks = {}
             if not today_valid:
-                user.plan_today = generate_single_day_plan(user, db, context, today)
-                user.plan_today['date'] = today_str
-
+                tasks["today"] = generate(today_block)
             if not tomorrow_valid:
-                user.plan_tomorrow = generate_single_day_plan(user, db, context, tomorrow_date)
-                user.plan_tomorrow['date'] = tomorrow_str
+                tasks["tomorrow"] = generate(tomorrow_block)
 
-            db.commit()
-            return {"plan": [user.plan_today, user.plan_tomorrow], "sync": sync_result}
+            results, errors = await run_day_tasks(tasks)
+            if "today" in results:
+                user.plan_today = dated(results["today"], today_str)
+            if "tomorrow" in results:
+                user.plan_tomorrow = dated(results["tomorrow"], tomorrow_str)
+
+            await db.commit()
+            return respond(user.plan_today, user.plan_tomorrow, errors)
 
         # 2. Rolling update (yesterday → today)
         yesterday = (today - timedelta(days=1)).strftime("%Y-%m-%d")
         if user.last_plan_date == yesterday and user.plan_tomorrow:
-            new_today = user.plan_tomorrow
+            new_today = dict(user.plan_tomorrow)
             new_today['date'] = today_str
 
-            if new_today.get('block_type') != today_block_type:
-                refined_today = generate_single_day_plan(user, db, context, today)
+            if new_today.get('block_type') != today_block['type']:
+                refine_today = generate(today_block)
             else:
-                refined_today = refine_daily_plan(new_today, context, client, model=user.openai_model or "gpt-5-mini")
+                refine_today = refine_daily_plan(new_today, context, client, model=model, use_cache=use_cache)
 
-            refined_today['date'] = today_str
+            results, errors = await run_day_tasks({
+                "today": refine_today,
+                "tomorrow": generate(tomorrow_block)
+            })
 
-            new_tomorrow = generate_single_day_plan(user, db, context, tomorrow_date)
-            new_tomorrow['date'] = tomorrow_str
+            # If refinement fails outright, the carried-over plan is still valid for today
+            refined_today = dated(results.get("today", new_today), today_str)
+            new_tomorrow = dated(results.get("tomorrow"), tomorrow_str)
 
             user.plan_today = refined_today
             user.plan_tomorrow = new_tomorrow
             user.last_plan_date = today_str
-            db.commit()
+            await db.commit()
 
-            return {"plan": [refined_today, new_tomorrow], "sync": sync_result}
+            return respond(refined_today, new_tomorrow, errors)
 
         # 3. Fresh generation
-        plan_day_1 = generate_single_day_plan(user, db, context, today)
-        plan_day_1['date'] = today_str
-
-        plan_day_2 = generate_single_day_plan(user, db, context, tomorrow_date)
-        plan_day_2['date'] = tomorrow_str
+        results, errors = await run_day_tasks({
+            "today": generate(today_block),
+            "tomorrow": generate(tomorrow_block)
+        })
+        plan_day_1 = dated(results.get("today"), today_str)
+        plan_day_2 = dated(results.get("tomorrow"), tomorrow_str)
 
         user.plan_today = plan_day_1
         user.plan_tomorrow = plan_day_2
         user.last_plan_date = today_str
-        db.commit()
+        await db.commit()
 
-        return {"plan": [plan_day_1, plan_day_2], "sync": sync_result}
+        return respond(plan_day_1, plan_day_2, errors)
 
     except Exception as e:
         print(f"Error in rolling plan generation: {e}")
         traceback.print_exc()
-        return {"error": str(e), "sync": sync_result}
+        return {"error": str(e), "sync": sync_result, "synced_at": synced_at}
 
 
-def refine_daily_plan(plan_day, context, client, model="gpt-5-mini"):
+async def refine_daily_plan(plan_day, context, client, model="gpt-5-mini", use_cache=True):
     """
     Refine an existing day plan based on fresh recovery data.
     Adjusts intensity/notes without changing the core routine.
     """
     try:
-        system_prompt = f"""
-        You are an expert Personal Trainer. You have an existing workout plan for TODAY.
-        Your job is to REFINE it based on the client's latest recovery metrics (Sleep, HRV) without changing the core workout substance.
-        
-        Current Plan:
-        {json.dumps(plan_day)}
-        
-        Client Context:
-        - Age/Gender: {context['profile'].get('age')}/{context['profile'].get('gender')}
-        - Unit Pref: {context['profile'].get('units', 'imperial')}
-        - Recent Recovery: {json.dumps(context['recoveries'][-1:] if context['recoveries'] else 'No Data')}
-        
-        Instructions:
-        1. If recovery is POOR, lower intensity or suggest modifications in 'notes'.
-        2. If recovery is GREAT, you might increase intensity slightly.
-        3. DO NOT change the 'block_type', 'focus', or the core 'routine' steps unless absolutely necessary for safety.
-        4. Update 'date' to match the current day if needed.
-        
-        Output:
-        Return strict JSON of the modified plan object.
-        """
-
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "system", "content": system_prompt}],
-            response_format={"type": "json_object"}
+        system_prompt, _ = prompt_compiler.compile_prompt("refine", [
+            "You are an expert Personal Trainer. You have an existing workout plan for TODAY.",
+            "Your job is to REFINE it based on the client's latest recovery metrics (Sleep, HRV) without changing the core workout substance.",
+            "",
+            "Current Plan:",
+            prompt_compiler.compact(plan_day),
+            "",
+            "Client Context:",
+            f"- Age/Gender: {context['profile'].get('age')}/{context['profile'].get('gender')}",
+            f"- Unit Pref: {context['profile'].get('units', 'imperial')}",
+            prompt_compiler.section("Recent Recovery", context['recoveries'][-1:], priority=0),
+            prompt_compiler.section("Training Load", context.get('training_load'), priority=2),
+            prompt_compiler.section("Intensity (28d)", context.get('intensity'), priority=3),
+            "",
+            "Instructions:",
+            "1. If recovery is POOR, lower intensity or suggest modifications in 'notes'.",
+            "2. If recovery is GREAT, you might increase intensity slightly.",
+            "3. DO NOT change the 'block_type', 'focus', or the core 'routine' steps unless absolutely necessary for safety.",
+            "4. Update 'date' to match the current day if needed.",
+            "",
+            "Output:",
+            "Return strict JSON of the modified plan object.",
+        ], model=model)
+
+        return await llm_cache.acached_completion(
+            client,
+            model,
+            [{"role": "system", "content": system_prompt}],
+            use_cache=use_cache,
+            response_format={"type": "json_object"},
+            parse=json.loads,
+            timeout=PLAN_LLM_TIMEOUT_SECONDS
         )
-        content = completion.choices[0].message.content
-        return json.loads(content)
     except Exception as e:
         print(f"Refinement failed: {e}")
         return plan_day
 
 
-def generate_single_day_plan(user, db, context, target_date):
-    """
-    Generate a detailed workout plan for a single day.
-    The plan respects the scheduled block type and duration, and incorporates
-    the user's goals and recent recovery data.
-    """
+def get_block_info(user, db: Session, target_date):
+    """Return the scheduled block for a day as a plain dict (Rest if none is scheduled)."""
     date_str = target_date.strftime("%Y-%m-%d")
 
-    block = db.query(WorkoutBlock).filter(
+    block = db.query(
+        WorkoutBlock.type,
+        WorkoutBlock.planned_duration_minutes,
+        WorkoutBlock.notes
+    ).filter(
         WorkoutBlock.user_id == user.id,
-        WorkoutBlock.date == date_str
+        WorkoutBlock.date == target_date
     ).first()
 
-    block_info = {
+    return {
         "date": date_str,
         "type": block.type if block else "Rest",
         "duration": block.planned_duration_minutes if block else 0,
         "notes": block.notes if block else "No planned block"
     }
 
-    system_prompt = f"""
-    You are an expert Personal Trainer. Generate a detailed workout for {date_str}.
-    
-    Client:
-    - Age/Gender: {context['profile'].get('age')}/{context['profile'].get('gender')}
-    - Units: {context['profile'].get('units', 'imperial')}
-    - Goals: {json.dumps(context['goals']['preferences'], indent=2)}
-    
-    Schedule Block:
-    {json.dumps(block_info)}
-    
-    Recent Data:
-    - Recovery: {json.dumps(context['recoveries'][-3:], indent=2)}
-    - Activities: {json.dumps(context['activities'][-3:], indent=2)}
-    
-    Instructions:
-    - Strictly adhere to the Block Type and Duration.
-    - Generate a specific 'routine' and 'focus'.
-    - CRITICAL: ALL values must be PLAIN STRINGS. Do NOT nest objects or arrays.
-    - The "routine" field must be a single string with numbered steps separated by newlines.
-    - When a step references a named routine/exercise list from the user's preferences, format each exercise on its own line with a "- " prefix. For example:
-      "1. Warm up 10 min.\n2. Perform your yoga routine:\n- Half-Kneeling Ankle Stretch\n- Seiza Pose\n- 90/90 Hip Rotations\n3. Cool down 5 min."
-    - Output strictly Valid JSON object:
-    {{
-        "date": "{date_str}",
-        "block_type": "...",
-        "intensity": "Low/Medium/High",
-        "focus": "a plain string",
-        "routine": "a plain string with numbered steps",
-        "notes": "a plain string"
-    }}
+
+async def generate_single_day_plan(user, db: AsyncSession, context, target_date, use_cache=True):
     """
+    Generate a detailed workout plan for a single day.
+    The plan respects the scheduled block type and duration, and incorporates
+    the user's goals and recent recovery data.
+    """
+    block_info = await db.run_sync(lambda session: get_block_info(user, session, target_date))
+    return await generate_plan_for_block(user.openai_model or "gpt-5-mini", context, block_info, use_cache=use_cache)
 
-    completion = client.chat.completions.create(
-        model=user.openai_model or "gpt-5-mini",
-        messages=[{"role": "system", "content": system_prompt}],
-        response_format={"type": "json_object"}
-    )
 
-    plan_data = json.loads(completion.choices[0].message.content)
+async def generate_plan_for_block(model, context, block_info, use_cache=True):
+    """
+    Generate a plan for an already-resolved schedule block.
+    Does not touch the database, so several can run concurrently.
+    """
+    date_str = block_info['date']
+
+    system_prompt, _ = prompt_compiler.compile_prompt("plan", [
+        f"You are an expert Personal Trainer. Generate a detailed workout for {date_str}.",
+        "",
+        "Client:",
+        f"- Age/Gender: {context['profile'].get('age')}/{context['profile'].get('gender')}",
+        f"- Units: {context['profile'].get('units', 'imperial')}",
+        prompt_compiler.section("Goals", context['goals']['preferences'], priority=2, min_items=3, empty="None"),
+        "",
+        "Schedule Block:",
+        prompt_compiler.compact(block_info),
+        "",
+        "Recent Data:",
+        prompt_compiler.section("Recovery", context['recoveries'][-3:], priority=1, min_items=1),
+        prompt_compiler.section("Activities", context['activities'][-3:], priority=3),
+        prompt_compiler.section("Training Load", context.get('training_load'), priority=4, note="""
+            atl/ctl: 7/42-day exponentially weighted load; tsb: form, negative = fatigued;
+            acwr: acute:chronic ratio, sustained values above 1.5 raise injury risk;
+            monotony above 2 means too little variation between days
+        """),
+        prompt_compiler.section("Intensity (28d)", context.get('intensity'), priority=5, note="""
+            minutes by heart rate: low below 70% max HR, moderate 70-80%, high above 80%;
+            endurance athletes should keep about 80% of training time low, so when
+            meets_80_20 is false, prefer easy aerobic work over threshold efforts
+        """),
+        "",
+        "Instructions:",
+        "- Strictly adhere to the Block Type and Duration.",
+        "- Generate a specific 'routine' and 'focus'.",
+        "- CRITICAL: ALL values must be PLAIN STRINGS. Do NOT nest objects or arrays.",
+        '- The "routine" field must be a single string with numbered steps separated by newlines.',
+        '- When a step references a named routine/exercise list from the user\'s preferences, format each exercise on its own line with a "- " prefix. For example:',
+        '  "1. Warm up 10 min.\\n2. Perform your yoga routine:\\n- Half-Kneeling Ankle Stretch\\n- Seiza Pose\\n- 90/90 Hip Rotations\\n3. Cool down 5 min."',
+        "- Output strictly Valid JSON object:",
+        f'{{"date": "{date_str}", "block_type": "...", "intensity": "Low/Medium/High", "focus": "a plain string", "routine": "a plain string with numbered steps", "notes": "a plain string"}}',
+    ], model=model)
+
+    plan_data = await llm_cache.acached_completion(
+        client,
+        model,
+        [{"role": "system", "content": system_prompt}],
+        use_cache=use_cache,
+        response_format={"type": "json_object"},
+        parse=json.loads,
+        timeout=PLAN_LLM_TIMEOUT_SECONDS
+    )
 
     plan_data['block_type'] = block_info['type']
 
@@ -372,7 +491,72 @@ def generate_single_day_plan(user, db, context, target_date):
     return plan_data
 
 
-def edit_day_plan(user: User, db: Session, day_key: str, messages: list):
+async def build_edit_messages(user: User, db: AsyncSession, current_plan: dict, messages: list):
+    """Build the OpenAI message list for a conversational plan edit."""
+    context = await get_context(user, db)
+
+    model = user.openai_model or "gpt-5-mini"
+    system_prompt, _ = prompt_compiler.compile_prompt("edit", [
+        "You are an expert Personal Trainer having a conversation with your client about their workout plan.",
+        "",
+        "Current Plan:",
+        prompt_compiler.compact(current_plan),
+        "",
+        "Client Context:",
+        f"- Age/Gender: {context['profile'].get('age')}/{context['profile'].get('gender')}",
+        f"- Units: {context['profile'].get('units', 'imperial')}",
+        prompt_compiler.section("Goals", context['goals']['preferences'], priority=2, min_items=3, empty="None"),
+        prompt_compiler.section("Recent Recovery", context['recoveries'][-2:], priority=1, min_items=1),
+        prompt_compiler.section("Training Load", context.get('training_load'), priority=3),
+        prompt_compiler.section("Intensity (28d)", context.get('intensity'), priority=4),
+        "",
+        "Instructions:",
+        "1. Respond conversationally — acknowledge what the client wants, explain your changes.",
+        "2. Modify the plan according to their request.",
+        "3. Keep the same JSON structure for the plan.",
+        "4. ALL plan values must be PLAIN STRINGS (no nested objects/arrays).",
+        '5. The "routine" field must be a single string with numbered steps separated by newlines. When referencing a named routine/exercise list, format each exercise on its own line with a "- " prefix.',
+        '6. Do NOT change the "date" or "block_type" fields.',
+        "",
+        "Output strict JSON:",
+        '{"reply": "Your conversational response to the client", "revised_plan": { the full updated plan object }}',
+    ], model=model)
+
+    api_messages = [{"role": "system", "content": system_prompt}]
+    for msg in prompt_compiler.fit_messages(messages, model):
+        api_messages.append({"role": msg["role"], "content": msg["content"]})
+    return api_messages
+
+
+def apply_edit_result(user: User, day_key: str, current_plan: dict, result: dict):
+    """Validate and flatten a revised plan from the model and set it on the user. Does not commit."""
+    revised = result.get("revised_plan", current_plan)
+
+    # Flatten any nested values to plain strings
+    for key in ['routine', 'focus', 'notes', 'intensity']:
+        val = revised.get(key)
+        if isinstance(val, list):
+            revised[key] = ' '.join(
+                str(item) if not isinstance(item, dict)
+                else ' '.join(f"{k}: {v}" for k, v in item.items())
+                for item in val
+            )
+        elif isinstance(val, dict):
+            revised[key] = ' '.join(f"{k}: {v}" for k, v in val.items())
+
+    # Preserve date and block_type
+    revised['date'] = current_plan.get('date')
+    revised['block_type'] = current_plan.get('block_type')
+
+    if day_key == "today":
+        user.plan_today = revised
+    else:
+        user.plan_tomorrow = revised
+
+    return revised
+
+
+async def edit_day_plan(user: User, db: AsyncSession, day_key: str, messages: list, use_cache: bool = True):
     """
     Edit a day's plan via conversational chat.
     Takes the current plan and user messages, returns a chat reply
@@ -381,79 +565,162 @@ def edit_day_plan(user: User, db: Session, day_key: str, messages: list):
     Args:
         day_key: "today" or "tomorrow"
         messages: list of {"role": "user"|"assistant", "content": "..."}
+        use_cache: serve an identical previous edit from the LLM cache
     """
     current_plan = user.plan_today if day_key == "today" else user.plan_tomorrow
     if not current_plan:
         return {"reply": "No plan exists for this day yet. Generate a plan first.", "plan": None}
 
-    context = get_context(user, db)
+    try:
+        api_messages = await build_edit_messages(user, db, current_plan, messages)
+        result = await llm_cache.acached_completion(
+            client,
+            user.openai_model or "gpt-5-mini",
+            api_messages,
+            use_cache=use_cache,
+            response_format={"type": "json_object"},
+            parse=json.loads,
+            timeout=PLAN_LLM_TIMEOUT_SECONDS
+        )
+        revised = apply_edit_result(user, day_key, current_plan, result)
+        await db.commit()
 
-    system_prompt = f"""You are an expert Personal Trainer having a conversation with your client about their workout plan.
+        return {"reply": result.get("reply", "Plan updated."), "plan": revised}
 
-Current Plan:
-{json.dumps(current_plan, indent=2)}
+    except Exception as e:
+        print(f"Edit plan failed: {e}")
+        traceback.print_exc()
+        return {"reply": f"Sorry, I couldn't process that: {str(e)}", "plan": current_plan}
 
-Client Context:
-- Age/Gender: {context['profile'].get('age')}/{context['profile'].get('gender')}
-- Units: {context['profile'].get('units', 'imperial')}
-- Goals: {json.dumps(context['goals']['preferences'])}
-- Recent Recovery: {json.dumps(context['recoveries'][-2:] if context['recoveries'] else 'No Data')}
 
-Instructions:
-1. Respond conversationally — acknowledge what the client wants, explain your changes.
-2. Modify the plan according to their request.
-3. Keep the same JSON structure for the plan.
-4. ALL plan values must be PLAIN STRINGS (no nested objects/arrays).
-5. The "routine" field must be a single string with numbered steps separated by newlines. When referencing a named routine/exercise list, format each exercise on its own line with a "- " prefix.
-6. Do NOT change the "date" or "block_type" fields.
+class ReplyStreamParser:
+    """
+    Incrementally extracts the "reply" string value from a streamed JSON object.
+    Feed raw completion deltas in order; each call returns the newly decoded
+    reply text (possibly empty). Text after the reply's closing quote is ignored.
+    """
 
-Output strict JSON:
-{{
-    "reply": "Your conversational response to the client",
-    "revised_plan": {{ the full updated plan object }}
-}}"""
+    _KEY = re.compile(r'"reply"\s*:\s*"')
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "seek"  # seek -> value -> done
+
+    def feed(self, delta: str):
+        if self._state == "done":
+            return ""
+        self._buffer += delta
+
+        if self._state == "seek":
+            match = self._KEY.search(self._buffer)
+            if not match:
+                return ""
+            self._buffer = self._buffer[match.end():]
+            self._state = "value"
+
+        out = []
+        i = 0
+        buf = self._buffer
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self._state = "done"
+                i = len(buf)
+                break
+            if ch != "\\":
+                out.append(ch)
+                i += 1
+                continue
+
+            # Escape sequence: wait until it is complete before decoding
+            if i + 1 >= len(buf):
+                break
+            if buf[i + 1] != "u":
+                out.append(json.loads(f'"{buf[i:i + 2]}"'))
+                i += 2
+                continue
+            if i + 6 > len(buf):
+                break
+            code = int(buf[i + 2:i + 6], 16)
+            if 0xD800 <= code < 0xDC00:
+                # High surrogate: decode together with the following low surrogate
+                if i + 12 > len(buf):
+                    break
+                out.append(json.loads(f'"{buf[i:i + 12]}"'))
+                i += 12
+            else:
+                out.append(chr(code))
+                i += 6
 
-    api_messages = [{"role": "system", "content": system_prompt}]
-    for msg in messages:
-        api_messages.append({"role": msg["role"], "content": msg["content"]})
+        self._buffer = buf[i:]
+        return "".join(out)
 
-    try:
-        completion = client.chat.completions.create(
-            model=user.openai_model or "gpt-5-mini",
-            messages=api_messages,
-            response_format={"type": "json_object"}
-        )
-        result = json.loads(completion.choices[0].message.content)
-
-        revised = result.get("revised_plan", current_plan)
-
-        # Flatten any nested values to plain strings
-        for key in ['routine', 'focus', 'notes', 'intensity']:
-            val = revised.get(key)
-            if isinstance(val, list):
-                revised[key] = ' '.join(
-                    str(item) if not isinstance(item, dict)
-                    else ' '.join(f"{k}: {v}" for k, v in item.items())
-                    for item in val
-                )
-            elif isinstance(val, dict):
-                revised[key] = ' '.join(f"{k}: {v}" for k, v in val.items())
 
-        # Preserve date and block_type
-        revised['date'] = current_plan.get('date')
-        revised['block_type'] = current_plan.get('block_type')
+def _sse(event: str, data: dict):
+    """Format a server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-        # Persist
-        if day_key == "today":
-            user.plan_today = revised
-        else:
-            user.plan_tomorrow = revised
-        db.commit()
 
-        return {"reply": result.get("reply", "Plan updated."), "plan": revised}
+async def stream_edit_day_plan(user: User, db: AsyncSession, day_key: str, messages: list, use_cache: bool = True):
+    """
+    Streaming variant of edit_day_plan. Returns an async generator of
+    server-sent events: "token" events carrying reply text as it arrives, then
+    a single "done" event with the full reply and the validated, persisted
+    plan (or an "error" event). The generator persists through its own
+    session, so it can safely outlive the request's session.
+    """
+    current_plan = user.plan_today if day_key == "today" else user.plan_tomorrow
+    if not current_plan:
+        async def no_plan():
+            yield _sse("done", {"reply": "No plan exists for this day yet. Generate a plan first.", "plan": None})
+        return no_plan()
 
-    except Exception as e:
-        print(f"Edit plan failed: {e}")
-        traceback.print_exc()
-        return {"reply": f"Sorry, I couldn't process that: {str(e)}", "plan": current_plan}
+    user_id = user.id
+    model = user.openai_model or "gpt-5-mini"
+    current_plan = dict(current_plan)
+    api_messages = await build_edit_messages(user, db, current_plan, messages)
+    response_format = {"type": "json_object"}
+
+    async def events():
+        try:
+            key, content = await asyncio.to_thread(llm_cache.lookup, model, api_messages, response_format, use_cache)
+
+            if content is None:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=api_messages,
+                    response_format=response_format,
+                    stream=True,
+                    timeout=PLAN_LLM_TIMEOUT_SECONDS
+                )
+                parser = ReplyStreamParser()
+                parts = []
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    text = parser.feed(delta)
+                    if text:
+                        yield _sse("token", {"text": text})
+                content = "".join(parts)
+                # Parse before caching so a cut-off or malformed stream is never replayed
+                result = json.loads(content)
+                await asyncio.to_thread(llm_cache.store, key, model, content)
+            else:
+                result = json.loads(content)
+                yield _sse("token", {"text": result.get("reply", "")})
+
+            async with AsyncSessionLocal() as session:
+                owner = await session.get(User, user_id)
+                revised = apply_edit_result(owner, day_key, current_plan, result)
+                await session.commit()
+
+            yield _sse("done", {"reply": result.get("reply", "Plan updated."), "plan": revised})
+
+        except Exception as e:
+            print(f"Streaming edit failed: {e}")
+            traceback.print_exc()
+            yield _sse("error", {"reply": f"Sorry, I couldn't process that: {str(e)}", "plan": current_plan})
 
+    return events()
@@ -0,0 +1,447 @@
+"""
+Analytics — long-range trend queries over per-user columnar snapshots.
+
+A snapshot holds a user's history as NumPy columns: one entry per rollup day
+(volume, load, recovery, HRV/RHR, time in heart rate zone) plus one per Strava activity and WHOOP
+workout (day, sport code, time). Rows are sorted by day, so a date range is
+two `searchsorted` calls and every query is a few vectorized passes over
+array slices, with no ORM objects or per-request table scans.
+
+Snapshots are keyed by the user's `history` resource version, which rollup
+refreshes bump, so any ingestion in any process makes the next read rebuild.
+They are kept in an in-process LRU and, when ANALYTICS_SNAPSHOT_DIR is set,
+also written as .npy columns that other workers memory-map instead of
+rebuilding.
+"""
+
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from ..models import DailyRollup, StravaActivity, WhoopWorkout
+from . import resource_versions, rollups, training_load
+
+ANALYTICS_SNAPSHOT_DIR = os.getenv("ANALYTICS_SNAPSHOT_DIR")  # unset: memory only
+ANALYTICS_CACHE_MAX_USERS = int(os.getenv("ANALYTICS_CACHE_MAX_USERS", "256"))
+
+DAILY_COLUMNS = (
+    "activity_count", "distance", "moving_time", "elevation_gain", "workout_count",
+    "kilojoules", "training_load", "recovery_score", "hrv", "resting_heart_rate", "sleep_performance",
+    "zone0_minutes", "zone1_minutes", "zone2_minutes", "zone3_minutes", "zone4_minutes", "zone5_minutes",
+)
+# Snapshot layout: table -> column names; every table is sorted by "days" (date ordinals)
+SNAPSHOT_COLUMNS = {
+    "daily": ("days",) + DAILY_COLUMNS,
+    "activities": ("days", "sport", "moving_time", "distance"),
+    "workouts": ("days", "sport", "duration", "strain"),
+}
+# WHOOP recovery zones: red below 34, yellow 34-66, green 67 and up
+RECOVERY_ZONES = (("red", 0, 34), ("yellow", 34, 67), ("green", 67, 101))
+# Three-zone intensity model over WHOOP's %max-HR zones: low below 70%,
+# moderate (threshold) 70-80%, high 80% and up. Zone 0 (below 50%) is not training time.
+INTENSITY_ZONES = (("low", (1, 2)), ("moderate", (3,)), ("high", (4, 5)))
+# 80/20 guideline: at least this share of training time at low intensity
+LOW_INTENSITY_TARGET = 0.8
+
+_snapshots = OrderedDict()  # user_id -> snapshot
+_lock = threading.Lock()
+
+
+# --- Snapshots ---
+
+def _float_column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def _encode(names: list):
+    """Return (codes, vocabulary) for a list of category names."""
+    vocabulary = sorted({name or "Other" for name in names})
+    index = {name: i for i, name in enumerate(vocabulary)}
+    return np.array([index[name or "Other"] for name in names], dtype=np.int16), vocabulary
+
+
+def build_snapshot(db: Session, user_id: int, version: int):
+    """Load a user's history into columnar arrays."""
+    daily_rows = db.execute(
+        select(DailyRollup.date, *(getattr(DailyRollup, name) for name in DAILY_COLUMNS))
+        .where(DailyRollup.user_id == user_id)
+        .order_by(DailyRollup.date)
+    ).all()
+    daily = {"days": np.array([r.date.toordinal() for r in daily_rows], dtype=np.int32)}
+    for i, name in enumerate(DAILY_COLUMNS, start=1):
+        daily[name] = _float_column([r[i] for r in daily_rows])
+
+    activity_rows = db.execute(
+        select(StravaActivity.start_date, StravaActivity.type, StravaActivity.moving_time, StravaActivity.distance)
+        .where(StravaActivity.user_id == user_id, StravaActivity.start_date.isnot(None))
+        .order_by(StravaActivity.start_date)
+    ).all()
+    sport, strava_sports = _encode([r.type for r in activity_rows])
+    activities = {
+        "days": np.array([r.start_date.date().toordinal() for r in activity_rows], dtype=np.int32),
+        "sport": sport,
+        "moving_time": _float_column([r.moving_time for r in activity_rows]),
+        "distance": _float_column([r.distance for r in activity_rows]),
+    }
+
+    workout_rows = db.execute(
+        select(WhoopWorkout.start, WhoopWorkout.end, WhoopWorkout.timezone_offset,
+               WhoopWorkout.sport_name, WhoopWorkout.strain)
+        .where(WhoopWorkout.user_id == user_id, WhoopWorkout.start.isnot(None))
+    ).all()
+    workout_rows = sorted(workout_rows, key=lambda r: rollups.local_day(r.start, r.timezone_offset))
+    sport, whoop_sports = _encode([r.sport_name for r in workout_rows])
+    workouts = {
+        "days": np.array([rollups.local_day(r.start, r.timezone_offset).toordinal() for r in workout_rows], dtype=np.int32),
+        "sport": sport,
+        "duration": _float_column([(r.end - r.start).total_seconds() if r.end else None for r in workout_rows]),
+        "strain": _float_column([r.strain for r in workout_rows]),
+    }
+
+    return {
+        "version": version,
+        "daily": daily,
+        "activities": activities,
+        "workouts": workouts,
+        "strava_sports": strava_sports,
+        "whoop_sports": whoop_sports,
+    }
+
+
+def _snapshot_path(user_id: int, version: int):
+    return os.path.join(ANALYTICS_SNAPSHOT_DIR, str(user_id), f"v{version}")
+
+
+def _save(user_id: int, snapshot: dict):
+    """Write a snapshot's columns as .npy files, published with an atomic rename."""
+    target = _snapshot_path(user_id, snapshot["version"])
+    if os.path.isdir(target):
+        return
+    staging = f"{target}.tmp{os.getpid()}.{threading.get_ident()}"
+    try:
+        os.makedirs(staging)
+        for table, columns in SNAPSHOT_COLUMNS.items():
+            for name in columns:
+                np.save(os.path.join(staging, f"{table}.{name}.npy"), snapshot[table][name])
+        with open(os.path.join(staging, "vocabulary.json"), "w") as f:
+            json.dump({"strava_sports": snapshot["strava_sports"], "whoop_sports": snapshot["whoop_sports"]}, f)
+        os.rename(staging, target)
+    except OSError as e:
+        # Another worker may have published the same version first
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.isdir(target):
+            print(f"Error saving analytics snapshot for user {user_id}: {e}")
+        return
+
+    parent = os.path.dirname(target)
+    for entry in os.listdir(parent):
+        if entry.startswith("v") and entry != os.path.basename(target) and ".tmp" not in entry:
+            shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+
+def _load(user_id: int, version: int):
+    """Memory-map a saved snapshot, or return None if this version isn't on disk."""
+    path = _snapshot_path(user_id, version)
+    try:
+        with open(os.path.join(path, "vocabulary.json")) as f:
+            snapshot = {"version": version, **json.load(f)}
+        for table, columns in SNAPSHOT_COLUMNS.items():
+            snapshot[table] = {
+                name: np.load(os.path.join(path, f"{table}.{name}.npy"), mmap_mode="r") for name in columns
+            }
+        return snapshot
+    except (OSError, ValueError):
+        return None
+
+
+def get_snapshot(db: Session, user_id: int):
+    """Return the user's snapshot for their current history version, building it if needed."""
+    version, _ = resource_versions.current(db, user_id, resource_versions.HISTORY)
+    with _lock:
+        snapshot = _snapshots.get(user_id)
+        if snapshot is not None and snapshot["version"] == version:
+            _snapshots.move_to_end(user_id)
+            return snapshot
+
+    snapshot = _load(user_id, version) if ANALYTICS_SNAPSHOT_DIR else None
+    if snapshot is None:
+        snapshot = build_snapshot(db, user_id, version)
+        if ANALYTICS_SNAPSHOT_DIR:
+            _save(user_id, snapshot)
+
+    with _lock:
+        _snapshots[user_id] = snapshot
+        _snapshots.move_to_end(user_id)
+        while len(_snapshots) > ANALYTICS_CACHE_MAX_USERS:
+            _snapshots.popitem(last=False)
+    return snapshot
+
+
+def clear():
+    """Drop every in-memory snapshot."""
+    with _lock:
+        _snapshots.clear()
+
+
+# --- Queries ---
+
+def _window(table: dict, start: date, end: date):
+    """Return a dict of column views for rows with start <= day <= end."""
+    lo, hi = np.searchsorted(table["days"], [start.toordinal(), end.toordinal() + 1])
+    return {name: column[lo:hi] for name, column in table.items()}
+
+
+def _number(value, digits=1):
+    value = float(value)
+    return None if np.isnan(value) else round(value, digits)
+
+
+def _numbers(values: np.ndarray, digits=1):
+    """Round an array to a JSON-ready list, with None for NaN."""
+    return [None if v != v else v for v in np.round(values, digits).tolist()]
+
+
+def weekly_volume(snapshot: dict, start: date, end: date):
+    """Per-week (Monday-start) totals of activities, distance, time, elevation and training load."""
+    first_monday = start - timedelta(days=start.weekday())
+    weeks = (end - first_monday).days // 7 + 1
+    daily = _window(snapshot["daily"], start, end)
+    week = (daily["days"] - first_monday.toordinal()) // 7
+
+    totals = {
+        name: np.bincount(week, weights=np.nan_to_num(daily[name]), minlength=weeks)
+        for name in ("activity_count", "workout_count", "distance", "moving_time", "elevation_gain",
+                     "kilojoules", "training_load")
+    }
+    return [
+        {
+            "week_start": (first_monday + timedelta(weeks=i)).isoformat(),
+            "activities": int(totals["activity_count"][i]),
+            "workouts": int(totals["workout_count"][i]),
+            "distance": round(float(totals["distance"][i]), 1),  # meters
+            "moving_time": int(totals["moving_time"][i]),  # seconds
+            "elevation_gain": round(float(totals["elevation_gain"][i]), 1),  # meters
+            "kilojoules": round(float(totals["kilojoules"][i]), 1),
+            "training_load": round(float(totals["training_load"][i]), 1),
+        }
+        for i in range(weeks)
+    ]
+
+
+def _rolling_nanmean(values: np.ndarray, window: int):
+    present = ~np.isnan(values)
+    sums = training_load.rolling_sum(np.where(present, values, 0.0), window)
+    counts = training_load.rolling_sum(present.astype(float), window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def hrv_trend(snapshot: dict, start: date, end: date, window: int = 7):
+    """Daily HRV and resting HR with trailing `window`-day averages, plus range statistics."""
+    days = (end - start).days + 1
+    daily = _window(snapshot["daily"], start, end)
+    offsets = daily["days"] - start.toordinal()
+
+    hrv = np.full(days, np.nan)
+    rhr = np.full(days, np.nan)
+    hrv[offsets] = daily["hrv"]
+    rhr[offsets] = daily["resting_heart_rate"]
+    hrv_avg = _rolling_nanmean(hrv, window)
+    rhr_avg = _rolling_nanmean(rhr, window)
+
+    measured = np.flatnonzero(~np.isnan(hrv) | ~np.isnan(rhr))
+    first = start.toordinal()
+    columns = zip(
+        (first + measured).tolist(),
+        *(_numbers(values[measured]) for values in (hrv, rhr, hrv_avg, rhr_avg))
+    )
+    series = [
+        {"date": date.fromordinal(day).isoformat(), "hrv": a, "resting_hr": b, "hrv_avg": c, "resting_hr_avg": d}
+        for day, a, b, c, d in columns
+    ]
+
+    def stats(values):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {"mean": None, "sd": None, "min": None, "max": None, "days": 0}
+        return {
+            "mean": _number(values.mean()),
+            "sd": _number(values.std()),
+            "min": _number(values.min()),
+            "max": _number(values.max()),
+            "days": int(len(values)),
+        }
+
+    return {"window": window, "hrv": stats(hrv), "resting_hr": stats(rhr), "series": series}
+
+
+def recovery_distribution(snapshot: dict, start: date, end: date):
+    """Recovery score zone counts, 10-point histogram and percentiles; sleep performance percentiles."""
+    daily = _window(snapshot["daily"], start, end)
+    scores = np.asarray(daily["recovery_score"])
+    scores = scores[~np.isnan(scores)]
+    sleep = np.asarray(daily["sleep_performance"])
+    sleep = sleep[~np.isnan(sleep)]
+
+    def percentiles(values):
+        if not len(values):
+            return None
+        p10, p25, p50, p75, p90 = np.percentile(values, [10, 25, 50, 75, 90])
+        return {"p10": _number(p10), "p25": _number(p25), "p50": _number(p50), "p75": _number(p75), "p90": _number(p90)}
+
+    counts, edges = np.histogram(scores, bins=np.arange(0, 101, 10))
+    zones = {}
+    for name, low, high in RECOVERY_ZONES:
+        count = int(((scores >= low) & (scores < high)).sum())
+        zones[name] = {"days": count, "share": round(count / len(scores), 3) if len(scores) else None}
+
+    return {
+        "days": int(len(scores)),
+        "mean": _number(scores.mean()) if len(scores) else None,
+        "zones": zones,
+        "histogram": [
+            {"from": int(edges[i]), "to": int(edges[i + 1]), "days": int(counts[i])} for i in range(len(counts))
+        ],
+        "percentiles": percentiles(scores),
+        "sleep_performance": percentiles(sleep),
+    }
+
+
+def sport_mix(snapshot: dict, start: date, end: date, source: str = "strava"):
+    """Per-sport session count, time and share of total time from Strava activities or WHOOP workouts."""
+    if source == "whoop":
+        table, vocabulary, time_column = snapshot["workouts"], snapshot["whoop_sports"], "duration"
+    else:
+        table, vocabulary, time_column = snapshot["activities"], snapshot["strava_sports"], "moving_time"
+
+    rows = _window(table, start, end)
+    codes = np.asarray(rows["sport"], dtype=np.intp)
+    sessions = np.bincount(codes, minlength=len(vocabulary))
+    seconds = np.bincount(codes, weights=np.nan_to_num(rows[time_column]), minlength=len(vocabulary))
+    total = seconds.sum()
+
+    if source == "whoop":
+        strain = np.asarray(rows["strain"])
+        scored = ~np.isnan(strain)
+        strain_sum = np.bincount(codes[scored], weights=strain[scored], minlength=len(vocabulary))
+        strain_n = np.bincount(codes[scored], minlength=len(vocabulary))
+    else:
+        distance = np.bincount(codes, weights=np.nan_to_num(rows["distance"]), minlength=len(vocabulary))
+
+    mix = []
+    for i in np.argsort(-seconds, kind="stable"):
+        if not sessions[i]:
+            continue
+        entry = {
+            "sport": vocabulary[i],
+            "sessions": int(sessions[i]),
+            "time": int(seconds[i]),  # seconds
+            "share": round(float(seconds[i] / total), 3) if total else None,
+        }
+        if source == "whoop":
+            entry["avg_strain"] = _number(strain_sum[i] / strain_n[i]) if strain_n[i] else None
+        else:
+            entry["distance"] = round(float(distance[i]), 1)  # meters
+        mix.append(entry)
+
+    return {"source": source, "total_time": int(total), "sports": mix}
+
+
+def _intensity_shares(minutes: dict):
+    """Return low/moderate/high shares of training time, the Treff polarization index and a label."""
+    total = sum(minutes.values())
+    if total <= 0:
+        return {"low_share": None, "moderate_share": None, "high_share": None,
+                "polarization_index": None, "distribution": None, "meets_80_20": None}
+    low, moderate, high = (minutes[name] / total for name, _ in INTENSITY_ZONES)
+
+    # Treff et al. (2019): log10(low / moderate * high * 100) over time shares,
+    # with no high time counted as 1%; above 2 is polarized. Needs low and moderate time.
+    index = float(np.log10(low / moderate * max(high, 0.01) * 100)) if low > 0 and moderate > 0 else None
+
+    largest = max(low, moderate, high)
+    if low > high > moderate and (index is None or index > 2):
+        distribution = "polarized"
+    elif largest == low:
+        distribution = "pyramidal"
+    elif largest == moderate:
+        distribution = "threshold"
+    else:
+        distribution = "high_intensity"
+
+    return {
+        "low_share": round(low, 3),
+        "moderate_share": round(moderate, 3),
+        "high_share": round(high, 3),
+        "polarization_index": None if index is None else round(index, 2),
+        "distribution": distribution,
+        "meets_80_20": low >= LOW_INTENSITY_TARGET,
+    }
+
+
+def intensity_distribution(snapshot: dict, start: date, end: date):
+    """
+    Weekly (Monday-start) time in each WHOOP heart rate zone, grouped into
+    low/moderate/high intensity, with the range's 80/20 split and polarization.
+    """
+    first_monday = start - timedelta(days=start.weekday())
+    weeks = (end - first_monday).days // 7 + 1
+    daily = _window(snapshot["daily"], start, end)
+    week = (daily["days"] - first_monday.toordinal()) // 7
+
+    # (zones, weeks) matrix of minutes per zone per week
+    zones = np.vstack([
+        np.bincount(week, weights=np.nan_to_num(daily[f"zone{zone}_minutes"]), minlength=weeks)
+        for zone in range(rollups.ZONES)
+    ])
+    groups = {name: zones[list(members)].sum(axis=0) for name, members in INTENSITY_ZONES}
+    training = sum(groups.values())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        low_share = np.where(training > 0, groups["low"] / training, np.nan)
+
+    low, moderate, high = (_numbers(groups[name]) for name, _ in INTENSITY_ZONES)
+    zone_lists = [_numbers(zones[zone]) for zone in range(rollups.ZONES)]
+    weekly = [
+        {
+            "week_start": (first_monday + timedelta(weeks=i)).isoformat(),
+            "zone_minutes": [zone_list[i] for zone_list in zone_lists],
+            "low_minutes": low[i],
+            "moderate_minutes": moderate[i],
+            "high_minutes": high[i],
+            "low_share": share,
+        }
+        for i, share in enumerate(_numbers(low_share, 3))
+    ]
+
+    totals = {name: float(groups[name].sum()) for name, _ in INTENSITY_ZONES}
+    scored_weeks = training > 0
+    return {
+        "zone_minutes": _numbers(zones.sum(axis=1)),
+        **{f"{name}_minutes": round(minutes, 1) for name, minutes in totals.items()},
+        **_intensity_shares(totals),
+        "weeks_meeting_80_20": int((low_share[scored_weeks] >= LOW_INTENSITY_TARGET).sum()),
+        "weeks_with_zone_data": int(scored_weeks.sum()),
+        "weeks": weekly,
+    }
+
+
+def intensity_summary(snapshot: dict, end: date, days: int = 28):
+    """Compact intensity split over the last `days` days for the coach context, or None without zone data."""
+    result = intensity_distribution(snapshot, end - timedelta(days=days - 1), end)
+    if not result["weeks_with_zone_data"]:
+        return None
+    return {
+        "days": days,
+        "low_minutes": round(result["low_minutes"]),
+        "moderate_minutes": round(result["moderate_minutes"]),
+        "high_minutes": round(result["high_minutes"]),
+        "low_share": result["low_share"],
+        "high_share": result["high_share"],
+        "distribution": result["distribution"],
+        "meets_80_20": result["meets_80_20"],
+    }
@@ -0,0 +1,64 @@
+"""
+Context cache — in-process snapshots of each user's coaching context.
+
+`ai_coach.get_context` is called on every plan request and every chat-edit
+turn. Snapshots are keyed by user and calendar day (the context's lookback
+windows move at midnight) and are invalidated whenever the underlying data
+changes: ingestion, goal CRUD and settings updates. A TTL bounds staleness
+for writes made by other processes.
+"""
+
+import copy
+import os
+import threading
+import time
+from datetime import date
+
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("CONTEXT_CACHE_TTL_SECONDS", "600"))
+
+_snapshots = {}  # user_id -> (day, built_at, context)
+_generations = {}  # user_id -> invalidation count
+_lock = threading.Lock()
+
+
+def generation(user_id: int):
+    """Return the user's invalidation counter; read it before building a context."""
+    with _lock:
+        return _generations.get(user_id, 0)
+
+
+def get(user_id: int, day: date):
+    """Return a copy of the cached context for a user and day, or None."""
+    with _lock:
+        entry = _snapshots.get(user_id)
+    if entry is None:
+        return None
+
+    snapshot_day, built_at, context = entry
+    if snapshot_day != day or time.monotonic() - built_at > CONTEXT_CACHE_TTL_SECONDS:
+        return None
+    return copy.deepcopy(context)
+
+
+def put(user_id: int, day: date, context: dict, built_generation: int):
+    """
+    Store a context snapshot for a user and day, unless the user was
+    invalidated while it was being built (the snapshot may be stale).
+    """
+    with _lock:
+        if _generations.get(user_id, 0) != built_generation:
+            return
+        _snapshots[user_id] = (day, time.monotonic(), copy.deepcopy(context))
+
+
+def invalidate(user_id: int):
+    """Drop a user's snapshot after their activities, recoveries, goals or settings change."""
+    with _lock:
+        _snapshots.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def clear():
+    """Drop every snapshot."""
+    with _lock:
+        _snapshots.clear()
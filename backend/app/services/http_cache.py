@@ -0,0 +1,84 @@
+"""
+HTTP cache — conditional GET handling for the dashboard's read endpoints.
+
+ETag and Last-Modified come from the per-user resource version (see
+resource_versions), so a revalidation that matches If-None-Match or
+If-Modified-Since is answered with an empty 304 before the payload is
+loaded or serialized. `Cache-Control: private, no-cache` lets browsers keep
+the body but revalidate on every mount.
+"""
+
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session
+from ..responses import FastJSONResponse
+from . import resource_versions
+
+DEFAULT_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(path: str, user_id: int, resource: str, version: int, variant: str = ""):
+    """Return a quoted strong ETag for one version of a user's resource, as served at `path`."""
+    raw = f"{path}:{user_id}:{resource}:{version}:{variant}"
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+
+def matches(request: Request, etag: str):
+    """Return True if the request's If-None-Match header matches `etag`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def not_modified_since(request: Request, updated_at: datetime):
+    """Return True if If-Modified-Since is at or after `updated_at` (naive UTC)."""
+    header = request.headers.get("if-modified-since")
+    if not header or updated_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have one-second resolution
+    return updated_at.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def conditional_json(request: Request, db: Session, user_id: int, resource: str, build,
+                     variant: str = "", cache_control: str = DEFAULT_CACHE_CONTROL):
+    """
+    Answer a GET for a versioned resource view.
+
+    Args:
+        build: Zero-argument callable returning the payload; only called when
+            the client's copy is stale.
+        variant: Anything besides the version and path that changes the
+            view, e.g. a resolved date range. Views with a variant ignore
+            If-Modified-Since, since the variant can change without a write.
+
+    Returns:
+        An empty 304, or the JSON payload with ETag/Last-Modified headers.
+    """
+    version, updated_at = resource_versions.current(db, user_id, resource)
+    headers = {
+        "ETag": make_etag(request.url.path, user_id, resource, version, variant),
+        "Cache-Control": cache_control,
+    }
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+
+    # If-None-Match takes precedence; If-Modified-Since is only a fallback
+    if "if-none-match" in request.headers:
+        fresh = matches(request, headers["ETag"])
+    else:
+        fresh = not variant and not_modified_since(request, updated_at)
+    if fresh:
+        return Response(status_code=304, headers=headers)
+
+    return FastJSONResponse(jsonable_encoder(build()), headers=headers)
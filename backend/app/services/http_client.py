@@ -0,0 +1,164 @@
+"""
+HTTP client — shared, pooled HTTP sessions for external API calls.
+
+All Strava, WHOOP and OAuth requests go through this module so they reuse
+keep-alive connections instead of opening a fresh TCP+TLS connection per
+call. Every request has a timeout and is retried with jittered exponential
+backoff on connection errors, 429 and 5xx responses. Non-idempotent
+methods (POST, e.g. OAuth code exchanges and refresh-token rotation) are
+only retried on 429 and connect-phase failures, never after a read timeout
+or dropped connection, since the server may already have acted on them.
+Sync callers use `request`/`get`/`post`; async callers use
+`arequest`/`aget`/`apost`, backed by a shared httpx client.
+
+Multi-request exchanges such as pagination are written once as generators
+that yield each request and receive its response; `drive` and `adrive` run
+them over sync or async I/O.
+"""
+
+import asyncio
+import os
+import random
+import time
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_MAX_BACKOFF = float(os.getenv("HTTP_MAX_BACKOFF", "60"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=HTTP_POOL_SIZE)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+_async_client = None
+
+
+def _should_retry(method: str, status_code: int):
+    if status_code == 429:
+        return True
+    return method.upper() in IDEMPOTENT_METHODS and status_code in RETRY_STATUSES
+
+
+def _should_retry_error(method: str, error: Exception, connect_errors: tuple):
+    """Idempotent requests retry any transport error; others only if the request never reached the server."""
+    return method.upper() in IDEMPOTENT_METHODS or isinstance(error, connect_errors)
+
+
+def _backoff(attempt: int, retry_after: str = None):
+    """Seconds to wait before the next attempt: Retry-After if given, else full-jitter exponential."""
+    if retry_after:
+        try:
+            return min(float(retry_after), HTTP_MAX_BACKOFF)
+        except ValueError:
+            pass
+    return random.uniform(0, min(HTTP_BACKOFF_BASE * 2 ** attempt, HTTP_MAX_BACKOFF))
+
+
+def request(method: str, url: str, timeout=None, retries: int = None, **kwargs):
+    """
+    Send a request on the shared pooled session and return the final response.
+    Non-2xx responses are returned, not raised; connection errors are raised
+    once retries are exhausted.
+    """
+    timeout = timeout or (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+    retries = HTTP_MAX_RETRIES if retries is None else retries
+
+    for attempt in range(retries + 1):
+        try:
+            response = _session.request(method, url, timeout=timeout, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == retries or not _should_retry_error(method, e, (requests.ConnectTimeout,)):
+                raise
+            time.sleep(_backoff(attempt))
+            continue
+
+        if attempt == retries or not _should_retry(method, response.status_code):
+            return response
+        time.sleep(_backoff(attempt, response.headers.get("Retry-After")))
+
+
+def get(url: str, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+        )
+    return _async_client
+
+
+async def arequest(method: str, url: str, timeout=None, retries: int = None, **kwargs):
+    """Async counterpart of `request`, using the shared httpx client."""
+    client = _get_async_client()
+    retries = HTTP_MAX_RETRIES if retries is None else retries
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+
+    for attempt in range(retries + 1):
+        try:
+            response = await client.request(method, url, **kwargs)
+        except (httpx.ConnectError, httpx.TimeoutException) as e:
+            if attempt == retries or not _should_retry_error(method, e, (httpx.ConnectError, httpx.ConnectTimeout)):
+                raise
+            await asyncio.sleep(_backoff(attempt))
+            continue
+
+        if attempt == retries or not _should_retry(method, response.status_code):
+            return response
+        await asyncio.sleep(_backoff(attempt, response.headers.get("Retry-After")))
+
+
+async def aget(url: str, **kwargs):
+    return await arequest("GET", url, **kwargs)
+
+
+async def apost(url: str, **kwargs):
+    return await arequest("POST", url, **kwargs)
+
+
+async def aclose():
+    """Close the shared async client (called on app shutdown)."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def drive(exchange, send):
+    """
+    Run an exchange generator: each value it yields is passed to `send`, the
+    result is sent back in, and the generator's return value is returned.
+    """
+    try:
+        outgoing = next(exchange)
+        while True:
+            outgoing = exchange.send(send(outgoing))
+    except StopIteration as done:
+        return done.value
+
+
+async def adrive(exchange, send):
+    """Async counterpart of `drive`; `send` returns an awaitable."""
+    try:
+        outgoing = next(exchange)
+        while True:
+            outgoing = exchange.send(await send(outgoing))
+    except StopIteration as done:
+        return done.value
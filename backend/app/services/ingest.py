@@ -0,0 +1,97 @@
+"""
+Ingestion helpers — set-based upserts for records synced from external APIs.
+
+Instead of one SELECT per incoming record, existing rows are found with a
+single IN query per chunk of external ids, new rows are written with one
+executemany INSERT, and changed fields on existing rows with one bulk UPDATE.
+Lookups and updates are scoped to the user each row belongs to, so one
+user's sync can never modify another user's records.
+"""
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.orm import Session
+
+# Keeps IN lists under SQLite's bound-parameter limit
+IN_CHUNK_SIZE = 500
+
+
+def bulk_upsert(db: Session, model, key: str, rows: list):
+    """
+    Insert new rows and update changed fields on existing rows of `model`,
+    matching on the unique external-id column `key` within each row's
+    `user_id`. Records whose key already belongs to another user are skipped.
+
+    Incoming None values never overwrite a stored value, so a partial record
+    (e.g. a score that hasn't been computed yet) can't erase earlier data.
+    Does not commit.
+
+    Returns:
+        (inserted, updated) — lists of the row dicts that were written.
+    """
+    if not rows:
+        return [], []
+
+    # Last occurrence wins if the API returned the same record twice
+    by_key = {(row["user_id"], row[key]): row for row in rows}
+    fields = sorted({field for row in by_key.values() for field in row})
+    key_column = getattr(model, key)
+    columns = [model.id] + [getattr(model, field) for field in fields]
+
+    existing = {}
+    for user_id, chunk in _key_chunks(by_key):
+        query = select(*columns).where(model.user_id == user_id, key_column.in_(chunk))
+        for row in db.execute(query):
+            existing[(user_id, row._mapping[key])] = row._mapping
+
+    inserted, updated = [], []
+    for k, row in by_key.items():
+        current = existing.get(k)
+        if current is None:
+            inserted.append(row)
+            continue
+
+        changes = {
+            field: value for field, value in row.items()
+            if value is not None and current[field] != value
+        }
+        if changes:
+            updated.append({"id": current["id"], "owner_id": row["user_id"], **changes})
+
+    inserted = _drop_claimed_by_others(db, model, key, inserted)
+    if inserted:
+        db.execute(insert(model), inserted)
+    if updated:
+        db.execute(
+            update(model).where(model.user_id == bindparam("owner_id"))
+            .execution_options(synchronize_session=None),
+            updated
+        )
+        for row in updated:
+            del row["owner_id"]
+
+    return inserted, updated
+
+
+def _key_chunks(by_key: dict):
+    """Yield (user_id, external ids) in IN-list sized chunks."""
+    keys_by_user = {}
+    for user_id, k in by_key:
+        keys_by_user.setdefault(user_id, []).append(k)
+    for user_id, keys in keys_by_user.items():
+        for i in range(0, len(keys), IN_CHUNK_SIZE):
+            yield user_id, keys[i:i + IN_CHUNK_SIZE]
+
+
+def _drop_claimed_by_others(db: Session, model, key: str, rows: list):
+    """Drop new rows whose external id is already stored for a different user."""
+    if not rows:
+        return rows
+
+    key_column = getattr(model, key)
+    taken = set()
+    keys = [row[key] for row in rows]
+    for i in range(0, len(keys), IN_CHUNK_SIZE):
+        taken.update(db.execute(select(key_column).where(key_column.in_(keys[i:i + IN_CHUNK_SIZE]))).scalars())
+    if taken:
+        print(f"Skipping {len(taken)} {model.__tablename__} record(s) already stored for another user")
+    return [row for row in rows if row[key] not in taken]
@@ -0,0 +1,214 @@
+"""
+LLM cache — persistent, content-addressed cache for chat completions.
+
+Completions are keyed by a SHA-256 hash of the model, the response format and
+the normalized prompt messages, so identical inputs (same block, recoveries,
+goals, chat history) are served from the database without an API call.
+Entries expire after a TTL and the table is trimmed to a maximum size by
+least-recent use. Writes are upserts, so concurrent misses on the same
+prompt don't collide, and a failed cache write never fails the completion.
+`acached_completion` is the asyncio counterpart for
+AsyncOpenAI clients; its cache reads and writes run on a worker thread.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from ..database import SessionLocal
+from ..models import LLMCacheEntry
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+
+_stats = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _normalize(text: str):
+    """Strip per-line indentation and blank lines so prompt formatting doesn't change the key."""
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def make_key(model: str, messages: list, response_format: dict = None):
+    """Return the cache key for a completion request."""
+    payload = {
+        "model": model,
+        "response_format": response_format,
+        "messages": [
+            {"role": m["role"], "content": _normalize(m["content"])}
+            for m in messages
+        ]
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get(key: str):
+    """Return the cached response text for a key, or None if missing or expired."""
+    db = SessionLocal()
+    try:
+        entry = db.get(LLMCacheEntry, key)
+        if not entry:
+            return None
+
+        now = datetime.utcnow()
+        if entry.created_at < now - timedelta(seconds=LLM_CACHE_TTL_SECONDS):
+            db.delete(entry)
+            db.commit()
+            return None
+
+        entry.last_used_at = now
+        entry.hits = (entry.hits or 0) + 1
+        db.commit()
+        return entry.response
+    finally:
+        db.close()
+
+
+def put(key: str, model: str, response: str):
+    """Store a response and evict least-recently-used entries beyond the size limit."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        values = {"key": key, "model": model, "response": response, "created_at": now, "last_used_at": now, "hits": 0}
+        dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(db.get_bind().dialect.name)
+        if dialect is None:
+            db.merge(LLMCacheEntry(**values))
+            db.flush()
+        else:
+            # Another worker may have stored the same prompt since our lookup missed
+            statement = dialect.insert(LLMCacheEntry).values(**values)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[LLMCacheEntry.key],
+                set_={"model": model, "response": response, "created_at": now, "last_used_at": now}
+            ))
+
+        overflow = db.query(func.count(LLMCacheEntry.key)).scalar() - LLM_CACHE_MAX_ENTRIES
+        if overflow > 0:
+            stale_keys = [
+                row.key for row in db.query(LLMCacheEntry.key)
+                .order_by(LLMCacheEntry.last_used_at)
+                .limit(overflow)
+            ]
+            db.query(LLMCacheEntry).filter(
+                LLMCacheEntry.key.in_(stale_keys)
+            ).delete(synchronize_session=False)
+            _count("evictions", len(stale_keys))
+
+        db.commit()
+    finally:
+        db.close()
+
+
+def lookup(model: str, messages: list, response_format: dict = None, use_cache: bool = True):
+    """
+    Compute the key for a request and look it up, updating the hit/miss counters.
+    Returns (key, cached_text) where cached_text is None on a miss or bypass.
+    """
+    key = make_key(model, messages, response_format)
+
+    if not (use_cache and LLM_CACHE_ENABLED):
+        _count("bypassed")
+        return key, None
+
+    cached = get(key)
+    _count("hits" if cached is not None else "misses")
+    return key, cached
+
+
+def store(key: str, model: str, response: str):
+    """
+    Store a fresh response unless caching is disabled globally. Failures are
+    logged, not raised: the completion has already been paid for.
+    """
+    if not LLM_CACHE_ENABLED:
+        return
+    try:
+        put(key, model, response)
+    except Exception as e:
+        print(f"LLM cache write failed for {key[:12]}: {e}")
+
+
+def cached_completion(client, model: str, messages: list, use_cache: bool = True,
+                      response_format: dict = None, parse=None, **kwargs):
+    """
+    Return the message content of a chat completion, served from the cache
+    when possible. Pass use_cache=False (or set LLM_CACHE_ENABLED=0) to force
+    a fresh call; the fresh result still refreshes the cache entry.
+
+    With `parse` (e.g. json.loads), the parsed content is returned and a fresh
+    completion is only cached if it parses, so a truncated or malformed reply
+    is never replayed from the cache.
+    """
+    parse = parse or (lambda content: content)
+    key, cached = lookup(model, messages, response_format, use_cache)
+    if cached is not None:
+        return parse(cached)
+
+    request = {"model": model, "messages": messages, **kwargs}
+    if response_format is not None:
+        request["response_format"] = response_format
+    completion = client.chat.completions.create(**request)
+    content = completion.choices[0].message.content
+
+    result = parse(content)
+    store(key, model, content)
+    return result
+
+
+async def acached_completion(client, model: str, messages: list, use_cache: bool = True,
+                             response_format: dict = None, parse=None, **kwargs):
+    """Async counterpart of `cached_completion` for an AsyncOpenAI client."""
+    parse = parse or (lambda content: content)
+    key, cached = await asyncio.to_thread(lookup, model, messages, response_format, use_cache)
+    if cached is not None:
+        return parse(cached)
+
+    request = {"model": model, "messages": messages, **kwargs}
+    if response_format is not None:
+        request["response_format"] = response_format
+    completion = await client.chat.completions.create(**request)
+    content = completion.choices[0].message.content
+
+    result = parse(content)
+    await asyncio.to_thread(store, key, model, content)
+    return result
+
+
+def get_stats():
+    """Return hit/miss counters for this process plus the current entry count."""
+    with _stats_lock:
+        stats = dict(_stats)
+
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else None
+    stats["enabled"] = LLM_CACHE_ENABLED
+
+    db = SessionLocal()
+    try:
+        stats["entries"] = db.query(func.count(LLMCacheEntry.key)).scalar()
+    finally:
+        db.close()
+    return stats
+
+
+def clear():
+    """Delete every cached entry. Returns the number removed."""
+    db = SessionLocal()
+    try:
+        removed = db.query(LLMCacheEntry).delete()
+        db.commit()
+        return removed
+    finally:
+        db.close()
@@ -0,0 +1,232 @@
+"""
+Prompt compiler — compact, token-budgeted prompts for the AI coach.
+
+A prompt is a list of parts: fixed text (role, instructions, output format)
+and context sections built with `section`. Section values are serialized as
+compact JSON, with None fields dropped and lists of like records written as
+a column header plus rows, so repeated keys aren't paid for on every record.
+
+`compile_prompt` counts tokens (with tiktoken when its encoding can be
+loaded, otherwise a conservative estimate) and, while the prompt is over its
+budget, shrinks the lowest-priority section first: lists keep their most
+recent items (halving down to `min_items`), then the section is dropped
+unless it has a `min_items` floor. Priority 0 sections and fixed text are
+never cut. Per-prompt size counters are kept for this process (see
+`get_stats`).
+"""
+
+import math
+import os
+import re
+import threading
+from functools import lru_cache
+from ..responses import dumps
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "2000"))
+# Separate budget for the chat turns sent with a plan edit
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.getenv("PROMPT_HISTORY_TOKEN_BUDGET", "1500"))
+# Encoding for models tiktoken doesn't know yet
+DEFAULT_ENCODING = "o200k_base"
+# Without tiktoken: BPE tokens rarely span more than ~4 characters of a word,
+# and punctuation is usually its own token
+_TOKEN_ESTIMATE = re.compile(r"\w{1,4}|[^\w\s]")
+
+_stats = {}  # prompt name -> counters
+_stats_lock = threading.Lock()
+
+
+# --- Serialization ---
+
+def _prune(value):
+    """Drop None fields from dicts, recursively."""
+    if isinstance(value, dict):
+        return {k: _prune(v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [_prune(v) for v in value]
+    return value
+
+
+def _tabulate(value):
+    """Rewrite lists of two or more dicts as {"columns": [...], "rows": [[...], ...]}."""
+    if isinstance(value, dict):
+        return {k: _tabulate(v) for k, v in value.items()}
+    if isinstance(value, list):
+        if len(value) > 1 and all(isinstance(v, dict) for v in value):
+            columns = list(dict.fromkeys(k for v in value for k in v))
+            return {"columns": columns, "rows": [[_tabulate(v.get(k)) for k in columns] for v in value]}
+        return [_tabulate(v) for v in value]
+    return value
+
+
+def compact(value):
+    """Serialize a context value as compact JSON (strings are passed through as-is)."""
+    if isinstance(value, str):
+        return value
+    return dumps(_tabulate(_prune(value))).decode("utf-8")
+
+
+# --- Token counting ---
+
+@lru_cache(maxsize=16)
+def _encoding(model: str):
+    """
+    Return the tiktoken encoding for `model`, or None if it can't be loaded
+    (tiktoken isn't installed, or its BPE file can't be downloaded).
+    """
+    if tiktoken is None:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        print(f"tiktoken encoding unavailable for {model or 'default model'}, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = None):
+    """Return the number of tokens in `text` for `model` (estimated if tiktoken is unavailable)."""
+    encoding = _encoding(model or "")
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(_TOKEN_ESTIMATE.findall(text))
+
+
+# --- Compilation ---
+
+def section(label: str, value, priority: int = 1, min_items: int = 0, note: str = None, empty: str = "No Data"):
+    """
+    A context section rendered as "- {label}: {value}".
+
+    Args:
+        value: A string, or anything JSON-serializable. Lists are truncated
+            from the front (oldest first) when the prompt is over budget.
+        priority: 0 is never cut; higher numbers are cut first.
+        min_items: Items a list always keeps; with 0 the section can be dropped.
+        note: Indented explanation printed under the line, dropped with it.
+        empty: Text shown when the value is empty or None.
+    """
+    return {"label": label, "value": value, "priority": priority, "min_items": min_items, "note": note, "empty": empty}
+
+
+def _render(part: dict, value):
+    text = f"- {part['label']}: {compact(value) if value not in (None, [], {}, '') else part['empty']}"
+    if part["note"]:
+        text += "\n" + "\n".join(f"  {line.strip()}" for line in part["note"].strip().splitlines())
+    return text
+
+
+def compile_prompt(name: str, parts: list, model: str = None, budget: int = None):
+    """
+    Render prompt parts (strings and sections) to one string within the token budget.
+
+    Returns:
+        (prompt, metrics) — metrics has the final and uncut token counts, the
+        budget, and the labels of truncated and dropped sections.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    values = {i: part["value"] for i, part in enumerate(parts) if isinstance(part, dict)}
+    rendered = {i: (part if isinstance(part, str) else _render(part, values[i])) for i, part in enumerate(parts)}
+    tokens = {i: count_tokens(text, model) for i, text in rendered.items()}
+    full_tokens = total = sum(tokens.values()) + len(parts)
+
+    truncated, dropped = [], []
+    # Cut order: highest priority number first, later sections first within a priority
+    candidates = sorted(
+        (i for i in values if parts[i]["priority"] > 0),
+        key=lambda i: (-parts[i]["priority"], -i)
+    )
+    for i in candidates:
+        part = parts[i]
+        while total > budget and i in rendered:
+            value = values[i]
+            if isinstance(value, list) and len(value) > max(part["min_items"], 1):
+                values[i] = value[-max(len(value) // 2, part["min_items"], 1):]
+                if part["label"] not in truncated:
+                    truncated.append(part["label"])
+                rendered[i] = _render(part, values[i])
+            elif part["min_items"]:
+                break
+            else:
+                del rendered[i]
+                dropped.append(part["label"])
+
+            new_tokens = count_tokens(rendered[i], model) if i in rendered else 0
+            total += new_tokens - tokens[i]
+            tokens[i] = new_tokens
+        if total <= budget:
+            break
+
+    prompt = "\n".join(rendered[i] for i in sorted(rendered))
+    prompt_tokens = count_tokens(prompt, model)
+    metrics = {
+        "name": name,
+        "tokens": prompt_tokens,
+        "full_tokens": full_tokens if truncated or dropped else prompt_tokens,
+        "budget": budget,
+        "truncated": truncated,
+        "dropped": dropped,
+    }
+    _record(metrics)
+    return prompt, metrics
+
+
+def fit_messages(messages: list, model: str = None, budget: int = None):
+    """
+    Return the most recent chat messages that fit in the history budget,
+    always keeping the last one.
+    """
+    budget = budget or PROMPT_HISTORY_TOKEN_BUDGET
+    kept, used = [], 0
+    for message in reversed(messages):
+        cost = count_tokens(message["content"], model) + 4
+        if kept and used + cost > budget:
+            break
+        kept.append(message)
+        used += cost
+    return kept[::-1]
+
+
+# --- Metrics ---
+
+def _record(metrics: dict):
+    with _stats_lock:
+        stats = _stats.setdefault(metrics["name"], {
+            "prompts": 0, "tokens": 0, "full_tokens": 0, "max_tokens": 0,
+            "over_budget": 0, "truncated": 0, "dropped": 0,
+        })
+        stats["prompts"] += 1
+        stats["tokens"] += metrics["tokens"]
+        stats["full_tokens"] += metrics["full_tokens"]
+        stats["max_tokens"] = max(stats["max_tokens"], metrics["tokens"])
+        stats["over_budget"] += metrics["tokens"] > metrics["budget"]
+        stats["truncated"] += bool(metrics["truncated"])
+        stats["dropped"] += bool(metrics["dropped"])
+
+
+def get_stats():
+    """Return per-prompt size counters for this process (mean, max and savings from budgeting)."""
+    with _stats_lock:
+        stats = {name: dict(counters) for name, counters in _stats.items()}
+
+    for counters in stats.values():
+        prompts = counters["prompts"]
+        counters["mean_tokens"] = math.ceil(counters["tokens"] / prompts) if prompts else None
+        counters["tokens_saved"] = counters["full_tokens"] - counters["tokens"]
+    return {
+        "budget": PROMPT_TOKEN_BUDGET,
+        "tokenizer": "tiktoken" if _encoding("") is not None else "estimate",
+        "prompts": stats,
+    }
+
+
+def clear_stats():
+    """Reset the per-prompt counters."""
+    with _stats_lock:
+        _stats.clear()
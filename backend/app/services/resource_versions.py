@@ -0,0 +1,48 @@
+"""
+Resource versions — per-user change counters for cacheable API reads.
+
+Every write to a user's profile, goals, schedule or synced history bumps the matching
+counter in the same transaction. Readers derive ETag and Last-Modified from
+the counter alone, so an unchanged view is answered without loading or
+serializing the underlying rows.
+"""
+
+from datetime import datetime
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import Session
+from ..models import ResourceVersion
+
+# Profile fields and settings, including the weekly schedule template
+PROFILE = "profile"
+GOALS = "goals"
+# Materialized workout blocks
+SCHEDULE = "schedule"
+# Synced activities, workouts and recoveries (bumped by daily rollup refreshes)
+HISTORY = "history"
+
+
+def bump(db: Session, user_id: int, *resources: str):
+    """Increment the version of each resource for a user. Does not commit."""
+    now = datetime.utcnow()
+    for resource in resources:
+        result = db.execute(
+            update(ResourceVersion)
+            .where(ResourceVersion.user_id == user_id, ResourceVersion.resource == resource)
+            .values(version=ResourceVersion.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            db.execute(insert(ResourceVersion).values(
+                user_id=user_id, resource=resource, version=1, updated_at=now
+            ))
+
+
+def current(db: Session, user_id: int, resource: str):
+    """
+    Return (version, updated_at) for a user's resource. Resources never
+    written since versioning was added report (0, None).
+    """
+    row = db.execute(
+        select(ResourceVersion.version, ResourceVersion.updated_at)
+        .where(ResourceVersion.user_id == user_id, ResourceVersion.resource == resource)
+    ).first()
+    return (row.version, row.updated_at) if row else (0, None)
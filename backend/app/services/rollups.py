@@ -0,0 +1,218 @@
+"""
+Daily rollups — per-user daily aggregates of activities, workouts and recovery.
+
+Range reads (training load, prompt context, analytics) use `daily_rollups`,
+one compact row per user per day, instead of re-scanning raw
+`strava_activities`, `whoop_recoveries` and `whoop_workouts` history.
+
+Ingestion keeps the table current: after each upsert, `refresh` recomputes
+the span of days the batch touched from the raw rows and replaces it with one
+DELETE and one upsert, so late-arriving scores and re-synced records are
+reflected exactly. The upsert (ON CONFLICT DO UPDATE on PostgreSQL and
+SQLite) lets overlapping syncs for the same user both write a day without
+a primary key violation. `rebuild` recomputes a user's whole history. Both bump
+the user's `history` resource version, which keys analytics snapshots.
+
+    python -m app.services.rollups rebuild             # every user
+    python -m app.services.rollups rebuild <user_id>   # one user
+"""
+
+import sys
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import DailyRollup, StravaActivity, User, WhoopRecovery, WhoopWorkout
+from . import resource_versions, training_load
+
+# WHOOP heart rate zones, zone 0 (below zone 1) through zone 5
+ZONES = 6
+# WHOOP workout starts are UTC; widening a query by the largest UTC offset
+# catches every workout that falls on a local day
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+
+def parse_utc_offset(offset: str):
+    """Parse a "+HH:MM" / "-HH:MM" offset as a timedelta (zero if missing or malformed)."""
+    if not offset:
+        return timedelta(0)
+    try:
+        sign = -1 if offset[0] == "-" else 1
+        hours, minutes = offset.lstrip("+-").split(":")
+        return sign * timedelta(hours=int(hours), minutes=int(minutes))
+    except (ValueError, IndexError):
+        return timedelta(0)
+
+
+def local_day(start: datetime, offset: str):
+    """Return the athlete's local calendar day for a naive-UTC start time."""
+    return (start + parse_utc_offset(offset)).date()
+
+
+def _empty_row(user_id: int, day: date):
+    row = {
+        "user_id": user_id, "date": day,
+        "activity_count": 0, "distance": 0.0, "moving_time": 0, "elevation_gain": 0.0, "suffer_score": None,
+        "workout_count": 0, "strain": None, "kilojoules": None,
+        "training_load": 0.0,
+        "recovery_score": None, "hrv": None, "resting_heart_rate": None, "sleep_performance": None,
+    }
+    for zone in range(ZONES):
+        row[f"zone{zone}_minutes"] = 0.0
+    return row
+
+
+def _within(day: date, start: date, end: date):
+    return (start is None or day >= start) and (end is None or day <= end)
+
+
+def aggregate(db: Session, user_id: int, start: date = None, end: date = None):
+    """
+    Compute rollup rows for a user's days in [start, end] (unbounded when
+    None) from the raw tables. Returns {day: row dict} for days with any data.
+    """
+    rows = {}
+    strava_load, whoop_load = {}, {}
+
+    def row(day):
+        if day not in rows:
+            rows[day] = _empty_row(user_id, day)
+        return rows[day]
+
+    query = select(
+        StravaActivity.start_date, StravaActivity.distance, StravaActivity.moving_time,
+        StravaActivity.total_elevation_gain, StravaActivity.suffer_score
+    ).where(StravaActivity.user_id == user_id)
+    if start is not None:
+        query = query.where(StravaActivity.start_date >= datetime.combine(start, datetime.min.time()))
+    if end is not None:
+        query = query.where(StravaActivity.start_date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+
+    # Strava start_date is already the athlete's local time
+    for act in db.execute(query):
+        day = act.start_date.date()
+        r = row(day)
+        r["activity_count"] += 1
+        r["distance"] += act.distance or 0.0
+        r["moving_time"] += act.moving_time or 0
+        r["elevation_gain"] += act.total_elevation_gain or 0.0
+        if act.suffer_score is not None:
+            r["suffer_score"] = (r["suffer_score"] or 0) + act.suffer_score
+        strava_load[day] = strava_load.get(day, 0.0) + training_load.activity_load(act.suffer_score, act.moving_time)
+
+    query = select(
+        WhoopWorkout.start, WhoopWorkout.timezone_offset, WhoopWorkout.strain,
+        WhoopWorkout.kilojoules, *(getattr(WhoopWorkout, f"zone{zone}_milli") for zone in range(ZONES))
+    ).where(WhoopWorkout.user_id == user_id, WhoopWorkout.start.isnot(None))
+    if start is not None:
+        query = query.where(WhoopWorkout.start >= datetime.combine(start, datetime.min.time()) - MAX_UTC_OFFSET)
+    if end is not None:
+        query = query.where(WhoopWorkout.start < datetime.combine(end + timedelta(days=1), datetime.min.time()) + MAX_UTC_OFFSET)
+
+    for workout in db.execute(query):
+        day = local_day(workout.start, workout.timezone_offset)
+        if not _within(day, start, end):
+            continue
+        r = row(day)
+        r["workout_count"] += 1
+        if workout.strain is not None:
+            r["strain"] = max(r["strain"] or 0.0, workout.strain)
+            whoop_load[day] = whoop_load.get(day, 0.0) + float(training_load.strain_to_load(workout.strain))
+        if workout.kilojoules is not None:
+            r["kilojoules"] = (r["kilojoules"] or 0.0) + workout.kilojoules
+        for zone in range(ZONES):
+            r[f"zone{zone}_minutes"] += (getattr(workout, f"zone{zone}_milli") or 0) / 60000
+
+    query = select(
+        WhoopRecovery.date, WhoopRecovery.recovery_score, WhoopRecovery.hrv,
+        WhoopRecovery.resting_heart_rate, WhoopRecovery.sleep_performance
+    ).where(WhoopRecovery.user_id == user_id, WhoopRecovery.date.isnot(None))
+    if start is not None:
+        query = query.where(WhoopRecovery.date >= start)
+    if end is not None:
+        query = query.where(WhoopRecovery.date <= end)
+
+    for rec in db.execute(query):
+        row(rec.date).update(
+            recovery_score=rec.recovery_score,
+            hrv=rec.hrv,
+            resting_heart_rate=rec.resting_heart_rate,
+            sleep_performance=rec.sleep_performance
+        )
+
+    # The same session is often recorded by both devices, so count the larger source
+    for day, r in rows.items():
+        r["training_load"] = max(strava_load.get(day, 0.0), whoop_load.get(day, 0.0))
+    return rows
+
+
+def _write(db: Session, rows: dict):
+    """Insert rollup rows, overwriting any row another transaction wrote for the same day."""
+    if not rows:
+        return
+    dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(db.get_bind().dialect.name)
+    if dialect is None:
+        db.execute(insert(DailyRollup), list(rows.values()))
+        return
+
+    statement = dialect.insert(DailyRollup)
+    keys = {col.name for col in DailyRollup.__table__.primary_key}
+    statement = statement.on_conflict_do_update(
+        index_elements=sorted(keys),
+        set_={col.name: statement.excluded[col.name] for col in DailyRollup.__table__.columns if col.name not in keys}
+    )
+    db.execute(statement, list(rows.values()))
+
+
+def refresh(db: Session, user_id: int, days):
+    """Recompute a user's rollups over the span of `days` from the raw rows. Does not commit."""
+    days = [day for day in days if day is not None]
+    if not days:
+        return
+    start, end = min(days), max(days)
+
+    rows = aggregate(db, user_id, start, end)
+    db.execute(delete(DailyRollup).where(
+        DailyRollup.user_id == user_id,
+        DailyRollup.date >= start,
+        DailyRollup.date <= end
+    ))
+    _write(db, rows)
+    training_load.note_changes(db, user_id, start)
+    resource_versions.bump(db, user_id, resource_versions.HISTORY)
+
+
+def rebuild(db: Session, user_id: int):
+    """Recompute every rollup for a user. Returns the number of days written. Does not commit."""
+    rows = aggregate(db, user_id)
+    db.execute(delete(DailyRollup).where(DailyRollup.user_id == user_id))
+    _write(db, rows)
+    training_load.note_changes(db, user_id, date.min)
+    resource_versions.bump(db, user_id, resource_versions.HISTORY)
+    return len(rows)
+
+
+def rebuild_all(db: Session):
+    """Recompute rollups for every user. Returns {user_id: days written}. Does not commit."""
+    return {user_id: rebuild(db, user_id) for user_id in db.scalars(select(User.id)).all()}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] != "rebuild" or len(argv) > 2:
+        print("usage: python -m app.services.rollups rebuild [<user_id>]")
+        sys.exit(2)
+
+    db = SessionLocal()
+    try:
+        counts = {int(argv[1]): rebuild(db, int(argv[1]))} if len(argv) == 2 else rebuild_all(db)
+        db.commit()
+        for user_id, days in counts.items():
+            print(f"User {user_id}: {days} day(s)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Schedule builder — materializes workout blocks from a weekly template.
+
+The template is the user's saved Mon-Sun schedule (settings["schedule"]),
+falling back to DEFAULT_SCHEDULE. Blocks for a whole horizon (a week, or a
+16-week race block) are written set-based: one DELETE for the range and one
+multi-row INSERT ... RETURNING, so regenerating a season is a single
+transaction with no re-query.
+
+Reads never create blocks. The sync scheduler keeps every user materialized
+SCHEDULE_MATERIALIZE_DAYS ahead, and template/settings updates fill the
+horizon immediately, so GET /schedule/ can stay side-effect free.
+"""
+
+import os
+from datetime import date, datetime, timedelta
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from ..models import User, WorkoutBlock
+from . import resource_versions
+
+SCHEDULE_MAX_HORIZON_DAYS = int(os.getenv("SCHEDULE_MAX_HORIZON_DAYS", "366"))
+# Days ahead kept materialized; longer than the 7-day view so a day rollover
+# is already covered before the next scheduler tick
+SCHEDULE_MATERIALIZE_DAYS = int(os.getenv("SCHEDULE_MATERIALIZE_DAYS", "14"))
+
+# weekday (0 = Monday) -> (type, planned minutes)
+DEFAULT_SCHEDULE = {
+    0: ("Gym", 60),
+    1: ("Ultimate", 120),
+    2: ("Running", 45),
+    3: ("Gym", 60),
+    4: ("Running", 45),
+    5: ("Running", 60),
+    6: ("Ultimate", 120),
+}
+
+REST_DAY = ("Rest", 0)
+
+# Columns returned to API clients; projecting them skips ORM entity hydration
+BLOCK_COLUMNS = (
+    WorkoutBlock.id,
+    WorkoutBlock.user_id,
+    WorkoutBlock.date,
+    WorkoutBlock.type,
+    WorkoutBlock.planned_duration_minutes,
+    WorkoutBlock.notes,
+    WorkoutBlock.is_completed,
+)
+
+
+def weekly_template(user: User):
+    """Return the user's weekday -> (type, minutes) template, or the default."""
+    saved = (user.settings or {}).get("schedule", {})
+    if not saved:
+        return DEFAULT_SCHEDULE
+    return {int(k): (v[0], int(v[1])) for k, v in saved.items()}
+
+
+def _block_rows(user_id: int, template: dict, dates):
+    rows = []
+    for day in dates:
+        w_type, duration = template.get(day.weekday(), REST_DAY)
+        rows.append({
+            "user_id": user_id,
+            "date": day,
+            "type": w_type,
+            "planned_duration_minutes": duration,
+            "is_completed": False,
+        })
+    return rows
+
+
+def _insert_blocks(db: Session, rows: list):
+    if not rows:
+        return []
+    # Batched as multi-row INSERT ... RETURNING; row order isn't guaranteed
+    # (asking for it makes SQLite fall back to one statement per row)
+    returned = db.execute(insert(WorkoutBlock).returning(*BLOCK_COLUMNS), rows).all()
+    resource_versions.bump(db, rows[0]["user_id"], resource_versions.SCHEDULE)
+    return sorted(returned, key=lambda block: block.date)
+
+
+def materialize(db: Session, user: User, start: date, days: int):
+    """
+    Replace the user's blocks for `days` days from `start` with fresh blocks
+    from their weekly template. Does not commit.
+
+    Returns:
+        The new blocks as rows with BLOCK_COLUMNS, ordered by date.
+    """
+    end = start + timedelta(days=days - 1)
+    db.execute(delete(WorkoutBlock).where(
+        WorkoutBlock.user_id == user.id,
+        WorkoutBlock.date >= start,
+        WorkoutBlock.date <= end
+    ))
+
+    dates = [start + timedelta(days=i) for i in range(days)]
+    return _insert_blocks(db, _block_rows(user.id, weekly_template(user), dates))
+
+
+def fill_missing(db: Session, user: User, start: date, days: int):
+    """
+    Create template blocks for days in the range that have none, leaving
+    existing (possibly edited) blocks alone. Does not commit.
+
+    Returns:
+        The number of blocks created.
+    """
+    end = start + timedelta(days=days - 1)
+    existing = set(db.execute(select(WorkoutBlock.date).where(
+        WorkoutBlock.user_id == user.id,
+        WorkoutBlock.date >= start,
+        WorkoutBlock.date <= end
+    )).scalars())
+
+    missing = [start + timedelta(days=i) for i in range(days)]
+    missing = [day for day in missing if day not in existing]
+    return len(_insert_blocks(db, _block_rows(user.id, weekly_template(user), missing)))
+
+
+def ensure_horizon(db: Session, user: User, today: date = None):
+    """Fill missing blocks from today through the materialization horizon. Does not commit."""
+    today = today or datetime.now().date()
+    return fill_missing(db, user, today, SCHEDULE_MATERIALIZE_DAYS)
+
+
+def users_missing_blocks(db: Session, today: date = None):
+    """Return ids of users without a block for every day of the materialization horizon."""
+    today = today or datetime.now().date()
+    end = today + timedelta(days=SCHEDULE_MATERIALIZE_DAYS - 1)
+    covered = select(WorkoutBlock.user_id).where(
+        WorkoutBlock.date >= today,
+        WorkoutBlock.date <= end
+    ).group_by(WorkoutBlock.user_id).having(func.count() >= SCHEDULE_MATERIALIZE_DAYS)
+    return list(db.execute(select(User.id).where(User.id.not_in(covered))).scalars())
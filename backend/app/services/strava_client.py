@@ -1,77 +1,235 @@
 """
 Strava API client — token refresh and activity syncing.
+
+Routine syncs are incremental: the start time of the newest synced activity
+is stored on the user and passed as Strava's `after` parameter, so only new
+activities are transferred. A backfill mode (run on the sync worker pool)
+walks the full activity history with a bounded number of concurrent page
+requests. Requests go through the shared pooled HTTP client, which backs off
+on 429 responses.
+
+The `a`-prefixed functions are asyncio counterparts for request handlers on
+an AsyncSession. Paging, parsing and upserts are shared with the sync path;
+only the HTTP calls differ, and the same ingest code runs via
+`AsyncSession.run_sync`.
 """
 
 import os
 import time
-import requests
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from ..models import User, StravaActivity
+from . import context_cache, http_client, ingest, resource_versions, rollups
 
 STRAVA_API_URL = "https://www.strava.com/api/v3"
+STRAVA_TOKEN_URL = "https://www.strava.com/oauth/token"
+STRAVA_PAGE_SIZE = 200  # Strava's maximum per_page
+STRAVA_BACKFILL_CONCURRENCY = int(os.getenv("STRAVA_BACKFILL_CONCURRENCY", "4"))
+STRAVA_MAX_RETRIES = int(os.getenv("STRAVA_MAX_RETRIES", "5"))
 
 
-def refresh_strava_token(user: User, db: Session):
-    """Refresh the user's Strava OAuth access token using the stored refresh token."""
-    url = "https://www.strava.com/oauth/token"
-    payload = {
+def _refresh_payload(user: User):
+    return {
         "client_id": os.getenv("STRAVA_CLIENT_ID"),
         "client_secret": os.getenv("STRAVA_CLIENT_SECRET"),
         "refresh_token": user.strava_refresh_token,
         "grant_type": "refresh_token",
     }
-    response = requests.post(url, data=payload)
+
+
+def _store_token(user: User, db: Session, data: dict):
+    user.strava_access_token = data["access_token"]
+    user.strava_refresh_token = data["refresh_token"]
+    user.strava_expires_at = data["expires_at"]
+    resource_versions.bump(db, user.id, resource_versions.PROFILE)
+
+
+def refresh_strava_token(user: User, db: Session):
+    """Refresh the user's Strava OAuth access token using the stored refresh token."""
+    response = http_client.post(STRAVA_TOKEN_URL, data=_refresh_payload(user))
     if response.status_code == 200:
         data = response.json()
-        user.strava_access_token = data["access_token"]
-        user.strava_refresh_token = data["refresh_token"]
-        user.strava_expires_at = data["expires_at"]
+        _store_token(user, db, data)
         db.commit()
         return data["access_token"]
     return None
 
 
+async def arefresh_strava_token(user: User, db: AsyncSession):
+    """Async counterpart of refresh_strava_token."""
+    response = await http_client.apost(STRAVA_TOKEN_URL, data=_refresh_payload(user))
+    if response.status_code == 200:
+        data = response.json()
+        await db.run_sync(lambda session: _store_token(user, session, data))
+        await db.commit()
+        return data["access_token"]
+    return None
+
+
+def _page_request(access_token: str, page: int, per_page: int, after: int = None):
+    params = {"page": page, "per_page": per_page}
+    if after is not None:
+        params["after"] = after
+    return {
+        "headers": {"Authorization": f"Bearer {access_token}"},
+        "params": params,
+        "retries": STRAVA_MAX_RETRIES,
+    }
+
+
+def _page_result(response):
+    if response.status_code != 200:
+        raise Exception(f"Strava Activities API Error ({response.status_code}): {response.text}")
+    return response.json()
+
+
+def fetch_activity_page(access_token: str, page: int, per_page: int = STRAVA_PAGE_SIZE, after: int = None):
+    """
+    Fetch one page of the athlete's activities. 429 responses are retried up
+    to STRAVA_MAX_RETRIES times with backoff (honoring Retry-After).
+    """
+    response = http_client.get(
+        f"{STRAVA_API_URL}/athlete/activities",
+        **_page_request(access_token, page, per_page, after)
+    )
+    return _page_result(response)
+
+
+async def afetch_activity_page(access_token: str, page: int, per_page: int = STRAVA_PAGE_SIZE, after: int = None):
+    """Async counterpart of fetch_activity_page."""
+    response = await http_client.aget(
+        f"{STRAVA_API_URL}/athlete/activities",
+        **_page_request(access_token, page, per_page, after)
+    )
+    return _page_result(response)
+
+
+def _activity_pages(user: User, limit: int):
+    """
+    Paging for fetch_activities: yields (page, per_page, after) for each
+    request and receives that page's activities. Returns every activity fetched.
+    """
+    if user.strava_synced_until is None:
+        return (yield (1, limit, None))
+
+    activities_data = []
+    page = 1
+    while True:
+        batch = yield (page, STRAVA_PAGE_SIZE, user.strava_synced_until)
+        activities_data.extend(batch)
+        if len(batch) < STRAVA_PAGE_SIZE:
+            return activities_data
+        page += 1
+
+
 def fetch_activities(user: User, db: Session, limit: int = 30):
     """
-    Fetch recent activities from Strava and persist new ones to the database.
+    Fetch new activities from Strava and upsert them in bulk: new activities
+    are inserted and changed fields on already-synced ones are updated.
+    After the first sync, only activities newer than the user's
+    `strava_synced_until` watermark are requested, following pages as needed.
     Automatically refreshes the token if expired.
+    Returns the newly inserted activity rows.
     """
+    _ensure_fresh_token(user, db)
+    token = user.strava_access_token
+
+    activities_data = http_client.drive(
+        _activity_pages(user, limit), lambda request: fetch_activity_page(token, *request)
+    )
+
+    new_activities = _ingest(user, db, activities_data)
+    db.commit()
+    context_cache.invalidate(user.id)
+    return new_activities
+
+
+async def afetch_activities(user: User, db: AsyncSession, limit: int = 30):
+    """Async counterpart of fetch_activities for handlers on an AsyncSession."""
     if user.strava_expires_at and user.strava_expires_at < time.time():
-        refresh_strava_token(user, db)
+        await arefresh_strava_token(user, db)
+    token = user.strava_access_token
 
-    headers = {"Authorization": f"Bearer {user.strava_access_token}"}
-    params = {"per_page": limit}
+    activities_data = await http_client.adrive(
+        _activity_pages(user, limit), lambda request: afetch_activity_page(token, *request)
+    )
 
-    response = requests.get(f"{STRAVA_API_URL}/athlete/activities", headers=headers, params=params)
+    new_activities = await db.run_sync(lambda session: _ingest(user, session, activities_data))
+    await db.commit()
+    context_cache.invalidate(user.id)
+    return new_activities
 
-    if response.status_code != 200:
-        return []
 
-    activities_data = response.json()
+def backfill_activities(user: User, db: Session, concurrency: int = STRAVA_BACKFILL_CONCURRENCY):
+    """
+    Walk the athlete's full activity history and upsert every page.
+    Pages are requested `concurrency` at a time until a short page marks the
+    end of history; each round is committed so progress survives a failure.
+    Returns the newly inserted activity rows.
+    """
+    _ensure_fresh_token(user, db)
+    token = user.strava_access_token
+
     new_activities = []
+    page = 1
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="strava-backfill") as pool:
+        while True:
+            pages = list(range(page, page + concurrency))
+            batches = list(pool.map(lambda p: fetch_activity_page(token, p), pages))
 
-    for activity in activities_data:
-        existing = db.query(StravaActivity).filter(StravaActivity.strava_id == activity["id"]).first()
-        if existing:
-            continue
-
-        start_date = datetime.strptime(activity["start_date_local"], "%Y-%m-%dT%H:%M:%SZ")
-
-        new_activity = StravaActivity(
-            user_id=user.id,
-            strava_id=activity["id"],
-            name=activity["name"],
-            distance=activity["distance"],
-            moving_time=activity["moving_time"],
-            total_elevation_gain=activity["total_elevation_gain"],
-            type=activity["type"],
-            start_date=start_date,
-            average_heartrate=activity.get("average_heartrate"),
-            suffer_score=activity.get("suffer_score")
-        )
-        db.add(new_activity)
-        new_activities.append(new_activity)
+            for batch in batches:
+                new_activities.extend(_ingest(user, db, batch))
+            db.commit()
+            context_cache.invalidate(user.id)
+
+            if any(len(batch) < STRAVA_PAGE_SIZE for batch in batches):
+                break
+            page += concurrency
+
+    return new_activities
+
+
+def parse_activity(user_id: int, activity: dict):
+    """Map a Strava activity payload to StravaActivity column values."""
+    return {
+        "user_id": user_id,
+        "strava_id": activity["id"],
+        "name": activity["name"],
+        "distance": activity["distance"],
+        "moving_time": activity["moving_time"],
+        "total_elevation_gain": activity["total_elevation_gain"],
+        "type": activity["type"],
+        "start_date": datetime.strptime(activity["start_date_local"], "%Y-%m-%dT%H:%M:%SZ"),
+        "average_heartrate": activity.get("average_heartrate"),
+        "suffer_score": activity.get("suffer_score")
+    }
+
+
+def _ensure_fresh_token(user: User, db: Session):
+    if user.strava_expires_at and user.strava_expires_at < time.time():
+        refresh_strava_token(user, db)
+
+
+def _ingest(user: User, db: Session, activities_data: list):
+    """
+    Upsert a batch of activity payloads, refresh the daily rollups they touch,
+    and advance the user's high-water mark.
+    """
+    if not activities_data:
+        return []
+
+    rows = [parse_activity(user.id, activity) for activity in activities_data]
+    new_activities, changed = ingest.bulk_upsert(db, StravaActivity, "strava_id", rows)
+    if new_activities or changed:
+        rollups.refresh(db, user.id, {row["start_date"].date() for row in rows})
+
+    latest = max(
+        int(datetime.strptime(a["start_date"], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp())
+        for a in activities_data
+    )
+    if user.strava_synced_until is None or latest > user.strava_synced_until:
+        user.strava_synced_until = latest
 
-    db.commit()
     return new_activities
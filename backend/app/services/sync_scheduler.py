@@ -0,0 +1,275 @@
+"""
+Sync scheduler — background refresh of Strava and WHOOP data.
+
+Runs an in-process asyncio loop that periodically syncs every connected user
+whose data is older than the freshness window. Each sync records a watermark
+(`last_synced_at`) and per-service status on the user, so plan requests can be
+served straight from the database instead of waiting on external APIs.
+
+Every API worker runs this loop, so a sync first claims its user with a
+conditional UPDATE of `last_synced_at`; only the worker whose UPDATE matched
+the still-stale row goes on to call Strava and WHOOP.
+
+A separate loop materializes upcoming workout blocks for every user (see
+schedule_builder) at startup and then every SCHEDULE_MATERIALIZE_POLL_SECONDS,
+so schedule reads never have to write. It runs even when syncing is disabled.
+"""
+
+import asyncio
+import os
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import User
+from . import schedule_builder, strava_client, whoop_client
+
+SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", "900"))
+SYNC_POLL_SECONDS = int(os.getenv("SYNC_POLL_SECONDS", "60"))
+SYNC_WORKERS = int(os.getenv("SYNC_WORKERS", "4"))
+# Well under a day, so the horizon is topped up soon after midnight
+SCHEDULE_MATERIALIZE_POLL_SECONDS = int(os.getenv("SCHEDULE_MATERIALIZE_POLL_SECONDS", "3600"))
+
+_executor = ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix="sync")
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+_task = None
+_materialize_task = None
+
+
+def sync_external_data(user: User, db: Session):
+    """
+    Sync Strava activities and WHOOP recovery/workout data.
+    Each service is synced independently so one failure doesn't block the other.
+    Returns a summary dict with counts and any error messages.
+    """
+    sync_result = {
+        "strava": {"synced": 0, "error": None},
+        "whoop": {"synced": 0, "error": None}
+    }
+
+    if user.strava_access_token:
+        try:
+            activities = strava_client.fetch_activities(user, db)
+            sync_result["strava"]["synced"] = len(activities)
+        except Exception as e:
+            sync_result["strava"]["error"] = str(e)
+    else:
+        sync_result["strava"]["error"] = "Not connected"
+
+    if user.whoop_access_token:
+        try:
+            recoveries, workouts = whoop_client.sync_whoop(user, db)
+            sync_result["whoop"]["synced"] = len(recoveries) + len(workouts)
+        except Exception as e:
+            sync_result["whoop"]["error"] = str(e)
+    else:
+        sync_result["whoop"]["error"] = "Not connected"
+
+    return sync_result
+
+
+def is_stale(user: User, now: datetime = None):
+    """Return True if the user's synced data is older than the freshness window."""
+    if not user.last_synced_at:
+        return True
+    now = now or datetime.utcnow()
+    return user.last_synced_at < now - timedelta(seconds=SYNC_INTERVAL_SECONDS)
+
+
+def claim_sync(db: Session, user_id: int, now: datetime = None):
+    """
+    Atomically mark a stale user as syncing by moving `last_synced_at` to now.
+    Returns True if this caller won the claim (another worker or thread
+    already did if the row is no longer stale). Commits.
+    """
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=SYNC_INTERVAL_SECONDS)
+    result = db.execute(
+        update(User)
+        .where(User.id == user_id, or_(User.last_synced_at.is_(None), User.last_synced_at < cutoff))
+        .values(last_synced_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+
+def sync_user(user_id: int):
+    """
+    Run a full external sync for one user in its own session and record the
+    watermark and status, unless another worker has already claimed it.
+    Safe to call from any worker thread or process.
+    """
+    db = SessionLocal()
+    try:
+        if not claim_sync(db, user_id):
+            return None
+        user = db.get(User, user_id)
+        if not user:
+            return None
+
+        result = sync_external_data(user, db)
+        user.last_synced_at = datetime.utcnow()
+        user.last_sync_status = result
+        db.commit()
+        return result
+    except Exception as e:
+        print(f"Background sync failed for user {user_id}: {e}")
+        traceback.print_exc()
+        db.rollback()
+        return None
+    finally:
+        db.close()
+        with _in_flight_lock:
+            _in_flight.discard(user_id)
+
+
+def backfill_strava(user_id: int):
+    """
+    Import a user's full Strava activity history in its own session.
+    Returns the number of new activities, or None on failure.
+    """
+    db = SessionLocal()
+    try:
+        user = db.get(User, user_id)
+        if not user or not user.strava_access_token:
+            return None
+        return len(strava_client.backfill_activities(user, db))
+    except Exception as e:
+        print(f"Strava backfill failed for user {user_id}: {e}")
+        traceback.print_exc()
+        db.rollback()
+        return None
+    finally:
+        db.close()
+        with _in_flight_lock:
+            _in_flight.discard(user_id)
+
+
+def _submit(user_id: int, job):
+    with _in_flight_lock:
+        if user_id in _in_flight:
+            return None
+        _in_flight.add(user_id)
+    return _executor.submit(job, user_id)
+
+
+def request_sync(user_id: int):
+    """
+    Queue an immediate background sync for a user without blocking the caller.
+    Returns the future, or None if a sync for this user is already running.
+    """
+    return _submit(user_id, sync_user)
+
+
+def request_backfill(user_id: int):
+    """
+    Queue a full Strava history import for a user without blocking the caller.
+    Returns the future, or None if a sync or backfill for this user is already running.
+    """
+    return _submit(user_id, backfill_strava)
+
+
+def due_user_ids(db: Session, now: datetime = None):
+    """Return ids of connected users whose data is older than the freshness window."""
+    now = now or datetime.utcnow()
+    cutoff = now - timedelta(seconds=SYNC_INTERVAL_SECONDS)
+    rows = db.query(User.id).filter(
+        or_(User.strava_access_token.isnot(None), User.whoop_access_token.isnot(None)),
+        or_(User.last_synced_at.is_(None), User.last_synced_at < cutoff)
+    ).all()
+    return [row.id for row in rows]
+
+
+def _load_due_user_ids():
+    db = SessionLocal()
+    try:
+        return due_user_ids(db)
+    finally:
+        db.close()
+
+
+async def run_due_syncs():
+    """Sync every due user concurrently on the sync worker pool."""
+    loop = asyncio.get_running_loop()
+    user_ids = await loop.run_in_executor(_executor, _load_due_user_ids)
+
+    futures = [request_sync(uid) for uid in user_ids]
+    futures = [asyncio.wrap_future(f) for f in futures if f is not None]
+    if futures:
+        await asyncio.gather(*futures, return_exceptions=True)
+
+
+def materialize_schedules():
+    """Fill each user's upcoming workout blocks through the materialization horizon."""
+    db = SessionLocal()
+    try:
+        for user_id in schedule_builder.users_missing_blocks(db):
+            try:
+                schedule_builder.ensure_horizon(db, db.get(User, user_id))
+                db.commit()
+            except Exception as e:
+                # e.g. a concurrent worker filled the same day first
+                print(f"Schedule materialization failed for user {user_id}: {e}")
+                db.rollback()
+    finally:
+        db.close()
+
+
+async def _run_loop():
+    while True:
+        try:
+            await run_due_syncs()
+        except Exception as e:
+            print(f"Sync scheduler tick failed: {e}")
+            traceback.print_exc()
+        await asyncio.sleep(SYNC_POLL_SECONDS)
+
+
+async def _materialize_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(_executor, materialize_schedules)
+        except Exception as e:
+            print(f"Schedule materialization tick failed: {e}")
+            traceback.print_exc()
+        await asyncio.sleep(SCHEDULE_MATERIALIZE_POLL_SECONDS)
+
+
+async def _cancel(task):
+    if task is None:
+        return
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+
+def start():
+    """Start the background sync loop on the running event loop."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_run_loop())
+    return _task
+
+
+def start_materializer():
+    """Start the schedule materialization loop on the running event loop."""
+    global _materialize_task
+    if _materialize_task is None or _materialize_task.done():
+        _materialize_task = asyncio.get_running_loop().create_task(_materialize_loop())
+    return _materialize_task
+
+
+async def stop():
+    """Cancel the background sync and materialization loops and wait for them to exit."""
+    global _task, _materialize_task
+    await _cancel(_task)
+    await _cancel(_materialize_task)
+    _task = _materialize_task = None
@@ -0,0 +1,281 @@
+"""
+Training load — daily load series and fatigue/fitness metrics per user.
+
+Strava activities (Relative Effort, or moving time when it is missing) and
+WHOOP workout strain are combined into one daily load at ingestion
+(`daily_rollups.training_load`, see rollups). Each user's daily loads form
+one array, and the metrics are computed from it in vectorized NumPy passes:
+
+- ATL / CTL: exponentially weighted acute (7-day) and chronic (42-day) load
+- TSB: training stress balance ("form"), yesterday's CTL minus ATL
+- ACWR: acute:chronic workload ratio of the 7-day and 28-day mean loads
+- Monotony / strain (Foster): weekly mean over standard deviation of daily
+  load, and weekly load times monotony
+
+Series are cached in process and updated incrementally. Rollup refreshes
+record the earliest day they touched (published when the session commits),
+and the next read reloads only rollups from that day on, continuing the EWMA
+recurrences from the cached state the day before. Days with no data extend
+the series with zero load. A TTL forces a full rebuild so that writes from
+other processes are picked up.
+"""
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from ..models import DailyRollup
+
+TRAINING_LOAD_HISTORY_DAYS = int(os.getenv("TRAINING_LOAD_HISTORY_DAYS", "365"))
+TRAINING_LOAD_CACHE_TTL_SECONDS = int(os.getenv("TRAINING_LOAD_CACHE_TTL_SECONDS", "21600"))
+
+ATL_DAYS = 7
+CTL_DAYS = 42
+ACUTE_WINDOW = 7
+CHRONIC_WINDOW = 28
+
+# Load for Strava activities without Relative Effort (no heart rate), per moving minute
+LOAD_PER_MINUTE = 1.0
+# WHOOP strain (0-21) grows logarithmically with cardiovascular load; map it
+# back onto a Relative Effort-like scale (strain 10 ~ 50, strain 18 ~ 200)
+STRAIN_LOAD_SCALE = 14.0
+STRAIN_LOG_BASE = 6.6
+
+# Days per vectorized EWMA block; keeps the decay powers well inside float64 range
+EWMA_BLOCK = 128
+
+_series = {}  # user_id -> {"start", "loads", "atl", "ctl", "built_at"}
+_dirty = {}  # user_id -> earliest day changed since the series was built
+_generations = {}  # user_id -> change count
+_lock = threading.Lock()
+
+
+# --- Vectorized kernels ---
+
+def strain_to_load(strain: np.ndarray):
+    """Convert WHOOP strain values to Relative Effort-like load."""
+    return STRAIN_LOAD_SCALE * np.expm1(np.asarray(strain, dtype=float) / STRAIN_LOG_BASE)
+
+
+def ewma(x: np.ndarray, days: float, initial: float = 0.0):
+    """
+    Exponentially weighted average with time constant `days`:
+    y[t] = y[t-1] + a * (x[t] - y[t-1]), a = 1 - exp(-1/days), y[-1] = initial.
+
+    Each block solves the recurrence in closed form,
+    y[j] = d^j * (d * y[-1] + a * cumsum(x[k] / d^k)) with d = 1 - a.
+    """
+    x = np.asarray(x, dtype=float)
+    alpha = 1.0 - np.exp(-1.0 / days)
+    decay = 1.0 - alpha
+    out = np.empty_like(x)
+
+    state = initial
+    for start in range(0, len(x), EWMA_BLOCK):
+        block = x[start:start + EWMA_BLOCK]
+        powers = decay ** np.arange(len(block))
+        y = powers * (decay * state + alpha * np.cumsum(block / powers))
+        out[start:start + len(block)] = y
+        state = y[-1]
+    return out
+
+
+def rolling_sum(x: np.ndarray, window: int):
+    """Trailing `window`-day sums; the first days sum over the shorter history available."""
+    cumulative = np.concatenate(([0.0], np.cumsum(x, dtype=float)))
+    ends = np.arange(1, len(x) + 1)
+    return cumulative[ends] - cumulative[np.maximum(ends - window, 0)]
+
+
+def compute_metrics(loads: np.ndarray, atl: np.ndarray, ctl: np.ndarray):
+    """Return per-day TSB, ACWR, monotony, strain and window loads as arrays aligned with `loads`."""
+    acute = rolling_sum(loads, ACUTE_WINDOW)
+    chronic = rolling_sum(loads, CHRONIC_WINDOW)
+    acute_sq = rolling_sum(loads * loads, ACUTE_WINDOW)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acwr = np.where(chronic > 0, (acute / ACUTE_WINDOW) / (chronic / CHRONIC_WINDOW), np.nan)
+        mean = acute / ACUTE_WINDOW
+        std = np.sqrt(np.maximum(acute_sq / ACUTE_WINDOW - mean * mean, 0.0))
+        monotony = np.where(std > 1e-9, mean / std, np.nan)
+
+    # Form going into each day: the previous day's fitness minus fatigue
+    tsb = np.concatenate(([0.0], ctl[:-1] - atl[:-1]))
+    return {
+        "tsb": tsb,
+        "acwr": acwr,
+        "monotony": monotony,
+        "strain": acute * monotony,
+        "load_7d": acute,
+        "load_28d": chronic,
+    }
+
+
+# --- Loading ---
+
+def activity_load(suffer_score, moving_time):
+    """Load of one Strava activity: its Relative Effort, or moving minutes when that is missing."""
+    if suffer_score is not None:
+        return float(suffer_score)
+    return (moving_time or 0) / 60 * LOAD_PER_MINUTE
+
+
+def load_daily(db: Session, user_id: int, start: date, end: date):
+    """Return the daily load array for [start, end] from the user's daily rollups."""
+    days = (end - start).days + 1
+    loads = np.zeros(max(days, 0))
+    if days <= 0:
+        return loads
+
+    rows = db.execute(
+        select(DailyRollup.date, DailyRollup.training_load)
+        .where(DailyRollup.user_id == user_id, DailyRollup.date >= start, DailyRollup.date <= end)
+    ).all()
+    if rows:
+        offsets = np.array([(r.date - start).days for r in rows])
+        loads[offsets] = [r.training_load or 0.0 for r in rows]
+    return loads
+
+
+# --- Cache ---
+
+def get_series(db: Session, user_id: int, today: date = None):
+    """
+    Return the user's series through `today` as a dict with `start` (date)
+    and `loads`, `atl`, `ctl` arrays (one entry per day). Reuses the cached
+    series and recomputes only from the earliest changed day.
+    """
+    today = today or date.today()
+    with _lock:
+        entry = _series.get(user_id)
+        dirty_from = _dirty.get(user_id)
+        built_generation = _generations.get(user_id, 0)
+
+    full_start = today - timedelta(days=TRAINING_LOAD_HISTORY_DAYS - 1)
+    if entry is None or time.monotonic() - entry["built_at"] > TRAINING_LOAD_CACHE_TTL_SECONDS:
+        entry = None
+
+    if entry is None:
+        start, keep = full_start, 0
+        loads = atl = ctl = np.zeros(0)
+    else:
+        start = entry["start"]
+        last = start + timedelta(days=len(entry["loads"]) - 1)
+        recompute_from = min(dirty_from or last + timedelta(days=1), last + timedelta(days=1))
+        keep = max((recompute_from - start).days, 0)
+        loads, atl, ctl = entry["loads"][:keep], entry["atl"][:keep], entry["ctl"][:keep]
+
+    fresh = load_daily(db, user_id, start + timedelta(days=keep), today)
+    loads = np.concatenate((loads, fresh))
+    atl = np.concatenate((atl, ewma(fresh, ATL_DAYS, atl[-1] if keep else 0.0)))
+    ctl = np.concatenate((ctl, ewma(fresh, CTL_DAYS, ctl[-1] if keep else 0.0)))
+
+    # Slide the window forward; the EWMA state lives on in the kept values
+    excess = len(loads) - TRAINING_LOAD_HISTORY_DAYS
+    if excess > 0:
+        start += timedelta(days=excess)
+        loads, atl, ctl = loads[excess:], atl[excess:], ctl[excess:]
+
+    series = {
+        "start": start,
+        "loads": loads,
+        "atl": atl,
+        "ctl": ctl,
+        "built_at": entry["built_at"] if entry is not None else time.monotonic(),
+    }
+    with _lock:
+        _series[user_id] = series
+        # Changes recorded while this series was being built are kept for the next read
+        if _generations.get(user_id, 0) == built_generation:
+            _dirty.pop(user_id, None)
+    return series
+
+
+def mark_changed(user_id: int, since: date):
+    """Record that a user's load data changed on or after `since`."""
+    with _lock:
+        current = _dirty.get(user_id)
+        _dirty[user_id] = since if current is None else min(current, since)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def note_changes(db: Session, user_id: int, since: date):
+    """Record changed load data in `db`; published by mark_changed when the session commits."""
+    changes = db.info.setdefault("training_load_changes", {})
+    changes[user_id] = min(changes.get(user_id, since), since)
+
+
+def invalidate(user_id: int):
+    """Drop a user's cached series."""
+    with _lock:
+        _series.pop(user_id, None)
+        _dirty.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def clear():
+    """Drop every cached series."""
+    with _lock:
+        _series.clear()
+        _dirty.clear()
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    for user_id, since in session.info.pop("training_load_changes", {}).items():
+        mark_changed(user_id, since)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changes(session):
+    session.info.pop("training_load_changes", None)
+
+
+# --- Features ---
+
+def _rounded(value, digits=1):
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def acwr_zone(acwr: float):
+    """Classify an ACWR value: below 0.8 under-loaded, 0.8-1.3 optimal, above 1.5 high spike risk."""
+    if acwr is None or np.isnan(acwr):
+        return None
+    if acwr < 0.8:
+        return "low"
+    if acwr <= 1.3:
+        return "optimal"
+    if acwr <= 1.5:
+        return "elevated"
+    return "high"
+
+
+def summary(db: Session, user_id: int, today: date = None):
+    """
+    Return the latest training-load features as a compact, JSON-ready dict,
+    or None if the user has no load in the history window.
+    """
+    series = get_series(db, user_id, today)
+    loads, atl, ctl = series["loads"], series["atl"], series["ctl"]
+    if not len(loads) or not loads.any():
+        return None
+
+    metrics = compute_metrics(loads, atl, ctl)
+    week_ago = max(len(ctl) - 1 - ACUTE_WINDOW, 0)
+    return {
+        "as_of": (series["start"] + timedelta(days=len(loads) - 1)).isoformat(),
+        "atl": _rounded(atl[-1]),
+        "ctl": _rounded(ctl[-1]),
+        "tsb": _rounded(metrics["tsb"][-1]),
+        "acwr": _rounded(metrics["acwr"][-1], 2),
+        "acwr_zone": acwr_zone(metrics["acwr"][-1]),
+        "monotony": _rounded(metrics["monotony"][-1], 2),
+        "strain": _rounded(metrics["strain"][-1], 0),
+        "load_7d": _rounded(metrics["load_7d"][-1], 0),
+        "load_28d": _rounded(metrics["load_28d"][-1], 0),
+        "ctl_ramp_7d": _rounded(ctl[-1] - ctl[week_ago]),
+        "daily_load_14d": [int(round(x)) for x in loads[-14:]],
+    }
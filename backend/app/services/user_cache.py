@@ -0,0 +1,144 @@
+"""
+User cache — in-process snapshots of authenticated users and their sessions.
+
+Every request resolves its session token to a user (see user_sessions).
+Token digests map to their user id and users to a snapshot of their column
+values, so a warm lookup is two dict hits and the snapshot is attached to the
+request's session without a query (`Session.merge(load=False)`).
+
+Committing a change to a User row in this process invalidates its snapshot
+(a Session event hook tracks flushed users), so plan, token and watermark
+updates are seen by the next request. A TTL bounds staleness for writes and
+session revocations made by other processes.
+"""
+
+import copy
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+from ..models import User
+
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+_COLUMNS = [attr.key for attr in inspect(User).column_attrs]
+
+_users = {}  # user_id -> (cached_at, column values)
+_sessions = {}  # token digest -> (cached_at, user_id, expires_at)
+_generations = {}  # user_id -> invalidation count
+_lock = threading.Lock()
+
+
+def _store(entries: dict, key, value):
+    """Insert into a bounded dict, evicting the oldest entry when full. Caller holds _lock."""
+    entries.pop(key, None)
+    if len(entries) >= USER_CACHE_MAX_ENTRIES:
+        entries.pop(next(iter(entries)))
+    entries[key] = value
+
+
+def _fresh(cached_at: float):
+    return time.monotonic() - cached_at <= USER_CACHE_TTL_SECONDS
+
+
+# --- Sessions ---
+
+def get_session(digest: str):
+    """Return the user id for a cached, unexpired session token digest, or None."""
+    with _lock:
+        entry = _sessions.get(digest)
+    if entry is None:
+        return None
+
+    cached_at, user_id, expires_at = entry
+    if not _fresh(cached_at) or expires_at <= datetime.utcnow():
+        return None
+    return user_id
+
+
+def put_session(digest: str, user_id: int, expires_at: datetime):
+    """Cache a resolved session token digest."""
+    with _lock:
+        _store(_sessions, digest, (time.monotonic(), user_id, expires_at))
+
+
+def drop_session(digest: str):
+    """Forget a session token digest after it is revoked."""
+    with _lock:
+        _sessions.pop(digest, None)
+
+
+# --- Users ---
+
+def generation(user_id: int):
+    """Return the user's invalidation counter; read it before loading the user."""
+    with _lock:
+        return _generations.get(user_id, 0)
+
+
+def get_user(user_id: int):
+    """
+    Return a detached copy of the cached user, ready for
+    `Session.merge(user, load=False)`, or None.
+    """
+    with _lock:
+        entry = _users.get(user_id)
+    if entry is None:
+        return None
+
+    cached_at, values = entry
+    if not _fresh(cached_at):
+        return None
+    user = User(**copy.deepcopy(values))
+    make_transient_to_detached(user)
+    return user
+
+
+def put_user(user: User, built_generation: int):
+    """
+    Snapshot a freshly loaded user, unless the user was invalidated while it
+    was being loaded (the row may have changed since).
+    """
+    values = {key: copy.deepcopy(getattr(user, key)) for key in _COLUMNS}
+    with _lock:
+        if _generations.get(user.id, 0) != built_generation:
+            return
+        _store(_users, user.id, (time.monotonic(), values))
+
+
+def invalidate(user_id: int):
+    """Drop a user's snapshot after their row changes."""
+    with _lock:
+        _users.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def clear():
+    """Drop every cached user and session."""
+    with _lock:
+        _users.clear()
+        _sessions.clear()
+
+
+# --- Invalidation on commit ---
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = session.info.setdefault("changed_user_ids", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for user_id in session.info.pop("changed_user_ids", ()):
+        invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
@@ -0,0 +1,169 @@
+"""
+User sessions — opaque login tokens resolved to a user on every request.
+
+Signing in through Strava or WHOOP issues a random token, set on the browser
+as an HttpOnly cookie; API clients may send it as `Authorization: Bearer`.
+Only the token's SHA-256 digest is stored, as the primary key of
+`user_sessions`, so resolving a request is one indexed lookup — and usually
+none, since resolved tokens and users are served from user_cache.
+
+    python -m app.services.user_sessions issue <user_id>  # print a token for an API client
+    python -m app.services.user_sessions prune            # delete expired sessions
+"""
+
+import hashlib
+import os
+import secrets
+import sys
+from datetime import datetime, timedelta
+from fastapi import Request, Response
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from ..database import SessionLocal
+from ..models import User, UserSession
+from . import user_cache
+
+SESSION_COOKIE_NAME = os.getenv("SESSION_COOKIE_NAME", "trainer_session")
+SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "30"))
+SESSION_COOKIE_SECURE = os.getenv("SESSION_COOKIE_SECURE", "0") == "1"
+
+
+def hash_token(token: str):
+    """Return the hex SHA-256 digest stored for a session token."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def create(db: Session, user_id: int):
+    """Start a session for a user and return its token. Does not commit."""
+    token = secrets.token_urlsafe(32)
+    db.add(UserSession(
+        token_hash=hash_token(token),
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=SESSION_TTL_DAYS)
+    ))
+    return token
+
+
+def revoke(db: Session, token: str):
+    """End the session for a token. Does not commit."""
+    digest = hash_token(token)
+    db.execute(delete(UserSession).where(UserSession.token_hash == digest))
+    user_cache.drop_session(digest)
+
+
+def prune(db: Session):
+    """Delete expired sessions. Returns the number removed. Does not commit."""
+    result = db.execute(delete(UserSession).where(UserSession.expires_at <= datetime.utcnow()))
+    return result.rowcount
+
+
+def token_from_request(request: Request):
+    """Return the session token from a Bearer Authorization header or the session cookie."""
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and credentials:
+        return credentials.strip()
+    return request.cookies.get(SESSION_COOKIE_NAME)
+
+
+def set_cookie(response: Response, token: str):
+    """Attach the session cookie to a response."""
+    response.set_cookie(
+        SESSION_COOKIE_NAME, token,
+        max_age=SESSION_TTL_DAYS * 86400,
+        httponly=True,
+        samesite="lax",
+        secure=SESSION_COOKIE_SECURE
+    )
+
+
+def clear_cookie(response: Response):
+    """Remove the session cookie from the browser."""
+    response.delete_cookie(SESSION_COOKIE_NAME, httponly=True, samesite="lax", secure=SESSION_COOKIE_SECURE)
+
+
+def _session_query(digest: str):
+    return select(UserSession.user_id, UserSession.expires_at).where(UserSession.token_hash == digest)
+
+
+def _resolved_user_id(digest: str, row):
+    """Cache and return the user id of a looked-up session row, or None if missing or expired."""
+    if row is None or row.expires_at <= datetime.utcnow():
+        return None
+    user_cache.put_session(digest, row.user_id, row.expires_at)
+    return row.user_id
+
+
+def resolve_user(db: Session, token: str):
+    """Return the user owning a session token, attached to `db`, or None."""
+    if not token:
+        return None
+
+    digest = hash_token(token)
+    user_id = user_cache.get_session(digest)
+    if user_id is None:
+        user_id = _resolved_user_id(digest, db.execute(_session_query(digest)).first())
+        if user_id is None:
+            return None
+
+    cached = user_cache.get_user(user_id)
+    if cached is not None:
+        return db.merge(cached, load=False)
+
+    built_generation = user_cache.generation(user_id)
+    user = db.get(User, user_id)
+    if user is not None:
+        user_cache.put_user(user, built_generation)
+    return user
+
+
+async def aresolve_user(db: AsyncSession, token: str):
+    """Async counterpart of resolve_user for handlers on an AsyncSession."""
+    if not token:
+        return None
+
+    digest = hash_token(token)
+    user_id = user_cache.get_session(digest)
+    if user_id is None:
+        user_id = _resolved_user_id(digest, (await db.execute(_session_query(digest))).first())
+        if user_id is None:
+            return None
+
+    cached = user_cache.get_user(user_id)
+    if cached is not None:
+        return await db.merge(cached, load=False)
+
+    built_generation = user_cache.generation(user_id)
+    user = await db.get(User, user_id)
+    if user is not None:
+        user_cache.put_user(user, built_generation)
+    return user
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    command = argv[0] if argv else None
+    if command not in ("issue", "prune") or (command == "issue" and len(argv) != 2):
+        print("usage: python -m app.services.user_sessions issue <user_id> | prune")
+        sys.exit(2)
+
+    db = SessionLocal()
+    try:
+        if command == "issue":
+            user = db.get(User, int(argv[1]))
+            if not user:
+                print(f"No user with id {argv[1]}")
+                sys.exit(1)
+            token = create(db, user.id)
+            db.commit()
+            print(token)
+        else:
+            removed = prune(db)
+            db.commit()
+            print(f"Removed {removed} expired session(s).")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,51 @@
 """
 WHOOP API client — token refresh, recovery syncing, and workout syncing.
+
+The sync engine fetches the recovery, sleep and workout collections
+concurrently over the shared pooled HTTP client, follows `next_token`
+pagination, and only requests records newer than the user's
+`whoop_synced_until` watermark (minus a small overlap, since WHOOP scores
+recoveries and sleeps after the fact).
+
+`sync_whoop_async` and the other `a`-prefixed functions are the asyncio
+path for request handlers on an AsyncSession. Paging, token retry and
+ingest logic are shared with the sync path; only the HTTP calls and their
+concurrency differ, and ingest runs via `AsyncSession.run_sync`.
 """
 
+import asyncio
 import os
 import time
-import requests
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from ..models import User, WhoopRecovery, WhoopWorkout
+from . import context_cache, http_client, ingest, resource_versions, rollups
 
 WHOOP_API_URL = "https://api.prod.whoop.com/developer/v2"
+WHOOP_TOKEN_URL = "https://api.prod.whoop.com/oauth/oauth2/token"
+WHOOP_PAGE_LIMIT = 25  # WHOOP's maximum page size
+WHOOP_MAX_PAGES = int(os.getenv("WHOOP_MAX_PAGES", "40"))
+WHOOP_OVERLAP = timedelta(days=3)
+# v2 workout score zone_durations keys, zone 0 (below zone 1) through zone 5
+ZONE_KEYS = (
+    "zone_zero_milli", "zone_one_milli", "zone_two_milli",
+    "zone_three_milli", "zone_four_milli", "zone_five_milli",
+)
 
+RECOVERY_PATH = "/recovery"
+SLEEP_PATH = "/activity/sleep"
+WORKOUT_PATH = "/activity/workout"
+SYNC_PATHS = [RECOVERY_PATH, SLEEP_PATH, WORKOUT_PATH]
 
-def refresh_whoop_token(user: User, db: Session):
-    """Refresh the user's WHOOP OAuth access token using the stored refresh token."""
-    if not user.whoop_refresh_token:
-        return None
 
-    url = "https://api.prod.whoop.com/oauth/oauth2/token"
-    payload = {
+class WhoopUnauthorized(Exception):
+    """Raised when WHOOP rejects the access token (HTTP 401)."""
+
+
+def _refresh_payload(user: User):
+    return {
         "grant_type": "refresh_token",
         "refresh_token": user.whoop_refresh_token,
         "client_id": os.getenv("WHOOP_CLIENT_ID"),
@@ -27,144 +54,330 @@ def refresh_whoop_token(user: User, db: Session):
         "redirect_uri": "http://localhost:8000/auth/whoop/callback",
     }
 
-    response = requests.post(url, data=payload)
+
+def _store_token(user: User, db: Session, data: dict):
+    user.whoop_access_token = data["access_token"]
+    user.whoop_refresh_token = data["refresh_token"]
+    user.whoop_expires_at = int(time.time()) + data.get("expires_in", 3600)
+    resource_versions.bump(db, user.id, resource_versions.PROFILE)
+
+
+def refresh_whoop_token(user: User, db: Session):
+    """Refresh the user's WHOOP OAuth access token using the stored refresh token."""
+    if not user.whoop_refresh_token:
+        return None
+
+    response = http_client.post(WHOOP_TOKEN_URL, data=_refresh_payload(user))
     if response.status_code == 200:
         data = response.json()
-        user.whoop_access_token = data["access_token"]
-        user.whoop_refresh_token = data["refresh_token"]
-        user.whoop_expires_at = int(time.time()) + data.get("expires_in", 3600)
+        _store_token(user, db, data)
         db.commit()
         return data["access_token"]
     return None
 
 
-def fetch_recoveries(user: User, db: Session, limit: int = 25):
+async def arefresh_whoop_token(user: User, db: AsyncSession):
+    """Async counterpart of refresh_whoop_token."""
+    if not user.whoop_refresh_token:
+        return None
+
+    response = await http_client.apost(WHOOP_TOKEN_URL, data=_refresh_payload(user))
+    if response.status_code == 200:
+        data = response.json()
+        await db.run_sync(lambda session: _store_token(user, session, data))
+        await db.commit()
+        return data["access_token"]
+    return None
+
+
+def fetch_profile(access_token: str):
+    """Return the WHOOP member's basic profile (user_id, email, names), or {} on error."""
+    response = http_client.get(
+        f"{WHOOP_API_URL}/user/profile/basic",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    return response.json() if response.status_code == 200 else {}
+
+
+def _collection_params(start: datetime = None):
+    params = {"limit": WHOOP_PAGE_LIMIT}
+    if start is not None:
+        params["start"] = start.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    return params
+
+
+def _collection_page(path: str, response):
+    """Return (records, next_token) from a collection page response."""
+    if response.status_code == 401:
+        raise WhoopUnauthorized(path)
+    if response.status_code != 200:
+        raise Exception(f"WHOOP API Error ({path}): {response.text}")
+    data = response.json()
+    return data.get("records", []), data.get("next_token")
+
+
+def _collection_pages(path: str, start: datetime = None):
+    """
+    Paging for fetch_collection: yields the query params of each request and
+    receives its response, following `next_token` up to WHOOP_MAX_PAGES.
+    Returns (records, complete) — complete is False if the page cap was hit.
+    """
+    params = _collection_params(start)
+    records = []
+    for _ in range(WHOOP_MAX_PAGES):
+        page, next_token = _collection_page(path, (yield params))
+        records.extend(page)
+        if not next_token:
+            return records, True
+        params["nextToken"] = next_token
+
+    return records, False
+
+
+def fetch_collection(access_token: str, path: str, start: datetime = None):
+    """
+    Fetch every record of a WHOOP collection (see _collection_pages).
+    Raises WhoopUnauthorized on 401 and Exception on any other error.
+    Returns (records, complete).
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    return http_client.drive(
+        _collection_pages(path, start),
+        lambda params: http_client.get(f"{WHOOP_API_URL}{path}", headers=headers, params=params)
+    )
+
+
+async def afetch_collection(access_token: str, path: str, start: datetime = None):
+    """Async counterpart of fetch_collection."""
+    headers = {"Authorization": f"Bearer {access_token}"}
+    return await http_client.adrive(
+        _collection_pages(path, start),
+        lambda params: http_client.aget(f"{WHOOP_API_URL}{path}", headers=headers, params=params)
+    )
+
+
+def _sort_outcomes(outcomes: dict, optional: tuple):
+    """
+    Split {path: (records, complete) or exception} into results and the paths
+    rejected with 401. Errors on `optional` paths become empty results.
     """
-    Fetch recent recovery and sleep data from WHOOP.
-    Automatically retries with a refreshed token on 401 responses.
-    Joins sleep performance data with recovery records by cycle_id.
+    results, unauthorized = {}, []
+    for path, outcome in outcomes.items():
+        if isinstance(outcome, WhoopUnauthorized):
+            unauthorized.append(path)
+        elif isinstance(outcome, Exception):
+            if path not in optional:
+                raise outcome
+            results[path] = ([], True)
+        else:
+            results[path] = outcome
+    return results, unauthorized
+
+
+def _split_results(results: dict):
+    """Return ({path: records}, truncated paths) from {path: (records, complete)}."""
+    truncated = [path for path, (_, complete) in results.items() if not complete]
+    return {path: records for path, (records, _) in results.items()}, truncated
+
+
+def fetch_collections(user: User, db: Session, paths: list, start: datetime = None, optional: tuple = ()):
     """
-    headers = {"Authorization": f"Bearer {user.whoop_access_token}"}
-    params = {"limit": limit}
+    Fetch several WHOOP collections concurrently.
+    If any request is rejected with 401, the token is refreshed once and only
+    the rejected collections are retried. Errors on `optional` collections
+    yield an empty list instead of failing the whole fetch.
+    Returns ({path: records}, truncated paths).
+    """
+    if user.whoop_expires_at and user.whoop_expires_at < time.time():
+        refresh_whoop_token(user, db)
 
-    response_recovery = requests.get(f"{WHOOP_API_URL}/recovery", headers=headers, params=params)
-    response_sleep = requests.get(f"{WHOOP_API_URL}/activity/sleep", headers=headers, params=params)
+    def fetch_all(token, pending):
+        with ThreadPoolExecutor(max_workers=len(pending), thread_name_prefix="whoop") as pool:
+            futures = {path: pool.submit(fetch_collection, token, path, start) for path in pending}
+        return _sort_outcomes({path: f.exception() or f.result() for path, f in futures.items()}, optional)
 
-    if response_recovery.status_code == 401 or response_sleep.status_code == 401:
+    results, unauthorized = fetch_all(user.whoop_access_token, paths)
+    if unauthorized:
         new_token = refresh_whoop_token(user, db)
-        if new_token:
-            headers = {"Authorization": f"Bearer {new_token}"}
-            response_recovery = requests.get(f"{WHOOP_API_URL}/recovery", headers=headers, params=params)
-            response_sleep = requests.get(f"{WHOOP_API_URL}/activity/sleep", headers=headers, params=params)
+        if not new_token:
+            raise Exception("WHOOP token expired and could not be refreshed")
+        retried, still_unauthorized = fetch_all(new_token, unauthorized)
+        if still_unauthorized:
+            raise Exception(f"WHOOP rejected refreshed token for {', '.join(still_unauthorized)}")
+        results.update(retried)
+
+    return _split_results(results)
+
+
+async def afetch_collections(user: User, db: AsyncSession, paths: list, start: datetime = None, optional: tuple = ()):
+    """Async counterpart of fetch_collections: concurrent fetches, one token refresh on 401."""
+    if user.whoop_expires_at and user.whoop_expires_at < time.time():
+        await arefresh_whoop_token(user, db)
+
+    async def fetch_all(token, pending):
+        outcomes = await asyncio.gather(
+            *(afetch_collection(token, path, start) for path in pending), return_exceptions=True
+        )
+        return _sort_outcomes(dict(zip(pending, outcomes)), optional)
+
+    results, unauthorized = await fetch_all(user.whoop_access_token, paths)
+    if unauthorized:
+        new_token = await arefresh_whoop_token(user, db)
+        if not new_token:
+            raise Exception("WHOOP token expired and could not be refreshed")
+        retried, still_unauthorized = await fetch_all(new_token, unauthorized)
+        if still_unauthorized:
+            raise Exception(f"WHOOP rejected refreshed token for {', '.join(still_unauthorized)}")
+        results.update(retried)
+
+    return _split_results(results)
 
-    if response_recovery.status_code != 200:
-        raise Exception(f"WHOOP Recovery API Error: {response_recovery.text}")
 
-    recovery_data = response_recovery.json()
-    recovery_records = recovery_data.get("records", [])
+def _sync_window(user: User):
+    """Return (pull_started, start) for a sync: now, and the watermark minus the overlap."""
+    start = user.whoop_synced_until - WHOOP_OVERLAP if user.whoop_synced_until else None
+    return datetime.utcnow(), start
+
+
+def _ingest_collections(user: User, db: Session, collections: dict, truncated: list, pull_started: datetime, start: datetime):
+    """
+    Ingest a sync's collections and advance the watermark to `pull_started`.
+    An incremental pull that hit WHOOP_MAX_PAGES keeps the watermark so the
+    gap is fetched next time; a first sync (no `start`) always advances it,
+    since WHOOP pages newest-first and the capped tail would never be reached.
+    Does not commit.
+    """
+    new_recoveries = ingest_recoveries(user, db, collections[RECOVERY_PATH], collections[SLEEP_PATH])
+    new_workouts = ingest_workouts(user, db, collections[WORKOUT_PATH])
+
+    if truncated and start is not None:
+        print(f"WHOOP sync for user {user.id} stopped at {WHOOP_MAX_PAGES} pages of {', '.join(truncated)}; keeping watermark")
+    else:
+        user.whoop_synced_until = pull_started
+    return new_recoveries, new_workouts
+
+
+def sync_whoop(user: User, db: Session):
+    """
+    Pull recoveries, sleeps and workouts newer than the user's watermark,
+    persist them, and advance the watermark. If an incremental pull hit
+    WHOOP_MAX_PAGES, what was fetched is still stored but the watermark is
+    kept, so the next sync asks for the same window again. A first sync
+    imports the newest WHOOP_MAX_PAGES pages of history.
+    Returns (new_recoveries, new_workouts).
+    """
+    pull_started, start = _sync_window(user)
+    collections, truncated = fetch_collections(user, db, SYNC_PATHS, start, optional=(SLEEP_PATH,))
+
+    result = _ingest_collections(user, db, collections, truncated, pull_started, start)
+    db.commit()
+    context_cache.invalidate(user.id)
+    return result
 
-    sleep_data = response_sleep.json() if response_sleep.status_code == 200 else {}
-    sleep_records = sleep_data.get("records", [])
 
+async def sync_whoop_async(user: User, db: AsyncSession):
+    """Async counterpart of sync_whoop for handlers on an AsyncSession."""
+    pull_started, start = _sync_window(user)
+    collections, truncated = await afetch_collections(user, db, SYNC_PATHS, start, optional=(SLEEP_PATH,))
+
+    result = await db.run_sync(
+        lambda session: _ingest_collections(user, session, collections, truncated, pull_started, start)
+    )
+    await db.commit()
+    context_cache.invalidate(user.id)
+    return result
+
+
+def ingest_recoveries(user: User, db: Session, recovery_records: list, sleep_records: list):
+    """
+    Upsert scored recovery records in bulk, joining sleep performance by
+    cycle_id. Late-arriving values (recovery score, HRV, RHR, sleep
+    performance) update rows that were synced before WHOOP finished scoring.
+    Touched days are refreshed in the daily rollups.
+    Does not commit. Returns the newly inserted rows.
+    """
     sleep_map = {}
     for s in sleep_records:
         cid = s.get("cycle_id")
         if cid:
             sleep_map[cid] = s
 
-    new_recoveries = []
-
+    rows = []
     for record in recovery_records:
-        score = record.get("score")
-        if not score:
-            continue
-
-        cycle_id = record.get("cycle_id")
-        rid = str(cycle_id)
-
-        sleep_record = sleep_map.get(cycle_id)
-        sleep_perf = None
-        if sleep_record:
-            sleep_score = sleep_record.get("score", {})
-            sleep_perf = sleep_score.get("sleep_performance_percentage")
-
-        existing = db.query(WhoopRecovery).filter(WhoopRecovery.whoop_id == rid).first()
-        if existing:
-            if existing.sleep_performance is None and sleep_perf is not None:
-                existing.sleep_performance = sleep_perf
-                db.add(existing)
-            continue
-
-        created_at = record.get("created_at")
-        date_str = created_at.split("T")[0] if created_at else None
-
-        new_recovery = WhoopRecovery(
-            user_id=user.id,
-            whoop_id=rid,
-            date=date_str,
-            recovery_score=score.get("recovery_score"),
-            resting_heart_rate=score.get("resting_heart_rate"),
-            hrv=score.get("hrv_rmssd_milli"),
-            sleep_performance=sleep_perf
-        )
-        db.add(new_recovery)
-        new_recoveries.append(new_recovery)
+        row = parse_recovery(user.id, record, sleep_map.get(record.get("cycle_id")))
+        if row:
+            rows.append(row)
 
-    db.commit()
+    new_recoveries, changed = ingest.bulk_upsert(db, WhoopRecovery, "whoop_id", rows)
+    if new_recoveries or changed:
+        rollups.refresh(db, user.id, {row["date"] for row in rows})
     return new_recoveries
 
 
-def fetch_workouts(user: User, db: Session, limit: int = 25):
+def ingest_workouts(user: User, db: Session, records: list):
     """
-    Fetch recent workouts from WHOOP.
-    Automatically retries with a refreshed token on 401 responses.
+    Upsert workout records in bulk, filling in strain, heart rate, energy and
+    zone durations once WHOOP has scored them, and refresh the touched days'
+    rollups. Does not commit. Returns the newly inserted rows.
     """
-    headers = {"Authorization": f"Bearer {user.whoop_access_token}"}
-    params = {"limit": limit}
+    rows = [parse_workout(user.id, record) for record in records]
+    new_workouts, changed = ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", rows)
+    if new_workouts or changed:
+        rollups.refresh(db, user.id, {
+            rollups.local_day(row["start"], row["timezone_offset"]) for row in rows if row["start"]
+        })
+    return new_workouts
 
-    response = requests.get(f"{WHOOP_API_URL}/activity/workout", headers=headers, params=params)
 
-    if response.status_code == 401:
-        new_token = refresh_whoop_token(user, db)
-        if new_token:
-            headers = {"Authorization": f"Bearer {new_token}"}
-            response = requests.get(f"{WHOOP_API_URL}/activity/workout", headers=headers, params=params)
+def parse_recovery(user_id: int, record: dict, sleep_record: dict = None):
+    """Map a WHOOP recovery (plus its cycle's sleep) to WhoopRecovery column values, or None if unscored."""
+    score = record.get("score")
+    if not score:
+        return None
 
-    if response.status_code != 200:
-        raise Exception(f"WHOOP Workout API Error: {response.text}")
+    sleep_perf = None
+    if sleep_record:
+        sleep_score = sleep_record.get("score") or {}
+        sleep_perf = sleep_score.get("sleep_performance_percentage")
+
+    created_at = record.get("created_at")
+    return {
+        "user_id": user_id,
+        "whoop_id": str(record.get("cycle_id")),
+        "date": date.fromisoformat(created_at[:10]) if created_at else None,
+        "recovery_score": score.get("recovery_score"),
+        "resting_heart_rate": score.get("resting_heart_rate"),
+        "hrv": score.get("hrv_rmssd_milli"),
+        "sleep_performance": sleep_perf
+    }
 
-    data = response.json()
-    records = data.get("records", [])
-    new_workouts = []
-
-    for record in records:
-        wid = str(record.get("id"))
-        existing = db.query(WhoopWorkout).filter(WhoopWorkout.whoop_id == wid).first()
-        if existing:
-            continue
-
-        score = record.get("score", {})
-
-        start_str = record.get("start")
-        end_str = record.get("end")
-        start_dt = datetime.fromisoformat(start_str.replace("Z", "+00:00")) if start_str else None
-        end_dt = datetime.fromisoformat(end_str.replace("Z", "+00:00")) if end_str else None
-
-        new_workout = WhoopWorkout(
-            user_id=user.id,
-            whoop_id=wid,
-            sport_name=record.get("sport_name"),
-            start=start_dt,
-            end=end_dt,
-            timezone_offset=record.get("timezone_offset"),
-            strain=score.get("strain"),
-            average_heart_rate=score.get("average_heart_rate"),
-            max_heart_rate=score.get("max_heart_rate"),
-            kilojoules=score.get("kilojoule"),
-            zone_durations=score.get("zone_durations")
-        )
-        db.add(new_workout)
-        new_workouts.append(new_workout)
 
-    db.commit()
-    return new_workouts
+def parse_workout(user_id: int, record: dict):
+    """Map a WHOOP workout to WhoopWorkout column values. Times are stored as naive UTC."""
+    score = record.get("score") or {}
+
+    def parse_time(value):
+        if not value:
+            return None
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+    return {
+        "user_id": user_id,
+        "whoop_id": str(record.get("id")),
+        "sport_name": record.get("sport_name"),
+        "start": parse_time(record.get("start")),
+        "end": parse_time(record.get("end")),
+        "timezone_offset": record.get("timezone_offset"),
+        "strain": score.get("strain"),
+        "average_heart_rate": score.get("average_heart_rate"),
+        "max_heart_rate": score.get("max_heart_rate"),
+        "kilojoules": score.get("kilojoule"),
+        **parse_zone_durations(score.get("zone_durations"))
+    }
+
+
+def parse_zone_durations(zone_durations: dict):
+    """Map a WHOOP zone_durations object to the zone0_milli..zone5_milli columns (all None if unscored)."""
+    if not zone_durations:
+        return {f"zone{zone}_milli": None for zone in range(len(ZONE_KEYS))}
+    return {f"zone{zone}_milli": int(zone_durations.get(key) or 0) for zone, key in enumerate(ZONE_KEYS)}
@@ -0,0 +1,154 @@
+"""
+Benchmark — ORM entity loads vs column projections on the read paths.
+
+Seeds a throwaway SQLite database with several years of Strava, WHOOP and
+schedule history for one user, then times the context and schedule reads
+both ways: loading full tracked entities (the previous implementation) and
+projecting only the needed columns (the current one).
+
+    cd backend
+    python benchmarks/bench_context_reads.py [--years 4] [--repeat 200]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+DB_DIR = tempfile.mkdtemp(prefix="bench_context_")
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_DIR}/bench.db"
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert  # noqa: E402
+from app.database import SessionLocal, engine  # noqa: E402
+from app.migrations import run_migrations  # noqa: E402
+from app.models import User, StravaActivity, WhoopRecovery, WhoopWorkout, Goal, WorkoutBlock  # noqa: E402
+from app.services.schedule_builder import BLOCK_COLUMNS  # noqa: E402
+from app.services.ai_coach import build_context  # noqa: E402
+
+
+def seed(years: int):
+    """Insert `years` of history for a single user and return the user id."""
+    rng = random.Random(42)
+    today = date.today()
+    days = [today - timedelta(days=i) for i in range(years * 365)]
+
+    with engine.begin() as conn:
+        user_id = conn.execute(insert(User).values(email="bench@example.com", settings={"units": "metric"})).inserted_primary_key[0]
+
+        activities, recoveries, workouts, blocks = [], [], [], []
+        for i, day in enumerate(days):
+            start = datetime.combine(day, datetime.min.time()) + timedelta(hours=7)
+            for n in range(rng.choice((1, 1, 2))):
+                activities.append({
+                    "user_id": user_id, "strava_id": len(activities) + 1, "name": "Run",
+                    "distance": rng.uniform(3000, 20000), "moving_time": rng.randint(900, 7200),
+                    "total_elevation_gain": rng.uniform(0, 300), "type": rng.choice(("Run", "Ride", "Swim")),
+                    "start_date": start + timedelta(hours=n * 8), "average_heartrate": rng.uniform(120, 170),
+                    "suffer_score": rng.randint(10, 200),
+                })
+            recoveries.append({
+                "user_id": user_id, "whoop_id": f"r{i}", "date": day, "recovery_score": rng.randint(20, 99),
+                "resting_heart_rate": rng.randint(40, 60), "hrv": rng.randint(40, 120), "sleep_performance": rng.randint(50, 100),
+            })
+            workouts.append({
+                "user_id": user_id, "whoop_id": f"w{i}", "sport_name": "running", "start": start,
+                "end": start + timedelta(hours=1), "strain": rng.uniform(5, 18), "average_heart_rate": 140,
+                "max_heart_rate": 180, "kilojoules": rng.uniform(1000, 4000), "zone_durations": {},
+            })
+            blocks.append({
+                "user_id": user_id, "date": day, "type": "Gym", "planned_duration_minutes": 60, "is_completed": True,
+            })
+
+        conn.execute(insert(StravaActivity), activities)
+        conn.execute(insert(WhoopRecovery), recoveries)
+        conn.execute(insert(WhoopWorkout), workouts)
+        conn.execute(insert(WorkoutBlock), blocks)
+        conn.execute(insert(Goal), [
+            {"user_id": user_id, "description": f"Goal {i}", "type": "preference", "status": "active"}
+            for i in range(20)
+        ])
+
+    print(f"Seeded {len(activities)} activities, {len(recoveries)} recoveries, "
+          f"{len(workouts)} WHOOP workouts, {len(blocks)} blocks")
+    return user_id
+
+
+def build_context_entities(user, db):
+    """The previous get_context query shape: full entities for every window."""
+    now = datetime.now()
+    activities = db.query(StravaActivity).filter(
+        StravaActivity.user_id == user.id, StravaActivity.start_date >= now - timedelta(days=28)).all()
+    recoveries = db.query(WhoopRecovery).filter(
+        WhoopRecovery.user_id == user.id, WhoopRecovery.date >= (now - timedelta(days=7)).date()).all()
+    workouts = db.query(WhoopWorkout).filter(
+        WhoopWorkout.user_id == user.id, WhoopWorkout.start >= now - timedelta(days=14)).all()
+    goals = db.query(Goal).filter(Goal.user_id == user.id, Goal.status == "active").all()
+    return (
+        [(a.start_date, a.type, a.distance, a.suffer_score) for a in activities],
+        [(r.date, r.recovery_score, r.hrv) for r in recoveries],
+        [(w.start, w.strain) for w in workouts],
+        [(g.description, g.type) for g in goals],
+    )
+
+
+def timed(label, fn, repeat):
+    db = SessionLocal()
+    try:
+        fn(db)  # warm up
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn(db)
+            db.expunge_all()
+        elapsed = (time.perf_counter() - start) / repeat * 1000
+    finally:
+        db.close()
+    print(f"  {label:<34} {elapsed:8.3f} ms")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--years", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    run_migrations(engine)
+    user_id = seed(args.years)
+    db = SessionLocal()
+    user = db.get(User, user_id)
+    db.expunge(user)
+    db.close()
+
+    today = date.today()
+    window_end = today + timedelta(days=6)
+    season_start = today - timedelta(weeks=16)
+
+    cases = [
+        ("Context (28/14/7-day windows)",
+         lambda db: build_context_entities(user, db),
+         lambda db: build_context(user, db)),
+        ("Schedule, 7-day window",
+         lambda db: db.query(WorkoutBlock).filter(WorkoutBlock.user_id == user_id, WorkoutBlock.date >= today, WorkoutBlock.date <= window_end).all(),
+         lambda db: db.query(*BLOCK_COLUMNS).filter(WorkoutBlock.user_id == user_id, WorkoutBlock.date >= today, WorkoutBlock.date <= window_end).all()),
+        ("Schedule, 16-week range",
+         lambda db: db.query(WorkoutBlock).filter(WorkoutBlock.user_id == user_id, WorkoutBlock.date >= season_start).all(),
+         lambda db: db.query(*BLOCK_COLUMNS).filter(WorkoutBlock.user_id == user_id, WorkoutBlock.date >= season_start).all()),
+        ("Full activity history",
+         lambda db: [(a.start_date, a.distance) for a in db.query(StravaActivity).filter(StravaActivity.user_id == user_id).all()],
+         lambda db: db.query(StravaActivity.start_date, StravaActivity.distance).filter(StravaActivity.user_id == user_id).all()),
+    ]
+
+    for name, entities, projected in cases:
+        print(name)
+        before = timed("ORM entities", entities, args.repeat)
+        after = timed("column projection", projected, args.repeat)
+        print(f"  {'speedup':<34} {before / after:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
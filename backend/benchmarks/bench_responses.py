@@ -0,0 +1,112 @@
+"""
+Benchmark — JSON serialization time and compressed size of the largest payloads.
+
+Builds representative bodies for the 3-day plan, the goal list and schedule
+windows, then compares Starlette's stdlib JSONResponse with the app's
+FastJSONResponse (orjson) and reports the wire size with gzip and Brotli at
+the middleware's configured levels.
+
+    cd backend
+    python benchmarks/bench_responses.py [--repeat 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from app.compression import brotli, compress  # noqa: E402
+from app.responses import FastJSONResponse  # noqa: E402
+
+ROUTINE = "\n".join(
+    [f"{i}. Warm up {i * 2} min at easy effort, then build to tempo." for i in range(1, 9)]
+    + [f"- Exercise {i}: 3 x 12 reps, 90 s rest" for i in range(1, 13)]
+)
+
+
+def plan_payload():
+    today = date.today()
+    return {
+        "plan": [
+            {
+                "date": (today + timedelta(days=i)).isoformat(),
+                "block_type": "Running",
+                "intensity": "Medium",
+                "focus": "Aerobic base with strides; keep heart rate in zone 2 for the main set.",
+                "routine": ROUTINE,
+                "notes": "Recovery was moderate, so cap the tempo portion at 20 minutes. " * 3,
+            }
+            for i in range(3)
+        ],
+        "sync": {"strava": {"synced": 3, "error": None}, "whoop": {"synced": 5, "error": None}},
+        "synced_at": datetime.utcnow().isoformat() + "Z",
+        "errors": {},
+    }
+
+
+def goals_payload(count=50):
+    return [
+        {
+            "id": i, "user_id": 1, "description": f"Run a sub-{40 + i % 10} minute 10k by the spring race",
+            "type": "performance" if i % 2 else "preference", "status": "active",
+            "target_date": (date.today() + timedelta(weeks=i)).isoformat(), "is_completed": False,
+        }
+        for i in range(count)
+    ]
+
+
+def schedule_payload(days):
+    start = date.today()
+    return [
+        {
+            "id": i, "user_id": 1, "date": (start + timedelta(days=i)).isoformat(),
+            "type": ("Gym", "Ultimate", "Running")[i % 3], "planned_duration_minutes": (60, 120, 45)[i % 3],
+            "notes": None, "is_completed": False,
+        }
+        for i in range(days)
+    ]
+
+
+def per_call_us(fn, repeat):
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    payloads = [
+        ("POST /coach/plan-3-day", plan_payload()),
+        ("GET /data/goals (50)", goals_payload()),
+        ("GET /schedule/ (7 days)", schedule_payload(7)),
+        ("POST /schedule/init (16 weeks)", schedule_payload(112)),
+        ("POST /schedule/init (366 days)", schedule_payload(366)),
+    ]
+
+    print(f"{'payload':<32} {'stdlib us':>10} {'orjson us':>10} {'raw B':>8} {'gzip B':>8} {'br B':>8}")
+    for name, payload in payloads:
+        content = jsonable_encoder(payload)
+        stdlib = per_call_us(lambda: JSONResponse(content), args.repeat)
+        fast = per_call_us(lambda: FastJSONResponse(content), args.repeat)
+
+        body = FastJSONResponse(content).body
+        gzipped = len(compress(body, "gzip"))
+        brotlied = len(compress(body, "br")) if brotli is not None else "-"
+        print(f"{name:<32} {stdlib:10.1f} {fast:10.1f} {len(body):8d} {gzipped:8d} {brotlied:>8}")
+
+    if brotli is None:
+        print("\nInstall `brotli` to enable Brotli responses and size comparisons.")
+
+
+if __name__ == "__main__":
+    main()
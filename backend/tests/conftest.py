@@ -0,0 +1,58 @@
+"""
+Test configuration — runs the app against a throwaway SQLite database.
+
+The engines are created when `app.database` is imported, so DATABASE_URL is
+set before anything from `app` is loaded. The schema is built once with the
+real migrations, and every table is emptied after each test.
+"""
+
+import os
+import shutil
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="trainer-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_dir}/test.db"
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["SYNC_SCHEDULER_ENABLED"] = "0"
+
+import pytest
+from app import migrations
+from app.database import Base, SessionLocal, engine
+from app.models import User
+from app.services import context_cache, training_load, user_cache
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    migrations.run_migrations(engine)
+    yield
+    engine.dispose()
+    shutil.rmtree(_db_dir, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    yield
+    with engine.begin() as conn:
+        for table in reversed(Base.metadata.sorted_tables):
+            conn.execute(table.delete())
+    user_cache.clear()
+    context_cache.clear()
+    training_load.clear()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def make_user(db):
+    def make(**fields):
+        user = User(**fields)
+        db.add(user)
+        db.commit()
+        return user
+    return make
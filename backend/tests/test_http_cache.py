@@ -0,0 +1,66 @@
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import user_sessions
+
+
+@pytest.fixture
+def client():
+    # No lifespan: the background sync and materialization loops stay off
+    return TestClient(app)
+
+
+@pytest.fixture
+def auth(db, make_user):
+    def sign_in():
+        user = make_user()
+        token = user_sessions.create(db, user.id)
+        db.commit()
+        return {"Authorization": f"Bearer {token}"}
+    return sign_in
+
+
+def test_etag_round_trip(client, auth):
+    headers = auth()
+    first = client.get("/data/goals", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+
+    revalidated = client.get("/data/goals", headers={**headers, "If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b""
+    assert revalidated.headers["etag"] == etag
+
+    created = client.post("/data/goals", headers=headers, json={
+        "description": "Sub-3 marathon", "type": "event", "status": "active",
+    })
+    assert created.status_code == 200
+
+    changed = client.get("/data/goals", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert [goal["description"] for goal in changed.json()] == ["Sub-3 marathon"]
+
+
+def test_if_modified_since_answers_304_until_the_next_write(client, auth):
+    headers = auth()
+    client.post("/data/goals", headers=headers, json={"description": "Run", "type": "other", "status": "active"})
+    last_modified = client.get("/data/goals", headers=headers).headers["last-modified"]
+
+    assert client.get("/data/goals", headers={**headers, "If-Modified-Since": last_modified}).status_code == 304
+
+
+def test_etags_are_per_user(client, auth):
+    first, second = auth(), auth()
+    etag = client.get("/data/goals", headers=first).headers["etag"]
+
+    assert client.get("/data/goals", headers={**second, "If-None-Match": etag}).status_code == 200
+
+
+def test_weak_and_listed_etags_match(client, auth):
+    headers = auth()
+    etag = client.get("/data/goals", headers=headers).headers["etag"]
+
+    listed = f'"other", W/{etag}'
+    assert client.get("/data/goals", headers={**headers, "If-None-Match": listed}).status_code == 304
@@ -0,0 +1,74 @@
+from app.models import WhoopRecovery, WhoopWorkout
+from app.services import ingest
+
+
+def workout(user_id, whoop_id, **fields):
+    return {"user_id": user_id, "whoop_id": whoop_id, "sport_name": "Running", "strain": None, **fields}
+
+
+def stored(db, model):
+    return {row.whoop_id: row for row in db.query(model).order_by(model.whoop_id)}
+
+
+def test_inserts_new_rows_and_updates_changed_fields(db, make_user):
+    user = make_user()
+    inserted, updated = ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", [
+        workout(user.id, "w1", strain=8.0), workout(user.id, "w2", strain=12.0)
+    ])
+    assert (len(inserted), len(updated)) == (2, 0)
+
+    inserted, updated = ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", [
+        workout(user.id, "w1", strain=8.0), workout(user.id, "w2", strain=13.5)
+    ])
+    assert inserted == []
+    assert [set(row) for row in updated] == [{"id", "strain"}]
+    assert stored(db, WhoopWorkout)["w2"].strain == 13.5
+
+
+def test_none_never_overwrites_stored_values(db, make_user):
+    user = make_user()
+    ingest.bulk_upsert(db, WhoopRecovery, "whoop_id", [{
+        "user_id": user.id, "whoop_id": "c1", "recovery_score": 71, "hrv": 62.5, "sleep_performance": 88,
+    }])
+
+    _, updated = ingest.bulk_upsert(db, WhoopRecovery, "whoop_id", [{
+        "user_id": user.id, "whoop_id": "c1", "recovery_score": 74, "hrv": None, "sleep_performance": None,
+    }])
+
+    row = stored(db, WhoopRecovery)["c1"]
+    assert updated == [{"id": row.id, "recovery_score": 74}]
+    assert (row.recovery_score, row.hrv, row.sleep_performance) == (74, 62.5, 88)
+
+
+def test_last_duplicate_in_a_batch_wins(db, make_user):
+    user = make_user()
+    ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", [
+        workout(user.id, "w1", strain=5.0), workout(user.id, "w1", strain=6.0)
+    ])
+    assert stored(db, WhoopWorkout)["w1"].strain == 6.0
+
+
+def test_never_touches_another_users_records(db, make_user):
+    owner, other = make_user(), make_user()
+    ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", [workout(owner.id, "w1", strain=5.0)])
+
+    inserted, updated = ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", [
+        workout(other.id, "w1", strain=19.0), workout(other.id, "w2", strain=3.0)
+    ])
+
+    rows = stored(db, WhoopWorkout)
+    assert [row["whoop_id"] for row in inserted] == ["w2"]
+    assert updated == []
+    assert (rows["w1"].user_id, rows["w1"].strain) == (owner.id, 5.0)
+    assert rows["w2"].user_id == other.id
+
+
+def test_large_batches_span_several_in_chunks(db, make_user, monkeypatch):
+    monkeypatch.setattr(ingest, "IN_CHUNK_SIZE", 3)
+    user = make_user()
+    rows = [workout(user.id, f"w{i}", strain=float(i)) for i in range(10)]
+    ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", rows)
+
+    inserted, updated = ingest.bulk_upsert(db, WhoopWorkout, "whoop_id", rows)
+    assert (inserted, updated) == ([], [])
+    assert len(stored(db, WhoopWorkout)) == 10
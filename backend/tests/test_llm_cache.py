@@ -0,0 +1,74 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+import pytest
+from app.services import llm_cache
+
+MESSAGES = [{"role": "system", "content": "Plan tomorrow."}]
+
+
+def fake_client(replies):
+    calls = []
+
+    async def create(**request):
+        calls.append(request)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=replies[len(calls) - 1]))])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))), calls
+
+
+def test_key_ignores_prompt_indentation():
+    indented = [{"role": "system", "content": "  Plan\n\n    tomorrow.  "}]
+    flat = [{"role": "system", "content": "Plan\ntomorrow."}]
+    assert llm_cache.make_key("m", indented) == llm_cache.make_key("m", flat)
+    assert llm_cache.make_key("m", flat) != llm_cache.make_key("other", flat)
+
+
+def test_concurrent_puts_on_one_key_store_a_single_entry():
+    errors = []
+    barrier = threading.Barrier(8)
+
+    def put(i):
+        barrier.wait()
+        try:
+            llm_cache.put("same-key", "m", f"reply {i}")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=put, args=(i,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert llm_cache.get_stats()["entries"] == 1
+    assert llm_cache.get("same-key").startswith("reply ")
+
+
+def test_store_swallows_write_failures(monkeypatch):
+    def broken_put(*args):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(llm_cache, "put", broken_put)
+    llm_cache.store("k" * 64, "m", "reply")
+
+
+def test_unparseable_completion_is_not_cached():
+    client, calls = fake_client(['{"plan": ', '{"plan": 1}'])
+
+    with pytest.raises(json.JSONDecodeError):
+        asyncio.run(llm_cache.acached_completion(client, "m", MESSAGES, parse=json.loads))
+    assert asyncio.run(llm_cache.acached_completion(client, "m", MESSAGES, parse=json.loads)) == {"plan": 1}
+    assert asyncio.run(llm_cache.acached_completion(client, "m", MESSAGES, parse=json.loads)) == {"plan": 1}
+    assert len(calls) == 2
+
+
+def test_use_cache_false_calls_the_api_and_refreshes_the_entry():
+    client, calls = fake_client(["first", "second"])
+
+    assert asyncio.run(llm_cache.acached_completion(client, "m", MESSAGES)) == "first"
+    assert asyncio.run(llm_cache.acached_completion(client, "m", MESSAGES, use_cache=False)) == "second"
+    assert asyncio.run(llm_cache.acached_completion(client, "m", MESSAGES)) == "second"
+    assert len(calls) == 2
@@ -0,0 +1,103 @@
+import json
+from sqlalchemy import inspect, text
+from app import migrations
+from app.database import Base, build_engine
+
+# The schema the original app created with Base.metadata.create_all, before
+# versioned migrations existed
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER PRIMARY KEY, email VARCHAR UNIQUE, name VARCHAR, age INTEGER, gender VARCHAR,
+        height INTEGER, weight INTEGER, openai_model VARCHAR, settings JSON,
+        strava_access_token VARCHAR, strava_refresh_token VARCHAR, strava_expires_at INTEGER,
+        whoop_access_token VARCHAR, whoop_refresh_token VARCHAR, whoop_expires_at INTEGER,
+        plan_today JSON, plan_tomorrow JSON, last_plan_date VARCHAR)""",
+    """CREATE TABLE goals (
+        id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), description VARCHAR, type VARCHAR,
+        target_date DATETIME, is_completed BOOLEAN, created_at DATETIME, status VARCHAR)""",
+    """CREATE TABLE strava_activities (
+        id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), strava_id INTEGER UNIQUE, name VARCHAR,
+        distance FLOAT, moving_time INTEGER, total_elevation_gain FLOAT, type VARCHAR, start_date DATETIME,
+        average_heartrate FLOAT, suffer_score INTEGER)""",
+    """CREATE TABLE whoop_recoveries (
+        id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), whoop_id VARCHAR UNIQUE, date VARCHAR,
+        recovery_score INTEGER, resting_heart_rate INTEGER, hrv INTEGER, sleep_performance INTEGER)""",
+    """CREATE TABLE training_plans (
+        id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), start_date VARCHAR, end_date VARCHAR,
+        content JSON, feedback TEXT)""",
+    """CREATE TABLE workout_blocks (
+        id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), date VARCHAR, type VARCHAR,
+        planned_duration_minutes INTEGER, notes TEXT, is_completed BOOLEAN)""",
+    """CREATE TABLE whoop_workouts (
+        id INTEGER PRIMARY KEY, user_id INTEGER REFERENCES users(id), whoop_id VARCHAR UNIQUE, sport_name VARCHAR,
+        start DATETIME, "end" DATETIME, timezone_offset VARCHAR, strain FLOAT, average_heart_rate INTEGER,
+        max_heart_rate INTEGER, kilojoules FLOAT, zone_durations JSON)""",
+]
+
+
+def baseline_engine(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path}/baseline.db")
+    zones = json.dumps({"zone_one_milli": 600000, "zone_two_milli": 1200000})
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO users (id, name, settings) VALUES (1, 'Legacy', '{}')"))
+        conn.execute(text(
+            "INSERT INTO goals (user_id, description, type, status) VALUES (1, 'Sub-3 marathon', 'event', 'active')"
+        ))
+        conn.execute(text(
+            "INSERT INTO strava_activities (user_id, strava_id, name, distance, moving_time, "
+            "total_elevation_gain, type, start_date, suffer_score) "
+            "VALUES (1, 99, 'Long run', 30000, 9000, 120, 'Run', '2026-09-30 07:00:00.000000', 150)"
+        ))
+        conn.execute(text(
+            "INSERT INTO whoop_workouts (user_id, whoop_id, sport_name, start, timezone_offset, strain, zone_durations) "
+            "VALUES (1, 'w1', 'Running', '2026-10-01 10:00:00.000000', '+00:00', 12.5, :zones)"
+        ), {"zones": zones})
+        # The baseline allowed several blocks per day; the newest one is kept
+        for block_type in ("Gym", "Running"):
+            conn.execute(text(
+                "INSERT INTO workout_blocks (user_id, date, type, planned_duration_minutes, is_completed) "
+                "VALUES (1, '2026-10-02', :type, 60, 0)"
+            ), {"type": block_type})
+    return engine
+
+
+def test_upgrades_a_baseline_database_to_the_current_models(tmp_path):
+    engine = baseline_engine(tmp_path)
+    try:
+        assert migrations.run_migrations(engine) == [version for version, _, _ in migrations.MIGRATIONS]
+
+        inspector = inspect(engine)
+        for table in Base.metadata.sorted_tables:
+            columns = {col["name"] for col in inspector.get_columns(table.name)}
+            assert set(table.columns.keys()) <= columns, table.name
+
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT name FROM users")).scalar() == "Legacy"
+            assert conn.execute(text("SELECT description FROM goals")).scalar() == "Sub-3 marathon"
+            assert conn.execute(text("SELECT type FROM workout_blocks")).all() == [("Running",)]
+            assert conn.execute(text(
+                "SELECT zone0_milli, zone1_milli, zone2_milli, zone5_milli FROM whoop_workouts"
+            )).one() == (0, 600000, 1200000, 0)
+            rollups = dict(conn.execute(text("SELECT date, training_load FROM daily_rollups")).all())
+            assert set(rollups) == {"2026-09-30", "2026-10-01"}
+            assert rollups["2026-09-30"] == 150
+    finally:
+        engine.dispose()
+
+
+def test_migrations_run_once(tmp_path):
+    engine = baseline_engine(tmp_path)
+    try:
+        migrations.run_migrations(engine)
+        assert migrations.run_migrations(engine) == []
+        assert migrations.pending_migrations(engine) == []
+    finally:
+        engine.dispose()
+
+
+def test_versions_are_unique_and_ordered():
+    versions = [version for version, _, _ in migrations.MIGRATIONS]
+    assert versions == sorted(set(versions))
+    assert migrations.REBUILDS_ROLLUPS <= set(versions)
@@ -0,0 +1,116 @@
+from types import SimpleNamespace
+import pytest
+from app.services import prompt_compiler
+from app.services.prompt_compiler import compile_prompt, count_tokens, section
+
+
+@pytest.fixture(autouse=True)
+def fresh_compiler():
+    prompt_compiler.clear_stats()
+    prompt_compiler._encoding.cache_clear()
+    yield
+    prompt_compiler.clear_stats()
+    prompt_compiler._encoding.cache_clear()
+
+
+@pytest.fixture
+def no_tiktoken_files(monkeypatch):
+    """tiktoken is importable, but neither the model nor the default encoding can be loaded."""
+    def unknown_model(model):
+        raise KeyError(model)
+
+    def download_failed(name):
+        raise OSError("BPE file download failed")
+
+    monkeypatch.setattr(prompt_compiler, "tiktoken", SimpleNamespace(
+        encoding_for_model=unknown_model, get_encoding=download_failed
+    ))
+
+
+def activities(count):
+    return [{"day": f"2026-09-{i % 30 + 1:02d}", "type": "Run", "minutes": 30 + i, "load": 40 + i} for i in range(count)]
+
+
+def parts(recent, extra):
+    return [
+        "You are an expert running coach.",
+        section("Goals", "Sub-3 marathon in December", priority=0),
+        section("Recent Activities", recent, priority=1, min_items=3),
+        section("Older Notes", extra, priority=2),
+        "Reply with JSON only.",
+    ]
+
+
+def test_estimate_used_when_tiktoken_cannot_load(no_tiktoken_files):
+    text = "Tempo run: 3x10' @ 4:05/km, 90s jog recoveries."
+
+    assert count_tokens(text, "gpt-4o") == len(prompt_compiler._TOKEN_ESTIMATE.findall(text))
+    assert prompt_compiler.get_stats()["tokenizer"] == "estimate"
+
+
+def test_estimate_used_without_tiktoken(monkeypatch):
+    monkeypatch.setattr(prompt_compiler, "tiktoken", None)
+
+    assert count_tokens("easy 45min") == 3  # easy / 45mi / n
+    assert prompt_compiler.get_stats()["tokenizer"] == "estimate"
+
+
+def test_encoding_used_when_available(monkeypatch):
+    encoding = SimpleNamespace(encode=lambda text, disallowed_special=(): text.split())
+    monkeypatch.setattr(prompt_compiler, "tiktoken", SimpleNamespace(
+        encoding_for_model=lambda model: encoding, get_encoding=lambda name: encoding
+    ))
+
+    assert count_tokens("one two three", "gpt-4o") == 3
+    assert prompt_compiler.get_stats()["tokenizer"] == "tiktoken"
+
+
+def test_under_budget_prompt_is_not_cut(no_tiktoken_files):
+    prompt, metrics = compile_prompt("plan", parts(activities(5), ["note"]), budget=10_000)
+
+    assert metrics["truncated"] == [] and metrics["dropped"] == []
+    assert metrics["full_tokens"] == metrics["tokens"] == count_tokens(prompt)
+    assert "Older Notes" in prompt
+
+
+def test_budget_drops_lowest_priority_then_halves_lists(no_tiktoken_files):
+    recent = activities(40)
+    floor, _ = compile_prompt("floor", [p for p in parts(recent[-3:], []) if not (isinstance(p, dict) and p["label"] == "Older Notes")])
+    budget = count_tokens(floor) + len(parts(recent, [])) + 5
+
+    prompt, metrics = compile_prompt("plan", parts(recent, [f"note {i}" for i in range(50)]), budget=budget)
+
+    # Lists are halved before their section is dropped
+    assert metrics["truncated"] == ["Older Notes", "Recent Activities"]
+    assert metrics["dropped"] == ["Older Notes"]
+    assert metrics["tokens"] <= budget < metrics["full_tokens"]
+    assert "Older Notes" not in prompt
+    # The most recent items survive, down to the section's floor
+    assert prompt_compiler.compact(recent[-3:]) in prompt
+    assert prompt_compiler.compact(recent[-4:]) not in prompt
+    assert prompt.startswith("You are an expert running coach.\n- Goals: Sub-3 marathon in December")
+    assert prompt.endswith("Reply with JSON only.")
+
+
+def test_priority_zero_and_fixed_text_are_never_cut(no_tiktoken_files):
+    prompt, metrics = compile_prompt("plan", parts(activities(8), ["note"]), budget=1)
+
+    assert "Sub-3 marathon in December" in prompt and "Reply with JSON only." in prompt
+    # min_items keeps a floor even when the budget can't be met
+    assert prompt_compiler.compact(activities(8)[-3:]) in prompt
+    assert metrics["tokens"] > metrics["budget"]
+    assert prompt_compiler.get_stats()["prompts"]["plan"]["over_budget"] == 1
+
+
+def test_fit_messages_keeps_the_latest_turns(no_tiktoken_files):
+    messages = [{"role": "user", "content": f"message number {i} " * 5} for i in range(10)]
+    cost = count_tokens(messages[0]["content"]) + 4
+
+    assert prompt_compiler.fit_messages(messages, budget=cost * 3) == messages[-3:]
+    assert prompt_compiler.fit_messages(messages, budget=1) == messages[-1:]
+
+
+def test_lists_of_records_are_tabulated():
+    value = [{"day": "Mon", "load": 50}, {"day": "Tue", "load": None, "note": "rest"}]
+
+    assert prompt_compiler.compact(value) == '{"columns":["day","load","note"],"rows":[["Mon",50,null],["Tue",null,"rest"]]}'
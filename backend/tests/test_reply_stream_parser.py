@@ -0,0 +1,40 @@
+import json
+import pytest
+from app.services.ai_coach import ReplyStreamParser
+
+DOCUMENT = json.dumps({
+    "reply": 'Swap to "easy" intervals:\n\t1\\2 pace, café ☕ and 😀 done',
+    "plan": {"notes": "ignored \"reply\": \"nope\""},
+}, ensure_ascii=True)
+REPLY = json.loads(DOCUMENT)["reply"]
+
+
+def feed_all(parser, chunks):
+    return "".join(parser.feed(chunk) for chunk in chunks)
+
+
+def test_decodes_escapes_and_unicode_fed_one_character_at_a_time():
+    assert feed_all(ReplyStreamParser(), DOCUMENT) == REPLY
+
+
+@pytest.mark.parametrize("size", [2, 3, 5, 7, 13])
+def test_decodes_the_same_reply_for_any_chunking(size):
+    chunks = [DOCUMENT[i:i + size] for i in range(0, len(DOCUMENT), size)]
+    assert feed_all(ReplyStreamParser(), chunks) == REPLY
+
+
+def test_surrogate_pair_split_across_chunks():
+    parser = ReplyStreamParser()
+    assert parser.feed('{"reply": "a\\ud83d') == "a"
+    assert parser.feed('\\ude00b"}') == "😀b"
+
+
+def test_reply_after_other_keys_and_text_after_the_reply_is_ignored():
+    parser = ReplyStreamParser()
+    assert parser.feed('{"plan": {"intensity": "Low"}, "reply": "Done.') == "Done."
+    assert parser.feed('", "extra": "x"}') == ""
+    assert parser.feed('more') == ""
+
+
+def test_no_reply_key_yields_nothing():
+    assert feed_all(ReplyStreamParser(), ['{"plan": ', '{"notes": "x"}}']) == ""
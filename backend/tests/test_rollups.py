@@ -0,0 +1,128 @@
+import threading
+from datetime import date, datetime, timedelta
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.models import DailyRollup, StravaActivity, WhoopRecovery, WhoopWorkout
+from app.services import resource_versions, rollups
+
+FIRST_DAY = date(2026, 9, 1)
+DAYS = [FIRST_DAY + timedelta(days=i) for i in range(21)]
+
+
+def seed_history(db, user_id):
+    for i, day in enumerate(DAYS):
+        db.add(StravaActivity(
+            user_id=user_id, strava_id=user_id * 1000 + i, name="Run", type="Run",
+            distance=8000.0 + i, moving_time=2400, total_elevation_gain=40.0,
+            start_date=datetime.combine(day, datetime.min.time()) + timedelta(hours=7),
+            suffer_score=None if i % 3 == 0 else 50 + i
+        ))
+        if i % 2 == 0:
+            db.add(WhoopWorkout(
+                user_id=user_id, whoop_id=f"w-{user_id}-{i}", sport_name="Functional Fitness",
+                start=datetime.combine(day, datetime.min.time()) + timedelta(hours=23), timezone_offset="+02:00",
+                strain=10.0 + i / 2, kilojoules=900.0, zone2_milli=600000
+            ))
+        db.add(WhoopRecovery(
+            user_id=user_id, whoop_id=f"r-{user_id}-{i}", date=day,
+            recovery_score=40 + i, hrv=60, resting_heart_rate=50, sleep_performance=90
+        ))
+    db.commit()
+
+
+def stored(db, user_id):
+    rows = db.scalars(select(DailyRollup).where(DailyRollup.user_id == user_id).order_by(DailyRollup.date)).all()
+    return {
+        row.date: {col.name: getattr(row, col.name) for col in DailyRollup.__table__.columns}
+        for row in rows
+    }
+
+
+def expected(db, user_id):
+    return dict(sorted(rollups.aggregate(db, user_id, DAYS[0], DAYS[-1]).items()))
+
+
+def test_refresh_is_idempotent(db, make_user):
+    user = make_user()
+    seed_history(db, user.id)
+
+    rollups.refresh(db, user.id, DAYS)
+    db.commit()
+    first = stored(db, user.id)
+    rollups.refresh(db, user.id, DAYS)
+    db.commit()
+
+    assert stored(db, user.id) == first == expected(db, user.id)
+    # WHOOP workouts at 23:00 UTC land on the next local day (+02:00)
+    assert first[DAYS[1]]["workout_count"] == 1 and first[DAYS[0]]["workout_count"] == 0
+    assert resource_versions.current(db, user.id, resource_versions.HISTORY)[0] == 2
+
+
+def test_refresh_replaces_stale_days_in_its_span_only(db, make_user):
+    user = make_user()
+    seed_history(db, user.id)
+    rollups.rebuild(db, user.id)
+    db.commit()
+
+    outside = DAYS[-1]
+    db.get(DailyRollup, (user.id, outside)).distance = 1.0
+    gone = db.scalars(select(StravaActivity).where(StravaActivity.user_id == user.id)).first()
+    gone_day = gone.start_date.date()
+    db.delete(gone)
+    db.get(DailyRollup, (user.id, gone_day)).activity_count = 99
+    db.commit()
+
+    rollups.refresh(db, user.id, [gone_day, gone_day + timedelta(days=3)])
+    db.commit()
+
+    rows = stored(db, user.id)
+    assert rows[gone_day]["activity_count"] == 0
+    assert rows[outside]["distance"] == 1.0
+
+
+def test_write_overwrites_rows_from_another_transaction(db, make_user):
+    user = make_user()
+    seed_history(db, user.id)
+    # Another sync computed and wrote these days after this one's DELETE
+    other = SessionLocal()
+    try:
+        rollups._write(other, {day: rollups._empty_row(user.id, day) for day in DAYS})
+        other.commit()
+    finally:
+        other.close()
+
+    rollups._write(db, rollups.aggregate(db, user.id, DAYS[0], DAYS[-1]))
+    db.commit()
+
+    assert stored(db, user.id) == expected(db, user.id)
+
+
+def test_overlapping_refreshes(db, make_user):
+    users = [make_user(), make_user()]
+    for user in users:
+        seed_history(db, user.id)
+    spans = [DAYS[:14], DAYS[7:], DAYS, DAYS[3:10], DAYS[10:], DAYS[:5]]
+    barrier = threading.Barrier(len(spans) * len(users))
+    errors = []
+
+    def sync(user_id, span):
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            rollups.refresh(session, user_id, span)
+            session.commit()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=sync, args=(user.id, span)) for user in users for span in spans]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    for user in users:
+        assert stored(db, user.id) == expected(db, user.id)
+        assert resource_versions.current(db, user.id, resource_versions.HISTORY)[0] == len(spans)
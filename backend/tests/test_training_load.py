@@ -0,0 +1,87 @@
+import math
+from datetime import date, timedelta
+import numpy as np
+import pytest
+from app.models import DailyRollup
+from app.services import training_load
+
+
+def naive_ewma(x, days, initial=0.0):
+    alpha = 1.0 - math.exp(-1.0 / days)
+    out, y = [], initial
+    for value in x:
+        y = y + alpha * (value - y)
+        out.append(y)
+    return np.array(out)
+
+
+def naive_rolling_sum(x, window):
+    return np.array([sum(x[max(i - window + 1, 0):i + 1]) for i in range(len(x))])
+
+
+def daily_loads(days, seed=7):
+    rng = np.random.default_rng(seed)
+    # Mostly training days, some rest days, and an occasional very hard day
+    loads = rng.gamma(2.0, 40.0, days) * (rng.random(days) > 0.25)
+    loads[rng.random(days) > 0.97] = 600.0
+    return loads
+
+
+@pytest.mark.parametrize("days", [training_load.ATL_DAYS, training_load.CTL_DAYS])
+@pytest.mark.parametrize("length", [1, training_load.EWMA_BLOCK - 1, training_load.EWMA_BLOCK, 1000])
+def test_ewma_blocks_match_the_recurrence(days, length):
+    loads = daily_loads(length)
+
+    for initial in (0.0, 85.0):
+        assert np.allclose(training_load.ewma(loads, days, initial), naive_ewma(loads, days, initial), rtol=1e-9, atol=1e-9)
+
+
+def test_ewma_of_empty_series():
+    assert len(training_load.ewma(np.zeros(0), training_load.ATL_DAYS, 50.0)) == 0
+
+
+def test_ewma_continues_from_state():
+    loads = daily_loads(500)
+    head = training_load.ewma(loads[:300], training_load.CTL_DAYS)
+    tail = training_load.ewma(loads[300:], training_load.CTL_DAYS, head[-1])
+
+    assert np.allclose(np.concatenate((head, tail)), training_load.ewma(loads, training_load.CTL_DAYS))
+
+
+@pytest.mark.parametrize("window", [1, training_load.ACUTE_WINDOW, training_load.CHRONIC_WINDOW])
+def test_rolling_sum_matches_naive(window):
+    loads = daily_loads(200)
+
+    assert np.allclose(training_load.rolling_sum(loads, window), naive_rolling_sum(loads, window))
+
+
+def test_incremental_series_matches_full_rebuild(db, make_user):
+    user = make_user()
+    today = date(2026, 10, 17)
+    loads = daily_loads(400)
+    first = today - timedelta(days=len(loads) - 1)
+    db.add_all(
+        DailyRollup(user_id=user.id, date=first + timedelta(days=i), training_load=float(load))
+        for i, load in enumerate(loads) if load
+    )
+    db.commit()
+    training_load.get_series(db, user.id, today)
+
+    changed = today - timedelta(days=20)
+    db.merge(DailyRollup(user_id=user.id, date=changed, training_load=450.0))
+    db.commit()
+    training_load.mark_changed(user.id, changed)
+    incremental = training_load.get_series(db, user.id, today + timedelta(days=2))
+
+    # The window slid two days; the EWMA keeps the state from the first build
+    window = training_load.TRAINING_LOAD_HISTORY_DAYS
+    expected = np.concatenate((loads[-window:], [0.0, 0.0]))
+    expected[window - 1 - 20] = 450.0
+    assert incremental["start"] == today - timedelta(days=window - 3)
+    assert np.array_equal(incremental["loads"], expected[2:])
+    assert np.allclose(incremental["atl"], naive_ewma(expected, training_load.ATL_DAYS)[2:])
+    assert np.allclose(incremental["ctl"], naive_ewma(expected, training_load.CTL_DAYS)[2:])
+
+    training_load.clear()
+    full = training_load.get_series(db, user.id, today + timedelta(days=2))
+    assert np.array_equal(full["loads"], incremental["loads"])
@@ -0,0 +1,123 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from app.models import WhoopWorkout
+from app.services import http_client, whoop_client
+
+
+def response(status_code, body):
+    return SimpleNamespace(status_code=status_code, json=lambda: body, text=str(body), headers={})
+
+
+class FakeWhoop:
+    """Serves `workout_pages` pages of one workout each; recoveries and sleeps are empty."""
+
+    def __init__(self, workout_pages):
+        self.workout_pages = workout_pages
+        self.requests = []
+
+    def get(self, url, headers=None, params=None, **kwargs):
+        self.requests.append((url, dict(params)))
+        if not url.endswith(whoop_client.WORKOUT_PATH):
+            return response(200, {"records": [], "next_token": None})
+        page = int(params.get("nextToken", 0))
+        record = {
+            "id": f"w{page}", "start": "2026-10-01T10:00:00Z", "end": "2026-10-01T11:00:00Z",
+            "timezone_offset": "+00:00", "score": None,
+        }
+        next_token = str(page + 1) if page + 1 < self.workout_pages else None
+        return response(200, {"records": [record], "next_token": next_token})
+
+    async def aget(self, url, **kwargs):
+        return self.get(url, **kwargs)
+
+
+@pytest.fixture
+def whoop(monkeypatch):
+    def install(workout_pages, max_pages=3):
+        fake = FakeWhoop(workout_pages)
+        monkeypatch.setattr(http_client, "get", fake.get)
+        monkeypatch.setattr(http_client, "aget", fake.aget)
+        monkeypatch.setattr(whoop_client, "WHOOP_MAX_PAGES", max_pages)
+        return fake
+    return install
+
+
+def test_fetch_collection_reports_whether_it_reached_the_end(whoop):
+    whoop(workout_pages=2)
+    records, complete = whoop_client.fetch_collection("token", whoop_client.WORKOUT_PATH)
+    assert [r["id"] for r in records] == ["w0", "w1"]
+    assert complete
+
+    whoop(workout_pages=5)
+    records, complete = whoop_client.fetch_collection("token", whoop_client.WORKOUT_PATH)
+    assert len(records) == 3
+    assert not complete
+
+
+def test_sync_and_async_fetch_the_same_pages(whoop):
+    whoop(workout_pages=5)
+    assert asyncio.run(whoop_client.afetch_collection("token", whoop_client.WORKOUT_PATH)) == \
+        whoop_client.fetch_collection("token", whoop_client.WORKOUT_PATH)
+
+
+def test_complete_sync_advances_the_watermark(db, make_user, whoop):
+    user = make_user(whoop_access_token="token", whoop_synced_until=datetime(2026, 10, 1))
+    whoop(workout_pages=2)
+
+    _, workouts = whoop_client.sync_whoop(user, db)
+
+    assert len(workouts) == 2
+    assert user.whoop_synced_until > datetime(2026, 10, 1)
+
+
+def test_truncated_incremental_sync_keeps_the_watermark(db, make_user, whoop):
+    watermark = datetime(2026, 10, 1)
+    user = make_user(whoop_access_token="token", whoop_synced_until=watermark)
+    fake = whoop(workout_pages=10)
+
+    whoop_client.sync_whoop(user, db)
+
+    assert user.whoop_synced_until == watermark
+    assert db.query(WhoopWorkout).count() == 3
+    expected_start = (watermark - whoop_client.WHOOP_OVERLAP).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    assert {params["start"] for _, params in fake.requests} == {expected_start}
+
+
+def test_truncated_first_sync_still_advances_the_watermark(db, make_user, whoop):
+    user = make_user(whoop_access_token="token")
+    fake = whoop(workout_pages=10)
+
+    whoop_client.sync_whoop(user, db)
+    assert user.whoop_synced_until is not None
+    assert all("start" not in params for _, params in fake.requests)
+
+    # The next pull is incremental instead of re-reading the capped history
+    fake.requests.clear()
+    whoop_client.sync_whoop(user, db)
+    assert all("start" in params for _, params in fake.requests)
+
+
+def test_zone_durations_parse_to_columns():
+    zones = whoop_client.parse_zone_durations({"zone_one_milli": 60000, "zone_five_milli": 1500})
+    assert zones == {
+        "zone0_milli": 0, "zone1_milli": 60000, "zone2_milli": 0,
+        "zone3_milli": 0, "zone4_milli": 0, "zone5_milli": 1500,
+    }
+    assert set(whoop_client.parse_zone_durations(None).values()) == {None}
+
+
+def test_sleep_failure_is_optional(db, make_user, whoop, monkeypatch):
+    user = make_user(whoop_access_token="token")
+    fake = whoop(workout_pages=1)
+
+    def get(url, **kwargs):
+        if url.endswith(whoop_client.SLEEP_PATH):
+            return response(500, {"message": "unavailable"})
+        return fake.get(url, **kwargs)
+
+    monkeypatch.setattr(http_client, "get", get)
+    _, workouts = whoop_client.sync_whoop(user, db)
+    assert len(workouts) == 1
+    assert datetime.utcnow() - user.whoop_synced_until < timedelta(minutes=1)
@@ -2,6 +2,8 @@ import axios from 'axios';
 
 const api = axios.create({
     baseURL: 'http://localhost:8000',
+    // Send the session cookie set by the Strava/WHOOP sign-in callbacks
+    withCredentials: true,
     headers: {
         'Content-Type': 'application/json',
     },
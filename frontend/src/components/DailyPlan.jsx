@@ -7,6 +7,7 @@ export default function DailyPlan() {
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
     const [syncInfo, setSyncInfo] = useState(null);
+    const [syncedAt, setSyncedAt] = useState(null);
     const [editingDay, setEditingDay] = useState(null); // { idx: 0|1, label: "today"|"tomorrow" }
 
     useEffect(() => {
@@ -17,11 +18,17 @@ export default function DailyPlan() {
         setLoading(true);
         setError(null);
         setSyncInfo(null);
+        setSyncedAt(null);
         api.post('/coach/plan-3-day')
             .then(res => {
                 if (res.data.sync) setSyncInfo(res.data.sync);
+                if (res.data.synced_at) setSyncedAt(new Date(res.data.synced_at));
                 if (res.data.plan && Array.isArray(res.data.plan)) {
                     setPlan(res.data.plan);
+                    const failedDays = Object.keys(res.data.errors || {});
+                    if (failedDays.length > 0) {
+                        setError(`Couldn't update the plan for ${failedDays.join(' and ')}. Refresh to retry.`);
+                    }
                 } else if (res.data.message) {
                     setError(res.data.message);
                 } else {
@@ -35,6 +42,15 @@ export default function DailyPlan() {
             .finally(() => setLoading(false));
     };
 
+    const formatSyncAge = (date) => {
+        const minutes = Math.floor((Date.now() - date.getTime()) / 60000);
+        if (minutes < 1) return 'just now';
+        if (minutes < 60) return `${minutes}m ago`;
+        const hours = Math.floor(minutes / 60);
+        if (hours < 24) return `${hours}h ago`;
+        return `${Math.floor(hours / 24)}d ago`;
+    };
+
     const renderSyncStatus = () => {
         if (!syncInfo) return null;
         const displayNames = { strava: 'Strava', whoop: 'WHOOP' };
@@ -60,6 +76,9 @@ export default function DailyPlan() {
             <div className="flex items-center gap-3 text-xs px-3 py-1.5 bg-gray-100 dark:bg-gray-700/30 rounded-lg border border-gray-200 dark:border-gray-700">
                 <span className="text-gray-400 dark:text-gray-500 font-medium">Sync</span>
                 {items}
+                {syncedAt && (
+                    <span className="text-gray-400 dark:text-gray-500">{formatSyncAge(syncedAt)}</span>
+                )}
             </div>
         );
     };
@@ -77,7 +96,7 @@ export default function DailyPlan() {
                         onClick={handleGenerate}
                         disabled={loading}
                         className="bg-blue-600 hover:bg-blue-500 text-white px-4 py-2 rounded-lg text-sm font-medium transition disabled:opacity-50 whitespace-nowrap">
-                        {loading ? 'Syncing...' : 'Refresh'}
+                        {loading ? 'Loading...' : 'Refresh'}
                     </button>
                 </div>
             </div>
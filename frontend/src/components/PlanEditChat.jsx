@@ -14,41 +14,89 @@ export default function PlanEditChat({ dayLabel, dayPlan, onClose, onPlanUpdated
     const [messages, setMessages] = useState([]);
     const [input, setInput] = useState('');
     const [loading, setLoading] = useState(false);
+    const [streaming, setStreaming] = useState(false);
     const chatEndRef = useRef(null);
 
     useEffect(() => {
         chatEndRef.current?.scrollIntoView({ behavior: 'smooth' });
     }, [messages]);
 
-    const handleSend = () => {
+    const appendToReply = (text) => {
+        setMessages(prev => {
+            const last = prev[prev.length - 1];
+            return [...prev.slice(0, -1), { ...last, content: last.content + text }];
+        });
+    };
+
+    const setReply = (text) => {
+        setMessages(prev => [...prev.slice(0, -1), { role: 'assistant', content: text }]);
+    };
+
+    const handleEvent = (event, data) => {
+        if (event === 'token') {
+            setStreaming(true);
+            appendToReply(data.text);
+        } else if (event === 'done') {
+            setReply(data.reply);
+            if (data.plan) {
+                onPlanUpdated(data.plan);
+            }
+        } else if (event === 'error') {
+            setReply(data.reply);
+        }
+    };
+
+    const handleSend = async () => {
         const text = input.trim();
         if (!text || loading) return;
 
         const userMsg = { role: 'user', content: text };
-        const updatedMessages = [...messages, userMsg];
-        setMessages(updatedMessages);
+        const updatedMessages = [...messages.filter(msg => msg.content), userMsg];
+        // Empty assistant message is filled in as reply tokens stream in
+        setMessages([...updatedMessages, { role: 'assistant', content: '' }]);
         setInput('');
         setLoading(true);
+        setStreaming(false);
+
+        try {
+            const res = await fetch(`${api.defaults.baseURL}/coach/edit-plan/stream`, {
+                method: 'POST',
+                credentials: 'include',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ day: dayLabel, messages: updatedMessages })
+            });
+            if (!res.ok || !res.body) throw new Error(`Request failed: ${res.status}`);
+
+            // Parse server-sent events: blocks of "event: x\ndata: {...}" separated by blank lines
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
 
-        api.post('/coach/edit-plan', {
-            day: dayLabel,
-            messages: updatedMessages
-        })
-            .then(res => {
-                const assistantMsg = { role: 'assistant', content: res.data.reply };
-                setMessages(prev => [...prev, assistantMsg]);
-                if (res.data.plan) {
-                    onPlanUpdated(res.data.plan);
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const block = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let event = 'message';
+                    let data = '';
+                    for (const line of block.split('\n')) {
+                        if (line.startsWith('event: ')) event = line.slice(7);
+                        else if (line.startsWith('data: ')) data += line.slice(6);
+                    }
+                    if (data) handleEvent(event, JSON.parse(data));
                 }
-            })
-            .catch(err => {
-                console.error(err);
-                setMessages(prev => [...prev, {
-                    role: 'assistant',
-                    content: 'Sorry, something went wrong. Please try again.'
-                }]);
-            })
-            .finally(() => setLoading(false));
+            }
+        } catch (err) {
+            console.error(err);
+            setReply('Sorry, something went wrong. Please try again.');
+        } finally {
+            setLoading(false);
+            setStreaming(false);
+        }
     };
 
     const handleKeyDown = (e) => {
@@ -88,7 +136,7 @@ export default function PlanEditChat({ dayLabel, dayPlan, onClose, onPlanUpdated
                             <p className="text-xs text-gray-600 mt-2">e.g. "Make it 30 min shorter" or "I tweaked my ankle, go easy"</p>
                         </div>
                     )}
-                    {messages.map((msg, i) => (
+                    {messages.filter(msg => msg.content).map((msg, i) => (
                         <div
                             key={i}
                             className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}
@@ -103,7 +151,7 @@ export default function PlanEditChat({ dayLabel, dayPlan, onClose, onPlanUpdated
                             </div>
                         </div>
                     ))}
-                    {loading && (
+                    {loading && !streaming && (
                         <div className="flex justify-start">
                             <div className="bg-gray-100 dark:bg-gray-700 text-gray-500 dark:text-gray-400 rounded-xl px-4 py-2.5 text-sm rounded-bl-sm">
                                 <span className="animate-pulse">Thinking...</span>